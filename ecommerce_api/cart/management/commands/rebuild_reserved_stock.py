@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from cart.reservations import rebuild_reserved_stock
+
+
+class Command(BaseCommand):
+    """Recompute the stock held by carts on every product"""
+    help = (
+        'Recompute Product.reserved_stock from the cart items still holding stock, '
+        'e.g. after cart items were edited outside the API'
+    )
+
+    def handle(self, *args, **options):
+        updated = rebuild_reserved_stock()
+        self.stdout.write(self.style.SUCCESS(f'Corrected reserved stock on {updated} products'))
@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Q
 from django.core.validators import MinValueValidator
 from products.models import Product
 from users.models import User
@@ -35,11 +36,14 @@ class Cart(models.Model):
     @property
     def total(self):
         """Calculate cart total (can add taxes, shipping later)"""
-        return self.total
+        return self.subtotal
     
     def clear(self):
         """Remove all items from cart"""
-        self.items.all().delete()
+        with transaction.atomic():
+            # Lock the items first so the sweeper cannot release their holds twice
+            list(self.items.select_for_update().values_list('pk', flat=True))
+            self.items.all().delete()
         
         
 class CartItem(models.Model):
@@ -58,6 +62,8 @@ class CartItem(models.Model):
         default=1,
         validators=[MinValueValidator(1)]
     )
+    # The quantity is held against the product's stock until then; None once released
+    reserved_until = models.DateTimeField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -65,6 +71,14 @@ class CartItem(models.Model):
         db_table = 'cart_items'
         ordering = ['-created_at']
         unique_together = ('cart', 'product')
+        indexes = [
+            # Expired holds for the sweeper
+            models.Index(
+                fields=['reserved_until'],
+                name='cart_items_reserved_until_idx',
+                condition=Q(reserved_until__isnull=False)
+            ),
+        ]
         
     def __str__(self):
         return f"{self.quantity}x {self.product.name}"
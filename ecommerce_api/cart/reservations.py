@@ -0,0 +1,187 @@
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+from products.inventory import (
+    InsufficientStock,
+    current_available,
+    decrement_stock,
+    invalidate_stock_caches,
+    quantities_by_product
+)
+from products.models import Product
+from .models import CartItem
+
+# Expired holds released per sweeper transaction
+RELEASE_BATCH_SIZE = 1000
+
+
+def reservation_ttl():
+    return timedelta(seconds=getattr(settings, 'CART_RESERVATION_TTL', 900))
+
+
+def take_stock(product_id, quantity):
+    """Add quantity to the product's held stock if that much is still available"""
+    taken = Product.objects.filter(
+        pk=product_id,
+        stock__gte=F('reserved_stock') + quantity
+    ).update(reserved_stock=F('reserved_stock') + quantity) == 1
+    if taken:
+        # Cached listings and the featured feed render available_stock
+        invalidate_stock_caches([product_id], membership=False)
+    return taken
+
+
+def return_stock(quantities):
+    """Give back held stock, as {product_id: quantity}, in product order"""
+    for product_id in sorted(quantities):
+        Product.objects.filter(pk=product_id).update(
+            reserved_stock=F('reserved_stock') - quantities[product_id]
+        )
+    invalidate_stock_caches(quantities, membership=False)
+
+
+def held_quantity(item):
+    """Units item currently holds (its whole quantity, or none once released)"""
+    return item.quantity if item.pk and item.reserved_until is not None else 0
+
+
+def refresh_holds(items):
+    """Re-read the holds of locked items after release_expired(), which may have released them"""
+    reserved_until = dict(
+        CartItem.objects.filter(pk__in=[item.pk for item in items if item.pk]).values_list('pk', 'reserved_until')
+    )
+    for item in items:
+        if item.pk:
+            item.reserved_until = reserved_until.get(item.pk)
+
+
+def hold(item, quantity):
+    """
+    Set a cart item to quantity units, held for the reservation TTL.
+
+    Only the difference with what the item already holds is taken from or
+    returned to the product, with a conditional UPDATE, so concurrent carts
+    can never hold more than stock. Returns False, leaving the item
+    unchanged, when not enough is available. Call inside a transaction,
+    with the item locked (select_for_update) if it already exists.
+
+    High-contention products are not held: holding would write their
+    product row on every cart change, which sharding exists to avoid.
+    Their quantity is only checked against what is available now, and
+    checkout takes whatever is left.
+    """
+    if item.product.stock_shards:
+        if quantity > current_available(item.product_id) + held_quantity(item):
+            return False
+        release(item)
+        item.quantity = quantity
+        item.save()
+        return True
+
+    delta = quantity - held_quantity(item)
+    if delta > 0 and not take_stock(item.product_id, delta):
+        # Holds that expired since the last sweep may be blocking this one
+        if not release_expired(product_id=item.product_id):
+            return False
+        # The sweep may have released this item's own expired hold too
+        refresh_holds([item])
+        delta = quantity - held_quantity(item)
+        if not take_stock(item.product_id, delta):
+            return False
+    elif delta < 0:
+        return_stock({item.product_id: -delta})
+
+    item.quantity = quantity
+    item.reserved_until = timezone.now() + reservation_ttl()
+    item.save()
+    return True
+
+
+def available_for(item, product):
+    """Units this cart item could hold: what is free plus what it already holds"""
+    product.refresh_from_db(fields=['stock', 'reserved_stock', 'stock_shards'])
+    if product.stock_shards:
+        return max(current_available(product.pk), 0) + held_quantity(item)
+    return product.available_stock + held_quantity(item)
+
+
+def release(item):
+    """Return an item's hold to the product, e.g. before deleting it"""
+    held = held_quantity(item)
+    if held:
+        return_stock({item.product_id: held})
+        item.reserved_until = None
+
+
+def consume(items, reference=''):
+    """
+    Take locked cart items out of stock at checkout, turning their holds
+    into the decrement. reference (the order number) goes on the ledger
+    rows. Raises InsufficientStock if a product falls short.
+    """
+    quantities = quantities_by_product((item.product_id, item.quantity) for item in items)
+    held = quantities_by_product((item.product_id, held_quantity(item)) for item in items)
+    try:
+        decrement_stock(quantities, held, reference=reference)
+    except InsufficientStock as exc:
+        # Holds that expired since the last sweep may be blocking the order
+        if not release_expired(product_id=exc.product_id):
+            raise
+        # The sweep may have released this cart's own expired holds too
+        refresh_holds(items)
+        held = quantities_by_product((item.product_id, held_quantity(item)) for item in items)
+        decrement_stock(quantities, held, reference=reference)
+
+    # The holds are spent; deleting the items must not give them back
+    CartItem.objects.filter(pk__in=[item.pk for item in items]).update(reserved_until=None)
+    for item in items:
+        item.reserved_until = None
+
+
+def release_expired(batch_size=RELEASE_BATCH_SIZE, product_id=None):
+    """
+    Release expired holds in batches of batch_size, each in its own
+    transaction. Rows locked by a cart request are skipped; that request
+    renews or releases them. Returns the number of holds released.
+    """
+    released = 0
+    while True:
+        with transaction.atomic():
+            expired = CartItem.objects.filter(reserved_until__lte=timezone.now())
+            if product_id is not None:
+                expired = expired.filter(product_id=product_id)
+            rows = list(
+                expired.select_for_update(skip_locked=True)
+                .order_by('reserved_until')
+                .values_list('id', 'product_id', 'quantity')[:batch_size]
+            )
+            if not rows:
+                return released
+
+            quantities = defaultdict(int)
+            for _, row_product_id, quantity in rows:
+                quantities[row_product_id] += quantity
+            CartItem.objects.filter(id__in=[row[0] for row in rows]).update(reserved_until=None)
+            return_stock(quantities)
+        released += len(rows)
+        if len(rows) < batch_size:
+            return released
+
+
+def rebuild_reserved_stock(queryset=None):
+    """Recompute Product.reserved_stock from the holds on cart items"""
+    queryset = Product.objects.all() if queryset is None else queryset
+    held = dict(
+        CartItem.objects.filter(reserved_until__isnull=False, product__in=queryset)
+        .values('product').annotate(total=Sum('quantity')).values_list('product', 'total')
+    )
+    updated = []
+    for product_id, reserved_stock in queryset.values_list('pk', 'reserved_stock'):
+        if reserved_stock != held.get(product_id, 0):
+            Product.objects.filter(pk=product_id).update(reserved_stock=held.get(product_id, 0))
+            updated.append(product_id)
+    invalidate_stock_caches(updated, membership=False)
+    return len(updated)
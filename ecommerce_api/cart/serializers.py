@@ -1,9 +1,14 @@
+from django.db.models import Prefetch
 from rest_framework import serializers
 from .models import Cart, CartItem
+from products.fieldsets import SparseFieldsetMixin
 from products.serializers import ProductListSerializer
 
+# Cart items with their products, shared by every cart field that reads them
+CART_ITEMS_PREFETCH = Prefetch('items', queryset=CartItem.objects.select_related('product__category'))
 
-class CartItemSerializer(serializers.ModelSerializer):
+
+class CartItemSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for cart item"""
     product = ProductListSerializer(read_only=True)
     product_id = serializers.IntegerField(write_only=True)
@@ -42,7 +47,8 @@ class CartItemSerializer(serializers.ModelSerializer):
         """Validate stock availability"""
         from products.models import Product
         
-        product_id = attrs.get('product_id')
+        # Partial updates of an item only send the quantity
+        product_id = attrs.get('product_id', self.instance.product_id if self.instance else None)
         quantity = attrs.get('quantity', 1)
         
         try:
@@ -86,7 +92,8 @@ class CartItemCreateUpdateSerializer(serializers.ModelSerializer):
         """Validate stock availability"""
         from products.models import Product
         
-        product_id = attrs.get('product_id')
+        # Partial updates of an item only send the quantity
+        product_id = attrs.get('product_id', self.instance.product_id if self.instance else None)
         quantity = attrs.get('quantity', 1)
         
         product = Product.objects.get(id=product_id)
@@ -106,7 +113,7 @@ class CartItemCreateUpdateSerializer(serializers.ModelSerializer):
         return attrs
 
 
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for shopping cart"""
     items = CartItemSerializer(many=True, read_only=True)
     total_items = serializers.IntegerField(read_only=True)
@@ -126,4 +133,10 @@ class CartSerializer(serializers.ModelSerializer):
         fields = (
             'id', 'user', 'items', 'total_items', 'subtotal', 'total', 'created_at', 'updated_at'
         )
-        read_only_fields = ('id', 'user', 'created_at', 'updated_at')
\ No newline at end of file
+        read_only_fields = ('id', 'user', 'created_at', 'updated_at')
+        fieldset_requires = {
+            'items': (CART_ITEMS_PREFETCH,),
+            'total_items': (CART_ITEMS_PREFETCH,),
+            'subtotal': (CART_ITEMS_PREFETCH,),
+            'total': (CART_ITEMS_PREFETCH,),
+        }
\ No newline at end of file
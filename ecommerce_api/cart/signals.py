@@ -0,0 +1,10 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from .models import CartItem
+from .reservations import release
+
+
+@receiver(post_delete, sender=CartItem)
+def release_hold_on_cart_item_delete(sender, instance, **kwargs):
+    """Deleted items (one by one, cleared carts, deleted users or products) give back their hold"""
+    release(instance)
@@ -0,0 +1,14 @@
+import logging
+from celery import shared_task
+from .reservations import release_expired
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def release_expired_reservations():
+    """Give expired cart holds back to product stock (run every minute by celery beat)"""
+    released = release_expired()
+    if released:
+        logger.info('Released %s expired cart reservations', released)
+    return released
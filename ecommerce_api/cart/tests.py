@@ -1,3 +1,228 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from products.inventory import InsufficientStock
+from products.models import Category, Product
+from users.models import User
+from .models import Cart, CartItem
+from .reservations import consume, rebuild_reserved_stock, release_expired
 
-# Create your tests here.
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class CartHoldCacheTests(TestCase):
+    """Cached catalog pages follow the available stock that cart holds change"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Games', slug='games')
+        cls.product = Product.objects.create(
+            name='Board game', slug='board-game', description='Game', category=category,
+            price=Decimal('40'), stock=5, is_featured=True
+        )
+        cls.user = User.objects.create_user(email='shopper@example.com', first_name='A', last_name='B')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def listed_available_stock(self):
+        return self.client.get('/api/products/').json()['results'][0]['available_stock']
+
+    def test_hold_and_release_invalidate_cached_listing(self):
+        self.assertEqual(self.listed_available_stock(), 5)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('cart:cart_add'), {'product_id': self.product.pk, 'quantity': 2})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.listed_available_stock(), 3)
+
+        item_id = response.json()['items'][0]['id']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(reverse('cart:Cart_item_delete', args=[item_id]))
+        self.assertEqual(self.listed_available_stock(), 5)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ConcurrentCartAddTests(TransactionTestCase):
+    """First adds of a product racing on one cart"""
+    adds = 8
+
+    def setUp(self):
+        category = Category.objects.create(name='Books', slug='books')
+        self.product = Product.objects.create(
+            name='Novel', slug='novel', description='Novel', category=category,
+            price=Decimal('12'), stock=20
+        )
+        self.user = User.objects.create_user(email='reader@example.com', first_name='A', last_name='B')
+        Cart.objects.create(user=self.user)
+
+    def test_concurrent_first_adds_share_one_item(self):
+        barrier = threading.Barrier(self.adds)
+        statuses = []
+
+        def add():
+            client = APIClient()
+            client.force_authenticate(self.user)
+            barrier.wait()
+            try:
+                response = client.post(reverse('cart:cart_add'), {'product_id': self.product.pk, 'quantity': 1})
+                statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=add) for _ in range(self.adds)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(statuses), [200] * (self.adds - 1) + [201])
+        item = CartItem.objects.get(cart__user=self.user, product=self.product)
+        self.assertEqual(item.quantity, self.adds)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved_stock, self.adds)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class CartHoldTests(TestCase):
+    """Holds, their refusal when stock runs out and their expiry"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Tools', slug='tools')
+        cls.products = [
+            Product.objects.create(
+                name=f'Tool {index}', slug=f'tool-{index}', description='Tool', category=category,
+                price=Decimal('9'), stock=3
+            )
+            for index in range(10)
+        ]
+        cls.users = [
+            User.objects.create_user(email=f'builder{index}@example.com', first_name='A', last_name='B')
+            for index in range(2)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def add(self, user, product, quantity):
+        return self.client_for(user).post(reverse('cart:cart_add'), {'product_id': product.pk, 'quantity': quantity})
+
+    def test_held_stock_is_refused_until_the_hold_expires(self):
+        product = self.products[0]
+        self.assertEqual(self.add(self.users[0], product, 3).status_code, 201)
+
+        refused = self.add(self.users[1], product, 1)
+        self.assertEqual(refused.status_code, 400)
+        self.assertEqual(refused.json(), {'error': 'Only 0 units available'})
+        # The refused add leaves no empty item behind
+        self.assertFalse(CartItem.objects.filter(cart__user=self.users[1]).exists())
+
+        expired = timezone.now() - timedelta(seconds=1)
+        CartItem.objects.filter(cart__user=self.users[0]).update(reserved_until=expired)
+        self.assertEqual(release_expired(), 1)
+        product.refresh_from_db()
+        self.assertEqual(product.reserved_stock, 0)
+        self.assertEqual(self.add(self.users[1], product, 1).status_code, 201)
+
+    def expire_holds(self, user):
+        expired = timezone.now() - timedelta(seconds=1)
+        CartItem.objects.filter(cart__user=user).update(reserved_until=expired)
+
+    def test_expired_own_hold_released_while_adding_is_not_counted(self):
+        product = self.products[0]
+        Product.objects.filter(pk=product.pk).update(stock=4)
+        self.assertEqual(self.add(self.users[0], product, 2).status_code, 201)
+        self.expire_holds(self.users[0])
+        self.assertEqual(self.add(self.users[1], product, 2).status_code, 201)
+
+        # Only 2 are free once the sweep returns this cart's own expired 2
+        self.assertEqual(self.add(self.users[0], product, 1).status_code, 400)
+        item = CartItem.objects.get(cart__user=self.users[0])
+        response = self.client_for(self.users[0]).patch(
+            reverse('cart:cart_item_update', args=[item.pk]), {'quantity': 2}
+        )
+        self.assertEqual(response.status_code, 200)
+        product.refresh_from_db()
+        self.assertEqual(product.reserved_stock, 4)
+        self.assertEqual(rebuild_reserved_stock(), 0)
+
+    def test_expired_own_hold_released_at_checkout_is_not_counted(self):
+        product = self.products[0]
+        self.assertEqual(self.add(self.users[0], product, 2).status_code, 201)
+        self.expire_holds(self.users[0])
+        # Stock cut below what is held, e.g. from the admin
+        Product.objects.filter(pk=product.pk).update(stock=1)
+
+        items = list(CartItem.objects.filter(cart__user=self.users[0]).select_related('product'))
+        with self.assertRaises(InsufficientStock):
+            consume(items)
+        product.refresh_from_db()
+        self.assertEqual((product.stock, product.reserved_stock), (1, 0))
+
+    def test_bulk_update_holds_in_product_order(self):
+        self.assertEqual(self.add(self.users[1], self.products[0], 2).status_code, 201)
+        # Ids 9 and 10 sort the other way round as strings
+        items = [{'product_id': product.pk, 'quantity': 2} for product in reversed(self.products)]
+        response = self.client_for(self.users[0]).put(
+            reverse('cart:cart_bulk_update'), {'items': items}, format='json'
+        )
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.json()['errors'], [
+            {'product_id': self.products[0].pk, 'error': 'Only 1 units available'}
+        ])
+        self.assertEqual(
+            sorted(Product.objects.values_list('reserved_stock', flat=True)),
+            [2] * len(self.products)
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class CartSparseFieldsetTests(TestCase):
+    """Sparse cart reads render and load only what was asked for"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Pens', slug='pens')
+        product = Product.objects.create(
+            name='Fountain pen', slug='fountain-pen', description='Pen', category=category,
+            price=Decimal('30'), stock=5
+        )
+        cls.user = User.objects.create_user(email='writer@example.com', first_name='A', last_name='B')
+        cart = Cart.objects.create(user=cls.user)
+        CartItem.objects.create(cart=cart, product=product, quantity=2)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get_cart(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('cart:cart'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), len(queries)
+
+    def test_nested_fields(self):
+        payload, _ = self.get_cart(fields='total_items,items.quantity,items.product.name')
+        self.assertEqual(payload, {'total_items': 2, 'items': [{'quantity': 2, 'product': {'name': 'Fountain pen'}}]})
+
+    def test_unrequested_items_are_not_loaded(self):
+        payload, queries = self.get_cart(fields='id')
+        self.assertEqual(list(payload), ['id'])
+        _, full_queries = self.get_cart()
+        self.assertLess(queries, full_queries)
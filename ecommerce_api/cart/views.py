@@ -6,13 +6,25 @@ from rest_framework.generics import get_object_or_404
 from django.db import transaction
 from .models import Cart, CartItem
 from products.models import Product
+from products.fieldsets import fieldset_queryset
+from .reservations import available_for, hold
 from .serializers import (
+    CART_ITEMS_PREFETCH,
     CartSerializer,
     CartItemSerializer,
     CartItemCreateUpdateSerializer
 )
 
 
+def locked_cart_item(cart, product):
+    """
+    The cart's item for product, locked until the request commits. A missing
+    item is inserted with quantity 0, so concurrent first adds of a product
+    wait on each other's row instead of both inserting it.
+    """
+    return CartItem.objects.select_for_update().get_or_create(cart=cart, product=product, defaults={'quantity': 0})
+
+
 # Create your views here.
 class CartView(APIView):
     """View for getting user's cart"""
@@ -21,7 +33,10 @@ class CartView(APIView):
     def get(self, request):
         """Get user's cart"""
         cart, created = Cart.objects.get_or_create(user=request.user)
-        serializer = CartSerializer(cart)
+        serializer = CartSerializer(context={'request': request})
+        # Only load the items and products the requested fields read
+        queryset = Cart.objects.filter(pk=cart.pk).prefetch_related(CART_ITEMS_PREFETCH)
+        serializer.instance = fieldset_queryset(queryset, serializer).get()
         return Response(serializer.data, status=status.HTTP_200_OK)
     
     
@@ -45,24 +60,15 @@ class CartItemAddView(APIView):
             product = get_object_or_404(Product, id=product_id, is_active=True)
             
             # Check if item already in cart
-            cart_item, item_created = CartItem.objects.get_or_create(
-                cart=cart,
-                product=product,
-                defaults={'quantity': quantity}
-            )
+            cart_item, item_created = locked_cart_item(cart, product)
+            new_quantity = cart_item.quantity + quantity
             
-            if not item_created:
-                # Update quantity if item already exists
-                new_quantity = cart_item.quantity + quantity
-                
-                # Validate stock
-                if product.stock < new_quantity:
-                    return Response(
-                        {'error': f'Only {product.stock} units available'},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                cart_item.quantity = new_quantity
-                cart_item.save()
+            # Hold the stock for this cart; fails if other carts hold the rest
+            if not hold(cart_item, new_quantity):
+                error = f'Only {available_for(cart_item, product)} units available'
+                if item_created:
+                    cart_item.delete()
+                return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
                 
             # Return updated cart
             cart_serializer = CartSerializer(cart)
@@ -81,7 +87,7 @@ class CartItemUpdateView(APIView):
     def patch(self, request, item_id):
         """Update cart item quantity"""
         cart = get_object_or_404(Cart, user=request.user)
-        cart_item = get_object_or_404(CartItem, id=item_id, cart=cart)
+        cart_item = get_object_or_404(CartItem.objects.select_for_update(), id=item_id, cart=cart)
         
         serializer = CartItemCreateUpdateSerializer(
             cart_item,
@@ -92,14 +98,12 @@ class CartItemUpdateView(APIView):
         if serializer.is_valid():
             quantity = serializer.validated_data.get('quantity', cart_item.quantity)
             
-            # Validate stock
-            if cart_item.product.stock < quantity:
+            # Hold the new quantity (and renew the hold)
+            if not hold(cart_item, quantity):
                 return Response(
-                    {'error': f'Only {cart_item.product.stock} units availale'},
+                    {'error': f'Only {available_for(cart_item, cart_item.product)} units availale'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            cart_item.quantity = quantity
-            cart_item.save()
             
             # Return updated cart
             cart_serializer = CartSerializer(cart)
@@ -115,7 +119,8 @@ class CartItemDeleteView(APIView):
     def delete(self, request, item_id):
         """Delete cart item"""
         cart = get_object_or_404(Cart, user=request.user)
-        cart_item = get_object_or_404(CartItem, id=item_id, cart=cart)
+        # Locked so the sweeper cannot release its hold while it is deleted
+        cart_item = get_object_or_404(CartItem.objects.select_for_update(), id=item_id, cart=cart)
         
         cart_item.delete()
         
@@ -160,40 +165,40 @@ class CartItemBulkUpdateView(APIView):
             
         errors = []
         updated_items = []
+        valid_items = []
         
         for item_data in items_data:
             serializer = CartItemCreateUpdateSerializer(data=item_data)
             
             if serializer.is_valid():
-                product_id = serializer.validated_data['product_id']
-                quantity = serializer.validated_data['quantity']
+                valid_items.append((serializer.validated_data['product_id'], serializer.validated_data['quantity']))
+            else:
+                errors.append({
+                    'data': item_data,
+                    'errors': serializer.errors
+                })
+                
+        # Hold stock in product order so concurrent bulk updates lock rows in the same order
+        for product_id, quantity in sorted(valid_items, key=lambda item: int(item[0])):
+            try:
+                product = Product.objects.get(id=product_id, is_active=True)
                 
-                try:
-                    product = Product.objects.get(id=product_id, is_active=True)
-                    
-                    if product.stock < quantity:
-                        errors.append({
-                            'product_id': product_id,
-                            'error': f'Only {product.stock} units available'
-                        })
-                        continue
-                    
-                    cart_item, item_created = CartItem.objects.update_or_create(
-                        cart=cart,
-                        product=product,
-                        defaults={'quantity': quantity}
-                    )
-                    updated_items.append(cart_item.id)
-                    
-                except Product.DoesNotExist:
+                cart_item, item_created = locked_cart_item(cart, product)
+                if not hold(cart_item, quantity):
                     errors.append({
                         'product_id': product_id,
-                        'error': 'Product not found'
+                        'error': f'Only {available_for(cart_item, product)} units available'
                     })
-            else:
+                    if item_created:
+                        cart_item.delete()
+                    continue
+                
+                updated_items.append(cart_item.id)
+                
+            except Product.DoesNotExist:
                 errors.append({
-                    'data': item_data,
-                    'errors': serializer.errors
+                    'product_id': product_id,
+                    'error': 'Product not found'
                 })
                 
         # Return updated cart with any errors
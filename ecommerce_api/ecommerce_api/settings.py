@@ -14,6 +14,7 @@ import os
 from pathlib import Path
 from datetime import timedelta
 from decouple import config
+from celery.schedules import crontab
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -44,6 +45,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework_simplejwt',
     'corsheaders',
@@ -202,14 +204,38 @@ CACHES = {
     }
 }
 
+# Product autocomplete: per-process prefix index kept in sync over pub/sub
+AUTOCOMPLETE_REDIS_URL = f'redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}'
+AUTOCOMPLETE_MAX_ENTRIES = config('AUTOCOMPLETE_MAX_ENTRIES', default=200000, cast=int)
+
 
 # Celery Configuration
-CELERY_BROKER_URL = f'redis://{REDIS_HOST}:{REDIS_PORT}/0',
-CELERY_RESULT_BACKEND = f'redis://{REDIS_HOST}:{REDIS_PORT}/0',
-CELERY_ACCEPT_CONTENT = ['json'],
-CELERY_TASK_SERIALIZER = 'json',
-CELERY_RESULT_SERIALIZER = 'json',
+CELERY_BROKER_URL = f'redis://{REDIS_HOST}:{REDIS_PORT}/0'
+CELERY_RESULT_BACKEND = f'redis://{REDIS_HOST}:{REDIS_PORT}/0'
+CELERY_ACCEPT_CONTENT = ['json']
+CELERY_TASK_SERIALIZER = 'json'
+CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_BEAT_SCHEDULE = {
+    'compute-related-products': {
+        'task': 'products.tasks.compute_related_products',
+        'schedule': crontab(hour=3, minute=0),
+    },
+    'release-expired-cart-reservations': {
+        'task': 'cart.tasks.release_expired_reservations',
+        'schedule': 60.0,
+    },
+    'settle-inventory-movements': {
+        'task': 'products.tasks.settle_inventory_movements',
+        'schedule': 60.0,
+    },
+}
+
+# Seconds a cart holds the stock of its items after they were last changed
+CART_RESERVATION_TTL = config('CART_RESERVATION_TTL', default=900, cast=int)
+
+# Counter rows a high-contention product's stock is split across (see products.sharding)
+STOCK_SHARD_COUNT = config('STOCK_SHARD_COUNT', default=8, cast=int)
 
 
 # Email Configuration
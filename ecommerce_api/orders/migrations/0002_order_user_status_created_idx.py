@@ -0,0 +1,20 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:46
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Build the indexes without blocking writes to large tables
+    atomic = False
+
+    dependencies = [
+        ('orders', '0001_initial'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='order',
+            index=models.Index(fields=['user', 'status', '-created_at'], name='orders_user_status_created_idx'),
+        ),
+    ]
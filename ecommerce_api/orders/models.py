@@ -109,6 +109,7 @@ class Order(models.Model):
             models.Index(fields=['order_number']),
             models.Index(fields=['user', '-created_at']),
             models.Index(fields=['status']),
+            models.Index(fields=['user', 'status', '-created_at'], name='orders_user_status_created_idx'),
         ]
         
     def __str__(self):
@@ -1,10 +1,14 @@
+from django.db.models import IntegerField, OuterRef, Prefetch, Subquery, Sum
+from django.db.models.functions import Coalesce
 from rest_framework import serializers
 from .models import Order, OrderItem, Payment, OrderStatusHistory
+from products.fieldsets import SparseFieldsetMixin
 from users.address_serializers import AddressSerializer
 
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for order item"""
+    product = serializers.PrimaryKeyRelatedField(source='Product', read_only=True)
     
     class Meta:
         model = OrderItem
@@ -14,7 +18,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'total_price', 'created_at')
         
         
-class PaymentSerializer(serializers.ModelSerializer):
+class PaymentSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for payment"""
     
     class Meta:
@@ -28,7 +32,7 @@ class PaymentSerializer(serializers.ModelSerializer):
         )
         
     
-class OrderStatusHistorySerializer(serializers.ModelSerializer):
+class OrderStatusHistorySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for order status history"""
     created_by_email = serializers.EmailField(source='created_by.email', read_only=True)
     
@@ -48,9 +52,20 @@ class OrderListSerializer(serializers.ModelSerializer):
             'id', 'order_number', 'status', 'payment_status', 'total', 'total_items', 'created_at', 'updated_at'
         )
         read_only_fields = ('id', 'order_number', 'created_at', 'updated_at')
+        # Order.total_items sums the items in Python; list rows get it in SQL
+        row_annotations = {
+            'total_items': Coalesce(
+                Subquery(
+                    OrderItem.objects.filter(order=OuterRef('pk')).order_by().values('order')
+                    .annotate(total=Sum('quantity')).values('total')
+                ),
+                0,
+                output_field=IntegerField()
+            ),
+        }
         
 
-class OrderDetailSerializer(serializers.ModelSerializer):
+class OrderDetailSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for order detail view"""
     items = OrderItemSerializer(many=True, read_only=True)
     payment = PaymentSerializer(read_only=True)
@@ -69,6 +84,14 @@ class OrderDetailSerializer(serializers.ModelSerializer):
         read_only_fields = (
             'id', 'order_number', 'user', 'created_at', 'updated_at', 'paid_at', 'shipped_at', 'delivered_at'
         )
+        fieldset_requires = {
+            'items': (Prefetch('items'),),
+            'total_items': (Prefetch('items'),),
+            'payment': (Prefetch('payment'),),
+            'status_history': (
+                Prefetch('status_history', queryset=OrderStatusHistory.objects.select_related('created_by')),
+            ),
+        }
         
 
 class OrderCreateSerializer(serializers.Serializer):
@@ -1,3 +1,167 @@
-from django.test import TestCase
+import threading
+from decimal import Decimal
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from cart.models import Cart, CartItem
+from products.inventory import add_stock, current_available, settle_movements
+from products.models import Category, InventoryMovement, Product
+from products.rows import row_serializer
+from users.models import Address, User
+from .models import Order, OrderItem
+from .serializers import OrderListSerializer
 
-# Create your tests here.
+
+class OrderRowSerializerParityTests(TestCase):
+    """values() row serialization renders the same bytes as OrderListSerializer"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(email='buyer@example.com', password='secret', first_name='A', last_name='B')
+        address = dict(
+            shipping_full_name='A B', shipping_phone='123', shipping_address_line1='1 Street',
+            shipping_city='City', shipping_state='State', shipping_postal_code='000', shipping_country='NG'
+        )
+        order = Order.objects.create(user=user, total=Decimal('120.5'), **address)
+        OrderItem.objects.create(order=order, product_name='Phone', price=Decimal('50'), quantity=2)
+        OrderItem.objects.create(order=order, product_name='Case', price=Decimal('10.25'), quantity=3)
+        Order.objects.create(user=user, total=Decimal('0'), status='cancelled', payment_status='refunded', **address)
+
+    def test_matches_serializer(self):
+        request = Request(APIRequestFactory().get('/api/orders/'))
+        queryset = Order.objects.all()
+        serializer = OrderListSerializer(queryset, many=True, context={'request': request})
+        rows = row_serializer(serializer)
+        renderer = JSONRenderer()
+
+        self.assertEqual(
+            renderer.render(rows.serialize(rows.values(queryset), request)),
+            renderer.render(serializer.data)
+        )
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ConcurrentCheckoutTests(TransactionTestCase):
+    """Parallel checkouts of the last units of one product"""
+    checkouts = 50
+    stock = 10
+
+    def setUp(self):
+        category = Category.objects.create(name='Flash sale', slug='flash-sale')
+        self.product = Product.objects.create(
+            name='Console', slug='console', description='Console', category=category,
+            price=Decimal('299.99'), stock=self.stock
+        )
+        self.buyers = []
+        for index in range(self.checkouts):
+            user = User.objects.create_user(
+                email=f'buyer{index}@example.com', first_name='Buyer', last_name=str(index)
+            )
+            address = Address.objects.create(
+                user=user, full_name='Buyer', phone='123', address_line1='1 Street',
+                city='City', state='State', postal_code='000', country='NG'
+            )
+            cart = Cart.objects.create(user=user)
+            # Added without a hold, so only the checkout decrement guards the stock
+            CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+            self.buyers.append((user, address))
+
+    def test_parallel_checkouts_never_oversell(self):
+        barrier = threading.Barrier(self.checkouts)
+        statuses = []
+        statuses_lock = threading.Lock()
+
+        def checkout(user, address):
+            client = APIClient()
+            client.force_authenticate(user)
+            try:
+                barrier.wait()
+                response = client.post(
+                    reverse('orders:order_list'),
+                    {'shipping_address_id': address.id, 'payment_method': 'cash'},
+                    format='json'
+                )
+                with statuses_lock:
+                    statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout, args=buyer) for buyer in self.buyers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.product.refresh_from_db()
+        self.assertEqual(statuses.count(201), self.stock)
+        self.assertEqual(statuses.count(400), self.checkouts - self.stock)
+        self.assertEqual(self.product.stock, 0)
+        self.assertEqual(
+            OrderItem.objects.filter(Product=self.product).aggregate(total=Sum('quantity'))['total'],
+            self.stock
+        )
+
+    def test_cancel_restores_stock(self):
+        user, address = self.buyers[0]
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.post(
+            reverse('orders:order_list'), {'shipping_address_id': address.id, 'payment_method': 'cash'}, format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, self.stock - 1)
+
+        order_number = response.json()['order_number']
+        cancel_url = reverse('orders:order_cancel', args=[order_number])
+        self.assertEqual(client.post(cancel_url, {'reason': 'Changed my mind'}, format='json').status_code, 200)
+        self.assertEqual(client.post(cancel_url, {'reason': 'Again'}, format='json').status_code, 400)
+
+        # The units come back through the ledger: sellable at once, folded into stock later
+        movements = InventoryMovement.objects.filter(product=self.product, reference=order_number)
+        self.assertEqual(
+            sorted(movements.values_list('reason', 'delta', 'settled')),
+            [(InventoryMovement.CANCEL, 1, False), (InventoryMovement.ORDER, -1, True)]
+        )
+        self.assertEqual(current_available(self.product.pk), self.stock)
+        self.assertEqual(settle_movements(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, self.stock)
+        self.assertEqual(current_available(self.product.pk), self.stock)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CheckoutShortfallTests(TestCase):
+    """A refused checkout reports what can actually be sold"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Garden', slug='garden')
+        cls.product = Product.objects.create(
+            name='Hose', slug='hose', description='Hose', category=category, price=Decimal('25'), stock=5
+        )
+        cls.user = User.objects.create_user(email='gardener@example.com', first_name='A', last_name='B')
+        cls.address = Address.objects.create(
+            user=cls.user, full_name='A B', phone='123', address_line1='1 Street',
+            city='City', state='State', postal_code='000', country='NG'
+        )
+        cart = Cart.objects.create(user=cls.user)
+        CartItem.objects.create(cart=cart, product=cls.product, quantity=4)
+        # Held by other carts
+        Product.objects.filter(pk=cls.product.pk).update(reserved_stock=3)
+
+    def test_message_counts_pending_restocks(self):
+        add_stock({self.product.pk: 1}, InventoryMovement.RESTOCK, 'delivery')
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post(
+            reverse('orders:order_list'), {'shipping_address_id': self.address.id, 'payment_method': 'cash'},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Insufficient stock for Hose. Only 3 available.'})
+        self.assertFalse(Order.objects.exists())
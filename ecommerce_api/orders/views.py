@@ -1,3 +1,4 @@
+from decimal import Decimal
 from django.shortcuts import render
 from rest_framework import status, permissions, generics
 from rest_framework.views import APIView
@@ -7,9 +8,13 @@ from django.db import transaction
 from django.utils import timezone
 from .models import Order, OrderItem, Payment, OrderStatusHistory
 from cart.models import Cart
+from cart.reservations import consume
 from users.models import Address
+from products.inventory import InsufficientStock, current_available, quantities_by_product, restore_stock
 from products.models import Product
 from users.permissions import IsAdmin
+from products.fieldsets import SparseQuerysetMixin
+from products.rows import RowListMixin
 from .serializers import (
     OrderListSerializer,
     OrderDetailSerializer,
@@ -20,7 +25,7 @@ from .serializers import (
 
 
 # Create your views here.
-class OrderListCreateView(generics.ListCreateAPIView):
+class OrderListCreateView(RowListMixin, generics.ListCreateAPIView):
     """List user's orders or create new order fro cart"""
     permission_classes = [permissions.IsAuthenticated]
     
@@ -50,107 +55,112 @@ class OrderListCreateView(generics.ListCreateAPIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
             
-            # check id cart has items
-            if not cart.items.exists():
-                return Response(
-                    {'error': 'Cart is empty'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-                
-                # Validate stock for all items
-                for cart_item in cart.items.all():
-                    if cart_item.product.stock < cart_item.quantity:
-                        return Response(
-                            {
-                                'error': f'Insufficient stock for {cart_item.product.name}.'
-                                f'Only {cart_item.product.stock} available.'
-                            },
-                            status=status.HTTP_400_BAD_REQUEST
-                        )
-                
-                # Get shipping address
-                shipping_address = get_object_or_404(
-                    Address,
-                    id=serializer.validated_data['shipping_address_id'],
-                    user=request.user
-                )
-                
-                # Calculate totals
-                subtotal = cart.subtotal
-                tax = subtotal * 0.1  # 10% tax
-                shipping_cost = 10.00 if subtotal < 100 else 0   # free shipping for over $100
-                discount = 0
-                total = subtotal + tax + shipping_cost - discount
-                
-                # Create order
-                order = Order.objects.create(
-                    user=request.user,
-                    status='pending',
-                    subtotal=subtotal,
-                    payment_status='pending',
-                    tax=tax,
-                    shipping_cost=shipping_cost,
-                    discount=discount,
-                    total=total,
-                    shipping_address=shipping_address,
-                    shipping_full_name=shipping_address.fullname,
-                    shipping_phone=shipping_address.phone,
-                    shipping_address_line1=shipping_address.adress_line1,
-                    shipping_address_line2=shipping_address.address_line2,
-                    shipping_city=shipping_address.city,
-                    shipping_state=shipping_address.state,
-                    shipping_postal_code=shipping_address.postal_code,
-                    shipping_country=shipping_address.country,
-                    customer_note=serializer.validated_data.get('customer_note', '')
-                )
-                
-                # Create order items from cart items
-                for cart_item in cart.tems.all():
-                    OrderItem.objects.create(
-                        order=order,
-                        product=cart_item.product,
-                        product_name=cart_item.product_name,
-                        product_sku='',
-                        price=cart_item.product.price,
-                        quantity=cart_item.quantity
-                    )
-                    
-                    # Reduce product stock
-                    cart_item.product.stock -= cart_item.quantity
-                    cart_item.product.save()
-                    
-                    # Create payment record
-                    Payment.objects.create(
-                        order=order,
-                        payment_method=serializer.validated_data['payment_method'],
-                        amount=total,
-                        status='pending'
-                    )
-                    
-                    # Create initial status history
-                    OrderStatusHistory.objects.create(
-                        order=order,
-                        status='pending',
-                        note='Order created',
-                        created_by=request.user
-                    )
-                    
-                    # Clear cart
-                    cart.clear()
-                    
-                    # Return created order
-                    order_serializer = OrderDetailSerializer(order)
-                    return Response(
-                        order_serializer.data,
-                        status=status.HTTP_201_CREATED
-                    )
+        # Lock the cart items so their holds cannot expire or change mid checkout
+        cart_items = list(cart.items.select_for_update().select_related('product').order_by('product_id'))
+        
+        # check id cart has items
+        if not cart_items:
+            return Response(
+                {'error': 'Cart is empty'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+            
+        # Get shipping address
+        shipping_address = get_object_or_404(
+            Address,
+            id=serializer.validated_data['shipping_address_id'],
+            user=request.user
+        )
+        
+        # Reduce product stock; conditional updates make overselling impossible
+        order_number = Order.generate_order_number()
+        try:
+            consume(cart_items, reference=order_number)
+        except InsufficientStock as exc:
+            product = next(item.product for item in cart_items if item.product_id == exc.product_id)
+            return Response(
+                {
+                    'error': f'Insufficient stock for {product.name}. '
+                    f'Only {current_available(product.pk)} available.'
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+            
+        # Calculate totals
+        subtotal = sum(item.total_price for item in cart_items)
+        tax = (subtotal * Decimal('0.1')).quantize(Decimal('0.01'))  # 10% tax
+        shipping_cost = Decimal('10.00') if subtotal < 100 else Decimal('0')   # free shipping for over $100
+        discount = Decimal('0')
+        total = subtotal + tax + shipping_cost - discount
+        
+        # Create order
+        order = Order.objects.create(
+            order_number=order_number,
+            user=request.user,
+            status='pending',
+            subtotal=subtotal,
+            payment_status='pending',
+            tax=tax,
+            shipping_cost=shipping_cost,
+            discount=discount,
+            total=total,
+            shipping_address=shipping_address,
+            shipping_full_name=shipping_address.full_name,
+            shipping_phone=shipping_address.phone,
+            shipping_address_line1=shipping_address.address_line1,
+            shipping_address_line2=shipping_address.address_line2,
+            shipping_city=shipping_address.city,
+            shipping_state=shipping_address.state,
+            shipping_postal_code=shipping_address.postal_code,
+            shipping_country=shipping_address.country,
+            customer_note=serializer.validated_data.get('customer_note', '')
+        )
+        
+        # Create order items from cart items
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                Product=cart_item.product,
+                product_name=cart_item.product.name,
+                product_sku='',
+                price=cart_item.product.price,
+                quantity=cart_item.quantity
+            )
+            for cart_item in cart_items
+        ])
+        
+        # Create payment record
+        Payment.objects.create(
+            order=order,
+            payment_method=serializer.validated_data['payment_method'],
+            amount=total,
+            status='pending'
+        )
+        
+        # Create initial status history
+        OrderStatusHistory.objects.create(
+            order=order,
+            status='pending',
+            note='Order created',
+            created_by=request.user
+        )
+        
+        # Clear cart
+        cart.clear()
+        
+        # Return created order
+        order_serializer = OrderDetailSerializer(order)
+        return Response(
+            order_serializer.data,
+            status=status.HTTP_201_CREATED
+        )
 
 
-class OrderDetailView(generics.RetrieveAPIView):
+class OrderDetailView(SparseQuerysetMixin, generics.RetrieveAPIView):
     """Retrieve order details"""
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = OrderDetailSerializer
-    lookup_field = 'order-number'
+    lookup_field = 'order_number'
     
     def get_queryset(self):
         user = self.request.user
@@ -168,10 +178,11 @@ class OrderCancelView(APIView):
         """Cancel order"""
         # Get order
         if request.user.is_admin:
-            order = get_object_or_404(Order, oerder_number=order_number)
+            order = get_object_or_404(Order.objects.select_for_update(), order_number=order_number)
         else:
+            # Locked so two cancellations cannot both restore the stock
             order = get_object_or_404(
-                Order,
+                Order.objects.select_for_update(),
                 order_number=order_number,
                 user=request.user
             )
@@ -187,12 +198,10 @@ class OrderCancelView(APIView):
         serializer.is_valid(raise_exception=True)
         
         # Restore product stock
+        restore_stock(quantities_by_product(
+            order.items.filter(Product__isnull=False).values_list('Product_id', 'quantity')
+        ), reference=order.order_number)
         
-        for item in order.items.all():
-            if item.product:
-                item.product.stock += item.quantity
-                item.product.save()
-                
         # Update order status
         order.status = 'cancelled'
         order.save()
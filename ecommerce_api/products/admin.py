@@ -1,5 +1,17 @@
-from django.contrib import admin
-from .models import Category, Product, ProductImage, Review
+from django import forms
+from django.contrib import admin, messages
+from django.db import router, transaction
+from .inventory import (
+    add_stock,
+    current_available,
+    decrement_stock,
+    disable_stock_sharding,
+    enable_stock_sharding,
+    lock_stock,
+    rebalance_stock_shards,
+    with_available_stock
+)
+from .models import Category, InventoryMovement, Product, ProductImage, Review
 
 
 # Register your models here.
@@ -19,10 +31,38 @@ class ProductImageInline(admin.TabularInline):
     extra = 1
     
     
+class ProductAdminForm(forms.ModelForm):
+    """Product form whose stock edits become inventory movements"""
+    
+    class Meta:
+        model = Product
+        fields = '__all__'
+        help_texts = {
+            'stock': (
+                'Settled stock. A new value is applied as the difference from the value shown here; '
+                'restocks and cancellations waiting in the inventory ledger still come on top of it.'
+            ),
+        }
+        
+    def clean_stock(self):
+        stock = self.cleaned_data['stock']
+        if self.instance.pk and 'stock' in self.changed_data:
+            reduction = self.initial['stock'] - stock
+            if reduction > 0:
+                # Nothing can be sold or held until the edit is saved, in the same transaction
+                lock_stock(self.instance.pk)
+            available = current_available(self.instance.pk) or 0
+            if reduction > available:
+                raise forms.ValidationError(
+                    f'Stock can be reduced by at most {max(available, 0)}: the rest is sold or held by carts'
+                )
+        return stock
+    
+    
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
     """Admin configuration for Product model"""
-    list_display = ('name', 'category', 'price', 'stock',
+    list_display = ('name', 'category', 'price', 'stock', 'available',
                     'stock_status', 'is_active', 'is_featured', 'created_at')
     list_filter = ('category', 'is_active', 'is_featured', 'created_at')
     search_fields = ('name', 'description')
@@ -30,13 +70,16 @@ class ProductAdmin(admin.ModelAdmin):
     list_editable = ('price', 'stock', 'is_active', 'is_featured')
     inlines = [ProductImageInline]
     ordering = ('-created_at',)
+    form = ProductAdminForm
+    readonly_fields = ('stock_shards',)
+    actions = ['enable_sharding', 'disable_sharding', 'rebalance_shards']
     
     fieldsets = (
         ('Basic Information', {
             'fields': ('name', 'slug', 'category', 'description')
         }),
         ('Pricing & Stock', {
-            'fields': ('price', 'stock')
+            'fields': ('price', 'stock', 'stock_shards')
         }),
         ('Media', {
             'fields': ('image',)
@@ -46,6 +89,88 @@ class ProductAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_queryset(self, request):
+        return with_available_stock(super().get_queryset(request))
+    
+    @admin.display(description='Available', ordering='available')
+    def available(self, obj):
+        """Stock plus pending ledger movements, less cart holds"""
+        return obj.available
+    
+    def save_model(self, request, obj, form, change):
+        """
+        Stock edits are recorded as inventory movements instead of rewriting
+        the row; ProductAdminForm has checked and locked the stock they take
+        """
+        if not change or 'stock' not in form.changed_data:
+            return super().save_model(request, obj, form, change)
+        
+        delta = obj.stock - form.initial['stock']
+        obj.stock = form.initial['stock']
+        fields = [name for name in form.changed_data if name != 'stock']
+        reference = f'admin {request.user.pk}'
+        with transaction.atomic():
+            if fields:
+                obj.save(update_fields=fields + ['updated_at'])
+            if delta > 0:
+                add_stock({obj.pk: delta}, InventoryMovement.RESTOCK, reference)
+            else:
+                decrement_stock({obj.pk: -delta}, reason=InventoryMovement.ADJUSTMENT, reference=reference)
+    
+    def get_changelist_form(self, request, **kwargs):
+        return super().get_changelist_form(request, form=ProductAdminForm, **kwargs)
+    
+    def changelist_view(self, request, extra_context=None):
+        if request.method == 'POST' and '_save' in request.POST:
+            # Django validates list edits outside its transaction; keep the stock locked until they are saved
+            with transaction.atomic(using=router.db_for_write(self.model)):
+                return super().changelist_view(request, extra_context)
+        return super().changelist_view(request, extra_context)
+    
+    @admin.action(description='Enable high-contention stock (split into counter shards)')
+    def enable_sharding(self, request, queryset):
+        product_ids = list(queryset.values_list('pk', flat=True))
+        for product_id in product_ids:
+            enable_stock_sharding(product_id)
+        self.message_user(request, f'Split the stock of {len(product_ids)} products into shards', messages.SUCCESS)
+    
+    @admin.action(description='Disable high-contention stock (fold shards back into stock)')
+    def disable_sharding(self, request, queryset):
+        sharded = list(queryset.filter(stock_shards__gt=0).values_list('pk', flat=True))
+        for product_id in sharded:
+            disable_stock_sharding(product_id)
+        self.message_user(
+            request, f'Folded the stock shards of {len(sharded)} products back into stock', messages.SUCCESS
+        )
+    
+    @admin.action(description='Rebalance stock shards')
+    def rebalance_shards(self, request, queryset):
+        sharded = list(queryset.filter(stock_shards__gt=0).values_list('pk', flat=True))
+        for product_id in sharded:
+            rebalance_stock_shards(product_id)
+        self.message_user(request, f'Rebalanced the stock shards of {len(sharded)} products', messages.SUCCESS)
+    
+    
+@admin.register(InventoryMovement)
+class InventoryMovementAdmin(admin.ModelAdmin):
+    """Read-only audit trail of stock changes"""
+    list_display = ('product', 'delta', 'reason', 'reference', 'settled', 'created_at')
+    list_filter = ('reason', 'settled', 'created_at')
+    search_fields = ('product__name', 'reference')
+    ordering = ('-created_at',)
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product')
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+    
     
 @admin.register(ProductImage)
 class ProductImageAdmin(admin.ModelAdmin):
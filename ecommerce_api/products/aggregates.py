@@ -0,0 +1,105 @@
+from django.db.models import F, FloatField, IntegerField, OuterRef, Subquery, Sum, Count, Value
+from django.db.models.functions import Cast, Coalesce, NullIf, Now, Round
+from .models import RATING_HISTOGRAM_FIELDS, Category, Product, Review
+
+
+def average_rating_expression(rating_sum, review_count):
+    """Build an SQL expression for the rounded average rating"""
+    return Coalesce(
+        Round(Cast(rating_sum, FloatField()) / NullIf(review_count, 0), 1),
+        Value(0.0),
+        output_field=FloatField()
+    )
+
+
+def apply_review_delta(product_id, added_rating=None, removed_rating=None):
+    """
+    Apply a review change to a product's rating aggregates and histogram:
+    a review with added_rating was created (or moved in) and/or one with
+    removed_rating was deleted (or moved out).
+    Runs as a single UPDATE so concurrent reviews never lose increments.
+    """
+    if not product_id or added_rating == removed_rating:
+        return
+
+    rating_delta = (added_rating or 0) - (removed_rating or 0)
+    count_delta = int(added_rating is not None) - int(removed_rating is not None)
+    rating_sum = F('rating_sum') + rating_delta
+    review_count = F('review_count') + count_delta
+
+    histogram = {}
+    if added_rating is not None:
+        histogram[RATING_HISTOGRAM_FIELDS[added_rating]] = F(RATING_HISTOGRAM_FIELDS[added_rating]) + 1
+    if removed_rating is not None:
+        histogram[RATING_HISTOGRAM_FIELDS[removed_rating]] = F(RATING_HISTOGRAM_FIELDS[removed_rating]) - 1
+
+    # updated_at moves too, so incremental exports pick up rating changes
+    Product.objects.filter(pk=product_id).update(
+        rating_sum=rating_sum,
+        review_count=review_count,
+        average_rating=average_rating_expression(rating_sum, review_count),
+        updated_at=Now(),
+        **histogram
+    )
+
+
+def rebuild_rating_aggregates(queryset=None):
+    """Recompute rating aggregates and histograms from the review table in one UPDATE"""
+    if queryset is None:
+        queryset = Product.objects.all()
+
+    reviews = Review.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    rating_sum = Coalesce(
+        Subquery(reviews.annotate(total=Sum('rating')).values('total')),
+        0,
+        output_field=IntegerField()
+    )
+    review_count = Coalesce(
+        Subquery(reviews.annotate(total=Count('id')).values('total')),
+        0,
+        output_field=IntegerField()
+    )
+
+    histogram = {
+        field: Coalesce(
+            Subquery(reviews.filter(rating=rating).annotate(total=Count('id')).values('total')),
+            0,
+            output_field=IntegerField()
+        )
+        for rating, field in RATING_HISTOGRAM_FIELDS.items()
+    }
+
+    return queryset.update(
+        rating_sum=rating_sum,
+        review_count=review_count,
+        average_rating=average_rating_expression(rating_sum, review_count),
+        **histogram
+    )
+
+
+def apply_category_delta(category_id, delta):
+    """Adjust a category's active product counter in a single UPDATE"""
+    if not category_id or delta == 0:
+        return
+
+    Category.objects.filter(pk=category_id).update(
+        active_product_count=F('active_product_count') + delta
+    )
+
+
+def rebuild_category_counts(queryset=None):
+    """Recompute active product counters from the product table"""
+    if queryset is None:
+        queryset = Category.objects.all()
+
+    active_products = (
+        Product.objects.filter(category=OuterRef('pk'), is_active=True)
+        .order_by()
+        .values('category')
+        .annotate(total=Count('id'))
+        .values('total')
+    )
+
+    return queryset.update(
+        active_product_count=Coalesce(Subquery(active_products), 0, output_field=IntegerField())
+    )
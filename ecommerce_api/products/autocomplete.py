@@ -0,0 +1,264 @@
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left, insort
+import redis
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, transaction
+from .models import Category, Product
+
+logger = logging.getLogger(__name__)
+
+PRODUCT = 'p'
+CATEGORY = 'c'
+
+AUTOCOMPLETE_CHANNEL = 'products:autocomplete'
+
+# Keys are "<normalized text>\x00<id>"; \x00 sorts an exact match first
+KEY_SEPARATOR = '\x00'
+
+# Only the first few words of a name start a key ("iphone 15 case" is found
+# by "iph", "15" and "case"), and keys are truncated, to bound memory
+MAX_WORDS_PER_NAME = 4
+MAX_KEY_LENGTH = 48
+
+# Keys scanned per lookup, however many duplicates a prefix hits
+MAX_SCAN = 1000
+
+RECONNECT_DELAY = 5
+
+
+def normalize(text):
+    return ' '.join(str(text).lower().split())
+
+
+class PrefixIndex:
+    """
+    Sorted in-memory prefix index of product and category names.
+
+    Every name is stored under a few word-suffix keys in a sorted list of
+    strings per kind, so a lookup is a bisect plus a short forward scan.
+    Entries stop being added once max_entries keys are held; the index then
+    reports itself as truncated. Products are loaded most reviewed first, so
+    a full index keeps the products people are most likely to look for.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.keys = {PRODUCT: [], CATEGORY: []}
+        self.items = {}
+        self.truncated = False
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return sum(len(keys) for keys in self.keys.values())
+
+    @staticmethod
+    def index_keys(pk, name):
+        words = normalize(name).split(' ')
+        for start in range(min(len(words), MAX_WORDS_PER_NAME)):
+            text = ' '.join(words[start:])[:MAX_KEY_LENGTH]
+            if text:
+                yield f'{text}{KEY_SEPARATOR}{pk}'
+
+    def load(self, rows):
+        """Replace the contents with (kind, id, name, slug) rows"""
+        keys = {PRODUCT: [], CATEGORY: []}
+        items = {}
+        size = 0
+        truncated = False
+        for kind, pk, name, slug in rows:
+            item_keys = list(self.index_keys(pk, name))
+            if size + len(item_keys) > self.max_entries:
+                truncated = True
+                break
+            keys[kind].extend(item_keys)
+            items[(kind, pk)] = (name, slug)
+            size += len(item_keys)
+        for kind_keys in keys.values():
+            kind_keys.sort()
+
+        with self.lock:
+            self.keys = keys
+            self.items = items
+            self.truncated = truncated
+
+    def add(self, kind, pk, name, slug):
+        with self.lock:
+            self.remove(kind, pk)
+            item_keys = list(self.index_keys(pk, name))
+            if len(self) + len(item_keys) > self.max_entries:
+                self.truncated = True
+                return False
+            for key in item_keys:
+                insort(self.keys[kind], key)
+            self.items[(kind, pk)] = (name, slug)
+            return True
+
+    def remove(self, kind, pk):
+        with self.lock:
+            item = self.items.pop((kind, pk), None)
+            if item is None:
+                return
+            keys = self.keys[kind]
+            for key in self.index_keys(pk, item[0]):
+                position = bisect_left(keys, key)
+                if position < len(keys) and keys[position] == key:
+                    del keys[position]
+
+    def search(self, prefix, kind, limit):
+        """Return up to limit (id, name, slug) matches of one kind"""
+        prefix = normalize(prefix)[:MAX_KEY_LENGTH]
+        if not prefix:
+            return []
+
+        matches = []
+        seen = set()
+        with self.lock:
+            keys = self.keys[kind]
+            position = bisect_left(keys, prefix)
+            end = min(len(keys), position + MAX_SCAN)
+            while position < end and len(matches) < limit and keys[position].startswith(prefix):
+                pk = int(keys[position].rsplit(KEY_SEPARATOR, 1)[1])
+                position += 1
+                if pk in seen:
+                    continue
+                seen.add(pk)
+                name, slug = self.items[(kind, pk)]
+                matches.append((pk, name, slug))
+        return matches
+
+
+_index = None
+_index_pid = None
+_index_lock = threading.Lock()
+
+
+def index_rows():
+    """Active categories first, then active products by popularity"""
+    for pk, name, slug in Category.objects.filter(is_active=True).values_list('id', 'name', 'slug').iterator():
+        yield CATEGORY, pk, name, slug
+    products = (
+        Product.objects.filter(is_active=True)
+        .order_by('-review_count', '-id')
+        .values_list('id', 'name', 'slug')
+    )
+    for pk, name, slug in products.iterator(chunk_size=5000):
+        yield PRODUCT, pk, name, slug
+
+
+@functools.lru_cache(maxsize=None)
+def _redis_client(url):
+    return redis.Redis.from_url(url)
+
+
+def redis_client():
+    """Shared client for the configured pub/sub server, or None if disabled"""
+    url = getattr(settings, 'AUTOCOMPLETE_REDIS_URL', None)
+    return _redis_client(url) if url else None
+
+
+def subscribe():
+    pubsub = redis_client().pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(AUTOCOMPLETE_CHANNEL)
+    return pubsub
+
+
+def listen_for_changes(index, pubsub):
+    """Apply changes published by other processes; rebuild after reconnecting"""
+    while True:
+        try:
+            if pubsub is None:
+                pubsub = subscribe()
+                # Changes may have been missed while disconnected
+                index.load(index_rows())
+                close_old_connections()
+            for message in pubsub.listen():
+                apply_change(index, json.loads(message['data']))
+                close_old_connections()
+        except (redis.RedisError, DatabaseError, ValueError):
+            logger.exception('Autocomplete listener failed; reconnecting')
+        pubsub = None
+        time.sleep(RECONNECT_DELAY)
+
+
+def current_index():
+    """This process's index, or None if it has not been built here"""
+    return _index if _index_pid == os.getpid() else None
+
+
+def get_index():
+    """
+    Return this process's index, building it and subscribing on first use.
+
+    The index and its listener thread are never shared across a fork: a
+    worker forked from a process that already built one (gunicorn
+    --preload) builds and subscribes its own on its first lookup.
+    """
+    global _index, _index_pid
+    index = current_index()
+    if index is None:
+        with _index_lock:
+            index = current_index()
+            if index is None:
+                index = PrefixIndex(getattr(settings, 'AUTOCOMPLETE_MAX_ENTRIES', 200000))
+                pubsub = None
+                if redis_client() is not None:
+                    # Subscribe before loading so no change falls in between
+                    try:
+                        pubsub = subscribe()
+                    except redis.RedisError:
+                        logger.exception('Could not subscribe to autocomplete changes')
+                index.load(index_rows())
+                if redis_client() is not None:
+                    threading.Thread(
+                        target=listen_for_changes,
+                        args=(index, pubsub),
+                        name='autocomplete-listener',
+                        daemon=True
+                    ).start()
+                _index = index
+                _index_pid = os.getpid()
+    return index
+
+
+def apply_change(index, change):
+    if change.get('reload'):
+        index.load(index_rows())
+    elif change['active']:
+        index.add(change['kind'], change['id'], change['name'], change['slug'])
+    else:
+        index.remove(change['kind'], change['id'])
+
+
+def broadcast(change):
+    """
+    Send a change to every process once the transaction commits. This
+    process receives it through its own subscription; it is applied here
+    directly only when pub/sub is disabled or unreachable.
+    """
+    def publish():
+        client = redis_client()
+        if client is not None:
+            try:
+                client.publish(AUTOCOMPLETE_CHANNEL, json.dumps(change))
+                return
+            except redis.RedisError:
+                logger.exception('Could not publish autocomplete change %s', change)
+        index = current_index()
+        if index is not None:
+            apply_change(index, change)
+
+    transaction.on_commit(publish)
+
+
+def publish_change(kind, pk, name, slug, active):
+    broadcast({'kind': kind, 'id': pk, 'name': name, 'slug': slug, 'active': active})
+
+
+def publish_reload():
+    """Ask every process to rebuild its index, e.g. after a bulk import"""
+    broadcast({'reload': True})
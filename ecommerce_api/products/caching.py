@@ -0,0 +1,245 @@
+import hashlib
+import math
+import random
+import time
+from django.core.cache import cache
+from django.db import transaction
+
+# Detail payloads are invalidated by version bumps, so they can live for hours
+PRODUCT_DETAIL_TIMEOUT = 60 * 60 * 6
+CATEGORY_LIST_TIMEOUT = 60 * 60
+# Tagged list and search pages are dropped as soon as a tag they carry moves
+TAGGED_LIST_TIMEOUT = 60 * 10
+
+CATEGORY_LIST_VERSION_KEY = 'category_list_version'
+PRODUCT_LIST_VERSION_KEY = 'product_list_version'
+
+VERSION_BATCH_SIZE = 1000
+
+# Any product write can change which products an unscoped list contains
+PRODUCTS_TAG = 'products'
+
+
+def product_version_key(slug):
+    return f'product_version_{slug}'
+
+
+def product_detail_key(slug, version):
+    return f'product_{slug}_v{version}'
+
+
+def list_cache_key(prefix, version, request):
+    """Cache key for one page of a list endpoint, per query string"""
+    digest = hashlib.md5(request.get_full_path().encode('utf-8')).hexdigest()
+    return f'{prefix}_v{version}_{digest}'
+
+
+def new_version():
+    """Version stamps only need to be unique and increasing"""
+    return time.time_ns()
+
+
+def get_version(version_key):
+    """Return the current version stored under version_key, creating one if missing"""
+    version = cache.get(version_key)
+    if version is None:
+        cache.add(version_key, new_version(), None)
+        version = cache.get(version_key)
+    return version
+
+
+def bump_versions(version_keys):
+    """
+    Move cache versions forward once the current transaction commits, so
+    readers can never re-cache pre-commit data under the new key.
+    """
+    version_keys = {key for key in version_keys if key}
+    if not version_keys:
+        return
+
+    def bump():
+        version = new_version()
+        key_list = list(version_keys)
+        for start in range(0, len(key_list), VERSION_BATCH_SIZE):
+            batch = key_list[start:start + VERSION_BATCH_SIZE]
+            cache.set_many({key: version for key in batch}, None)
+
+    transaction.on_commit(bump)
+
+
+def get_versions(version_keys):
+    """Return {version_key: version} in one round trip, creating missing versions"""
+    found = cache.get_many(version_keys)
+    missing = [key for key in version_keys if key not in found]
+    if missing:
+        version = new_version()
+        for key in missing:
+            cache.add(key, version, None)
+        found.update(cache.get_many(missing))
+    return found
+
+
+def product_version(slug):
+    return get_version(product_version_key(slug))
+
+
+def product_versions(slugs):
+    """{slug: current version} for many products"""
+    version_keys = {slug: product_version_key(slug) for slug in slugs}
+    versions = get_versions(list(version_keys.values()))
+    return {slug: versions.get(version_key) for slug, version_key in version_keys.items()}
+
+
+def bump_product_versions(slugs):
+    bump_versions(product_version_key(slug) for slug in slugs if slug)
+
+
+def product_tag(product_id):
+    return f'product:{product_id}'
+
+
+def category_tag(category_id):
+    return f'category:{category_id}'
+
+
+def tag_version_key(tag):
+    return f'tag_version_{tag}'
+
+
+def bump_tags(tags):
+    """Invalidate every tagged entry that depends on any of tags, after commit"""
+    bump_versions(tag_version_key(tag) for tag in tags if tag)
+
+
+def tag_versions(tags):
+    """Return {tag: version} for tags in one round trip, creating missing versions"""
+    keys = {tag_version_key(tag): tag for tag in tags}
+    found = get_versions(list(keys))
+    return {tag: found.get(key) for key, tag in keys.items()}
+
+
+def get_or_compute_tagged(key, compute, timeout=TAGGED_LIST_TIMEOUT):
+    """
+    Cache compute()'s value along with the versions of the tags it depends on.
+
+    compute() returns (value, tags). A stored entry is served only while
+    every recorded tag version is still current, so bumping any one tag
+    drops it immediately, with no stale window. Versions are time_ns stamps:
+    if a tag moved (or was first seen) after the compute started, the value
+    may predate that write and is returned without being cached.
+    """
+    entry = cache.get(key)
+    if entry is not None and tag_versions(entry['tags']) == entry['tags']:
+        return entry['value']
+
+    started = new_version()
+    value, tags = compute()
+    versions = tag_versions(set(tags))
+    if all(version is not None and version < started for version in versions.values()):
+        cache.set(key, {'value': value, 'tags': versions}, timeout)
+    return value
+
+
+def tagged_cache_key(prefix, request):
+    """Cache key for one tagged response, per query string"""
+    digest = hashlib.md5(request.get_full_path().encode('utf-8')).hexdigest()
+    return f'{prefix}_{digest}'
+
+
+def product_list_tags(products, scope_tag=PRODUCTS_TAG):
+    """Tags for a page of products (instances or values() rows): its scope plus every product and its category"""
+    tags = {scope_tag}
+    for product in products:
+        if isinstance(product, dict):
+            tags.add(product_tag(product['id']))
+            tags.add(category_tag(product['category']))
+        else:
+            tags.add(product_tag(product.pk))
+            tags.add(category_tag(product.category_id))
+    return tags
+
+
+def get_or_recompute(key, compute, timeout, stale_timeout=60, lock_timeout=10,
+                     wait_timeout=5, poll_interval=0.02, beta=1.0):
+    """
+    Read key from the cache, recomputing it at most once at a time.
+
+    - Single flight: only the caller holding the `<key>_lock` entry runs
+      compute(); concurrent callers serve the stale value if there is one,
+      otherwise they wait for the lock holder to publish the result.
+    - Stale while revalidate: entries outlive their soft expiry by
+      stale_timeout seconds so there is something to serve during a rebuild.
+    - Probabilistic early expiry: a caller may treat an entry as expired
+      shortly before its soft expiry, with a probability that grows with how
+      long the last recompute took, so hot keys are refreshed before the
+      whole fleet misses together.
+    """
+    entry = cache.get(key)
+    now = time.time()
+
+    if entry is not None:
+        early = entry['delta'] * beta * -math.log(max(random.random(), 1e-12))
+        if now + early < entry['expires']:
+            return entry['value']
+
+    lock_key = f'{key}_lock'
+    if cache.add(lock_key, 1, lock_timeout):
+        try:
+            started = time.time()
+            value = compute()
+            delta = time.time() - started
+            cache.set(
+                key,
+                {'value': value, 'expires': time.time() + timeout, 'delta': delta},
+                timeout + stale_timeout
+            )
+            return value
+        finally:
+            cache.delete(lock_key)
+
+    if entry is not None:
+        # Someone else is refreshing; serve the stale copy meanwhile
+        return entry['value']
+
+    deadline = time.time() + wait_timeout
+    while time.time() < deadline:
+        time.sleep(poll_interval)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry['value']
+        if cache.get(lock_key) is None:
+            break
+
+    # The lock holder failed or timed out; compute without caching
+    return compute()
+
+
+def get_many_or_recompute(keys, compute_many, timeout, stale_timeout=60):
+    """
+    Batch counterpart of get_or_recompute, over the same cache entries.
+
+    One get_many reads every key; keys that are missing or past their soft
+    expiry are passed together to compute_many(), which returns
+    {key: value} for those it could build, and the results are written
+    back with one set_many. There is no single flight: a batch rebuilds all
+    its misses with one query, so a stampede costs one query per request.
+    Returns {key: value} for the keys found or built.
+    """
+    entries = cache.get_many(keys)
+    now = time.time()
+    values = {key: entry['value'] for key, entry in entries.items() if now < entry['expires']}
+    missing = [key for key in keys if key not in values]
+    if not missing:
+        return values
+
+    started = time.time()
+    computed = compute_many(missing)
+    # Early expiry weighs each entry's share of the rebuild
+    delta = (time.time() - started) / len(missing)
+    expires = time.time() + timeout
+    cache.set_many(
+        {key: {'value': value, 'expires': expires, 'delta': delta} for key, value in computed.items()},
+        timeout + stale_timeout
+    )
+    values.update(computed)
+    return values
@@ -0,0 +1,39 @@
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from users.permissions import IsAdmin
+from .exporter import EXPORT_FORMATS, iter_export, parse_updated_since
+
+
+class ProductExportView(APIView):
+    """Stream the full product catalog as NDJSON or CSV (Admin only)"""
+    permission_classes = [IsAdmin]
+    
+    content_types = {
+        'ndjson': 'application/x-ndjson',
+        'csv': 'text/csv',
+    }
+    
+    def get(self, request):
+        # `format` is reserved by DRF for renderer selection
+        file_format = request.query_params.get('output', 'ndjson')
+        if file_format not in EXPORT_FORMATS:
+            return Response(
+                {'error': f"output must be one of: {', '.join(EXPORT_FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+            
+        try:
+            updated_since = parse_updated_since(request.query_params.get('updated_since'))
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        response = StreamingHttpResponse(
+            iter_export(file_format, updated_since=updated_since),
+            content_type=self.content_types[file_format]
+        )
+        filename = f"products-{timezone.now().strftime('%Y%m%d%H%M%S')}.{file_format}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
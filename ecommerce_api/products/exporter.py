@@ -0,0 +1,89 @@
+import csv
+from datetime import datetime, timezone as dt_timezone
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from .models import Product
+
+EXPORT_FORMATS = ('ndjson', 'csv')
+
+# values() columns exported per product, mapped to their output names
+EXPORT_COLUMNS = (
+    ('id', 'id'),
+    ('name', 'name'),
+    ('slug', 'slug'),
+    ('description', 'description'),
+    ('category_id', 'category_id'),
+    ('category__name', 'category_name'),
+    ('category__slug', 'category_slug'),
+    ('price', 'price'),
+    ('stock', 'stock'),
+    ('is_active', 'is_active'),
+    ('is_featured', 'is_featured'),
+    ('average_rating', 'average_rating'),
+    ('review_count', 'review_count'),
+    ('created_at', 'created_at'),
+    ('updated_at', 'updated_at'),
+)
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+def parse_updated_since(value):
+    """Parse an ISO date or datetime; naive values are taken as UTC"""
+    if not value:
+        return None
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError('updated_since must be an ISO 8601 date or datetime')
+        moment = datetime(day.year, day.month, day.day)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment, dt_timezone.utc)
+    return moment
+
+
+def export_rows(updated_since=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield one dict per product in id order.
+
+    iterator() runs on a PostgreSQL server-side cursor, so only chunk_size
+    rows are held in memory whatever the catalog size.
+    """
+    queryset = Product.objects.order_by('id')
+    if updated_since is not None:
+        # category_name is exported, and renaming a category leaves its products' updated_at alone
+        queryset = queryset.filter(Q(updated_at__gte=updated_since) | Q(category__updated_at__gte=updated_since))
+
+    columns = [column for column, _ in EXPORT_COLUMNS]
+    for row in queryset.values(*columns).iterator(chunk_size=chunk_size):
+        yield {name: row[column] for column, name in EXPORT_COLUMNS}
+
+
+def iter_ndjson(rows):
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    for row in rows:
+        yield encoder.encode(row) + '\n'
+
+
+class _LineBuffer:
+    """File-like object that hands back whatever csv.writer wrote"""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows):
+    writer = csv.writer(_LineBuffer())
+    yield writer.writerow([name for _, name in EXPORT_COLUMNS])
+    for row in rows:
+        yield writer.writerow([row[name] for _, name in EXPORT_COLUMNS])
+
+
+def iter_export(file_format, updated_since=None):
+    rows = export_rows(updated_since=updated_since)
+    if file_format == 'csv':
+        return iter_csv(rows)
+    return iter_ndjson(rows)
@@ -0,0 +1,76 @@
+from django.db.models import Case, Count, IntegerField, Q, Value, When
+
+# Price bucket boundaries as (lower inclusive, upper exclusive); None is open-ended
+PRICE_BUCKETS = (
+    (0, 25),
+    (25, 50),
+    (50, 100),
+    (100, 250),
+    (250, None),
+)
+
+
+def price_bucket_expression():
+    """Map a product price onto its PRICE_BUCKETS index"""
+    whens = []
+    for index, (lower, upper) in enumerate(PRICE_BUCKETS):
+        condition = Q(price__gte=lower)
+        if upper is not None:
+            condition &= Q(price__lt=upper)
+        whens.append(When(condition, then=Value(index)))
+    return Case(*whens, default=Value(len(PRICE_BUCKETS) - 1), output_field=IntegerField())
+
+
+def compute_facets(queryset):
+    """
+    Count products per category, price bucket, stock state and featured flag.
+
+    Runs one GROUP BY over all four dimensions and rolls the rows up in
+    Python; the grouped result is at most categories x buckets x 4 rows.
+    """
+    rows = (
+        queryset.order_by()
+        .annotate(
+            price_bucket=price_bucket_expression(),
+            has_stock=Case(
+                When(stock__gt=0, then=Value(1)),
+                default=Value(0),
+                output_field=IntegerField()
+            )
+        )
+        .values('category_id', 'category__name', 'category__slug', 'price_bucket', 'has_stock', 'is_featured')
+        .annotate(count=Count('id'))
+    )
+
+    total = 0
+    categories = {}
+    price_counts = [0] * len(PRICE_BUCKETS)
+    in_stock = {'true': 0, 'false': 0}
+    featured = {'true': 0, 'false': 0}
+
+    for row in rows:
+        count = row['count']
+        total += count
+
+        category = categories.setdefault(row['category_id'], {
+            'id': row['category_id'],
+            'name': row['category__name'],
+            'slug': row['category__slug'],
+            'count': 0,
+        })
+        category['count'] += count
+
+        price_counts[row['price_bucket']] += count
+        in_stock['true' if row['has_stock'] else 'false'] += count
+        featured['true' if row['is_featured'] else 'false'] += count
+
+    return {
+        'total': total,
+        'categories': sorted(categories.values(), key=lambda c: (-c['count'], c['name'])),
+        'price_ranges': [
+            {'min': lower, 'max': upper, 'count': price_counts[index]}
+            for index, (lower, upper) in enumerate(PRICE_BUCKETS)
+        ],
+        'in_stock': in_stock,
+        'is_featured': featured,
+    }
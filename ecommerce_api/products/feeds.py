@@ -0,0 +1,70 @@
+import hashlib
+import math
+import time
+from collections import OrderedDict
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils.http import quote_etag
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from .models import Product
+from .rows import row_serializer
+from .serializers import ProductListSerializer
+
+FEATURED_FEED_PAGES_KEY = 'featured_feed_pages'
+FEATURED_FEED_LOCK_KEY = 'featured_feed_lock'
+
+
+def featured_feed_key(page):
+    return f'featured_feed_page_{page}'
+
+
+def featured_page_link(path, page, pages):
+    if page < 1 or page > pages:
+        return None
+    return path if page == 1 else f'{path}?page={page}'
+
+
+def render_featured_feed():
+    """
+    Render every page of the featured products listing to JSON bytes.
+
+    Returns ({cache key: entry}, page count). Entries hold the body with its
+    ETag and Last-Modified, so serving a page is one cache read. Links and
+    image URLs are relative because there is no request to build absolute
+    ones from.
+    """
+    page_size = api_settings.PAGE_SIZE
+    rows = row_serializer(ProductListSerializer())
+    products = list(rows.values(Product.objects.filter(is_active=True, is_featured=True)))
+    count = len(products)
+    pages = max(1, math.ceil(count / page_size))
+    path = reverse('products:featured_products')
+    renderer = JSONRenderer()
+    last_modified = int(time.time())
+
+    entries = {}
+    for page in range(1, pages + 1):
+        body = renderer.render(OrderedDict([
+            ('count', count),
+            ('next', featured_page_link(path, page + 1, pages)),
+            ('previous', featured_page_link(path, page - 1, pages)),
+            ('results', rows.serialize(products[(page - 1) * page_size:page * page_size])),
+        ]))
+        entries[featured_feed_key(page)] = {
+            'body': body,
+            'etag': quote_etag(hashlib.md5(body).hexdigest()),
+            'last_modified': last_modified,
+        }
+    return entries, pages
+
+
+def build_featured_feed():
+    """Render the featured feed and replace the cached pages with it; returns the page count"""
+    entries, pages = render_featured_feed()
+    previous_pages = cache.get(FEATURED_FEED_PAGES_KEY) or 0
+    cache.set_many(entries, None)
+    cache.set(FEATURED_FEED_PAGES_KEY, pages, None)
+    if previous_pages > pages:
+        cache.delete_many([featured_feed_key(page) for page in range(pages + 1, previous_pages + 1)])
+    return pages
@@ -0,0 +1,151 @@
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+FIELDS_PARAM = 'fields'
+OMIT_PARAM = 'omit'
+
+
+def parse_fieldset(value):
+    """Parse 'id,items.quantity,items.product.name' into a nested dict"""
+    tree = {}
+    for path in (value or '').split(','):
+        node = tree
+        for part in path.strip().split('.'):
+            if part:
+                node = node.setdefault(part, {})
+    return tree
+
+
+def request_fieldset(request):
+    """Return the (include, omit) trees requested on a read, or (None, None)"""
+    if request is None or request.method not in SAFE_METHODS:
+        return None, None
+    include = parse_fieldset(request.query_params.get(FIELDS_PARAM))
+    omit = parse_fieldset(request.query_params.get(OMIT_PARAM))
+    return include or None, omit or None
+
+
+def trim_representation(data, include=None, omit=None):
+    """Apply a sparse fieldset to an already serialized payload"""
+    if isinstance(data, list):
+        return [trim_representation(item, include, omit) for item in data]
+    if not isinstance(data, dict) or (include is None and not omit):
+        return data
+
+    trimmed = {}
+    for name, value in data.items():
+        if include is not None and name not in include:
+            continue
+        if omit and omit.get(name) == {}:
+            continue
+        trimmed[name] = trim_representation(
+            value,
+            (include or {}).get(name) or None,
+            (omit or {}).get(name) or None
+        )
+    return trimmed
+
+
+class SparseFieldsetMixin:
+    """
+    Let clients trim a serializer with ?fields= and ?omit= on reads.
+
+    Both take comma separated names; dotted names reach into nested
+    sparse serializers (?fields=id,items.product.name). Dropped fields are
+    removed before to_representation, so their getters, method fields and
+    nested serializers never run. Meta.fieldset_requires maps fields that
+    are not plain columns to the columns and Prefetch objects they read,
+    which fieldset_queryset() uses to narrow the queryset.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.sparse_include = kwargs.pop('fields', None)
+        self.sparse_omit = kwargs.pop('omit', None)
+        # Pass sparse=False to always render every field
+        self.sparse_from_request = kwargs.pop('sparse', True)
+        super().__init__(*args, **kwargs)
+
+    def is_sparse_root(self):
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        return parent is None
+
+    def get_fieldset(self):
+        include, omit = self.sparse_include, self.sparse_omit
+        if isinstance(include, str):
+            include = parse_fieldset(include) or None
+        if isinstance(omit, str):
+            omit = parse_fieldset(omit) or None
+        if include is None and omit is None and self.sparse_from_request and self.is_sparse_root():
+            include, omit = request_fieldset(self.context.get('request'))
+        return include, omit
+
+    @property
+    def is_sparse(self):
+        include, omit = self.get_fieldset()
+        return include is not None or bool(omit)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        include, omit = self.get_fieldset()
+        if include is None and not omit:
+            return fields
+
+        for name in list(fields):
+            if (include is not None and name not in include) or (omit and omit.get(name) == {}):
+                del fields[name]
+
+        # Hand the nested part of the fieldset down to nested serializers
+        for name, field in fields.items():
+            child = getattr(field, 'child', field)
+            if isinstance(child, SparseFieldsetMixin):
+                child.sparse_include = (include or {}).get(name) or None
+                child.sparse_omit = (omit or {}).get(name) or None
+                child.sparse_from_request = False
+        return fields
+
+
+def fieldset_queryset(queryset, serializer, always=()):
+    """
+    Narrow queryset to what serializer's sparse fieldset reads: only() the
+    needed columns, select_related the relations they cross and keep only
+    the prefetches still needed. always lists extra columns the caller
+    reads itself. Querysets for full (non-sparse) serializers are returned
+    unchanged.
+    """
+    serializer = getattr(serializer, 'child', serializer)
+    if not getattr(serializer, 'is_sparse', False):
+        return queryset
+
+    requires = getattr(serializer.Meta, 'fieldset_requires', {})
+    columns = set(always)
+    prefetches = {}
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        for need in requires.get(name, (field.source,)):
+            if isinstance(need, Prefetch):
+                prefetches[need.prefetch_to] = need
+            else:
+                columns.add(need.replace('.', '__'))
+
+    queryset = queryset.select_related(None).prefetch_related(None).only(*columns)
+    selects = {column.rsplit('__', 1)[0] for column in columns if '__' in column}
+    if selects:
+        # select_related() without arguments would follow every foreign key
+        queryset = queryset.select_related(*selects)
+    return queryset.prefetch_related(*prefetches.values())
+
+
+class SparseQuerysetMixin:
+    """View mixin applying fieldset_queryset() to the filtered queryset on reads"""
+    # Columns the view itself reads from each row (pagination, cache tags)
+    fieldset_columns = ()
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.request.method not in SAFE_METHODS:
+            return queryset
+        return fieldset_queryset(queryset, self.get_serializer(), self.fieldset_columns)
@@ -0,0 +1,55 @@
+import io
+from rest_framework import status
+from rest_framework.parsers import MultiPartParser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from users.permissions import IsAdmin
+from .importer import IMPORT_FORMATS, ProductImporter, detect_format
+
+
+class ProductImportView(APIView):
+    """Bulk import products from an uploaded CSV or JSONL file (Admin only)"""
+    permission_classes = [IsAdmin]
+    parser_classes = [MultiPartParser]
+    
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response(
+                {'error': 'A CSV or JSONL file is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+            
+        file_format = request.data.get('format') or detect_format(upload.name)
+        if file_format not in IMPORT_FORMATS:
+            return Response(
+                {'error': f"Format must be one of: {', '.join(IMPORT_FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+            
+        try:
+            chunk_size = int(request.data.get('chunk_size', 1000))
+        except ValueError:
+            chunk_size = 0
+        if chunk_size < 1:
+            return Response(
+                {'error': 'chunk_size must be a positive integer'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+            
+        importer = ProductImporter(
+            chunk_size=chunk_size,
+            create_categories=str(request.data.get('create_categories', '')).lower() in ('1', 'true')
+        )
+        
+        # Read the upload line by line instead of loading it into memory
+        stream = io.TextIOWrapper(upload.file, encoding='utf-8', newline='')
+        try:
+            report = importer.run(stream, file_format)
+        except UnicodeDecodeError:
+            return Response(
+                {'error': 'File must be UTF-8 encoded'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        return Response(report, status=status.HTTP_200_OK)
@@ -0,0 +1,302 @@
+import csv
+import json
+import operator
+import time
+from decimal import Decimal, InvalidOperation
+from functools import reduce
+from django.db import DatabaseError, transaction
+from django.db.models import Q
+from django.utils.text import slugify
+from .aggregates import rebuild_category_counts
+from .autocomplete import publish_reload
+from .caching import (
+    CATEGORY_LIST_VERSION_KEY,
+    PRODUCT_LIST_VERSION_KEY,
+    PRODUCTS_TAG,
+    bump_product_versions,
+    bump_tags,
+    bump_versions,
+    category_tag,
+    product_tag
+)
+from .models import Category, Product
+from .search import refresh_search_vectors
+from .tasks import schedule_featured_feed_rebuild
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+
+# Columns overwritten when an imported slug already exists. Not stock: it
+# is only set on create, since changes to an existing product's stock go
+# through the inventory ledger (see products.inventory)
+UPSERT_FIELDS = ('name', 'description', 'category', 'price', 'is_active', 'is_featured', 'updated_at')
+
+TRUE_VALUES = ('1', 'true', 'yes', 'y', 't')
+FALSE_VALUES = ('0', 'false', 'no', 'n', 'f', '')
+
+MAX_REPORTED_ERRORS = 1000
+
+# Product.price is DecimalField(max_digits=10, decimal_places=2)
+MAX_PRICE = Decimal('100000000')
+
+
+def detect_format(filename, default='csv'):
+    """Guess the import format from a file name"""
+    if filename and filename.lower().endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    if filename and filename.lower().endswith('.csv'):
+        return 'csv'
+    return default
+
+
+def read_rows(stream, file_format):
+    """Yield (line number, row dict) pairs from a text stream"""
+    if file_format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif file_format == 'jsonl':
+        for line_number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as exc:
+                yield line_number, {'__error__': f'Invalid JSON: {exc}'}
+                continue
+            if not isinstance(row, dict):
+                row = {'__error__': 'Each line must be a JSON object'}
+            yield line_number, row
+    else:
+        raise ValueError(f"Unsupported format '{file_format}'")
+
+
+def parse_bool(value, default):
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    value = str(value).strip().lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return default if value == '' else False
+    raise ValueError(f"'{value}' is not a boolean")
+
+
+class ProductImporter:
+    """
+    Stream product rows into the catalog with chunked upserts.
+
+    An explicit slug column is the upsert key: a row whose slug exists
+    updates that product, except for its stock. Rows without one always create a product, under
+    their name's slug or, if a product or an explicit slug of this import
+    already has it, the first free -2, -3, ... suffix; so only files with
+    slugs can be re-run to update. Each chunk is written with one
+    bulk_create(update_conflicts=True) in its own transaction; a failing
+    row or chunk is reported and the run continues.
+    """
+
+    def __init__(self, chunk_size=1000, create_categories=False):
+        self.chunk_size = chunk_size
+        self.create_categories = create_categories
+        self.categories = {}
+        # Slugs derived names must avoid: existing ones for the bases seen
+        # so far, explicit slugs of this import and slugs already derived
+        self.claimed_slugs = set()
+        self.loaded_bases = set()
+        self.touched_categories = set()
+        self.processed = 0
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+
+    def load_categories(self):
+        """Resolve categories by slug or (case-insensitive) name in memory"""
+        for category_id, name, slug in Category.objects.values_list('id', 'name', 'slug'):
+            self.categories[slug] = category_id
+            self.categories[name.lower()] = category_id
+
+    def resolve_category(self, value):
+        value = str(value or '').strip()
+        if not value:
+            raise ValueError('category is required')
+
+        category_id = self.categories.get(value) or self.categories.get(value.lower())
+        if category_id is None and self.create_categories:
+            try:
+                category, _ = Category.objects.get_or_create(
+                    slug=slugify(value), defaults={'name': value}
+                )
+            except DatabaseError as exc:
+                raise ValueError(f"Could not create category '{value}': {exc}")
+            self.categories[category.slug] = category.id
+            self.categories[category.name.lower()] = category.id
+            category_id = category.id
+        if category_id is None:
+            raise ValueError(f"Unknown category '{value}'")
+        return category_id
+
+    def explicit_slug(self, row):
+        """The row's own slug, or None when it should be derived from the name"""
+        if not str(row.get('slug') or '').strip():
+            return None
+        slug = slugify(row['slug'])[:200]
+        if not slug:
+            raise ValueError(f"'{row['slug']}' is not a valid slug")
+        return slug
+
+    def load_claimed_slugs(self, bases):
+        """Claim the existing slugs that derived slugs from bases could collide with, in one query"""
+        bases = set(bases) - self.loaded_bases
+        if not bases:
+            return
+        lookup = reduce(operator.or_, (Q(slug=base) | Q(slug__startswith=f'{base}-') for base in bases))
+        self.claimed_slugs.update(Product.objects.filter(lookup).values_list('slug', flat=True))
+        self.loaded_bases.update(bases)
+
+    def derive_slugs(self, products):
+        """Give products without a slug the first free slug for their name"""
+        derived = [product for product in products if not product.slug]
+        self.load_claimed_slugs(slugify(product.name)[:190] for product in derived)
+        for product in derived:
+            base = slugify(product.name)[:190]
+            slug, suffix = base, 1
+            while slug in self.claimed_slugs:
+                suffix += 1
+                slug = f'{base}-{suffix}'
+            self.claimed_slugs.add(slug)
+            product.slug = slug
+
+    def build_product(self, row):
+        if '__error__' in row:
+            raise ValueError(row['__error__'])
+
+        name = str(row.get('name') or '').strip()
+        if not name:
+            raise ValueError('name is required')
+        if len(name) > 200:
+            raise ValueError('name must be at most 200 characters')
+        slug = self.explicit_slug(row)
+        if slug is None and not slugify(name):
+            raise ValueError('name must contain letters or digits')
+
+        try:
+            price = Decimal(str(row.get('price')).strip())
+        except (InvalidOperation, TypeError):
+            raise ValueError('price must be a decimal number')
+        if not price.is_finite() or price <= 0:
+            raise ValueError('Price must be greater than 0')
+        if price >= MAX_PRICE:
+            raise ValueError(f'price must be less than {MAX_PRICE}')
+
+        try:
+            stock = int(str(row.get('stock') or 0).strip())
+        except ValueError:
+            raise ValueError('stock must be an integer')
+        if stock < 0:
+            raise ValueError('stock cannot be negative')
+
+        is_active = parse_bool(row.get('is_active'), True)
+        is_featured = parse_bool(row.get('is_featured'), False)
+        category_id = self.resolve_category(row.get('category'))
+
+        # Derived slugs are assigned per chunk, once its explicit slugs are known
+        return Product(
+            name=name,
+            slug=slug,
+            description=str(row.get('description') or ''),
+            category_id=category_id,
+            price=price.quantize(Decimal('0.01')),
+            stock=stock,
+            is_active=is_active,
+            is_featured=is_featured,
+        )
+
+    def add_error(self, line_number, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': line_number, 'error': message})
+
+    def flush(self, chunk):
+        """Upsert one chunk of (line number, product) pairs"""
+        if not chunk:
+            return
+
+        products = [product for _, product in chunk]
+        self.derive_slugs(products)
+        slugs = [product.slug for product in products]
+        try:
+            with transaction.atomic():
+                Product.objects.bulk_create(
+                    products,
+                    update_conflicts=True,
+                    unique_fields=['slug'],
+                    update_fields=UPSERT_FIELDS,
+                )
+                # bulk_create skips model signals; redo their work per chunk
+                refresh_search_vectors(Product.objects.filter(slug__in=slugs))
+                bump_product_versions(slugs)
+                bump_tags(
+                    product_tag(product_id)
+                    for product_id in Product.objects.filter(slug__in=slugs).values_list('id', flat=True)
+                )
+        except DatabaseError as exc:
+            for line_number, _ in chunk:
+                self.add_error(line_number, f'Chunk failed: {exc}')
+            return
+
+        self.imported += len(products)
+        self.touched_categories.update(product.category_id for product in products)
+
+    def run(self, stream, file_format):
+        started = time.monotonic()
+        self.load_categories()
+
+        chunk = []
+        chunk_slugs = set()
+        for line_number, row in read_rows(stream, file_format):
+            self.processed += 1
+            try:
+                product = self.build_product(row)
+            except ValueError as exc:
+                self.add_error(line_number, str(exc))
+                continue
+
+            if product.slug:
+                # One upsert cannot touch a row twice; the later row wins
+                if product.slug in chunk_slugs:
+                    self.flush(chunk)
+                    chunk = []
+                    chunk_slugs = set()
+                chunk_slugs.add(product.slug)
+                self.claimed_slugs.add(product.slug)
+            chunk.append((line_number, product))
+
+            if len(chunk) >= self.chunk_size:
+                self.flush(chunk)
+                chunk = []
+                chunk_slugs = set()
+        self.flush(chunk)
+
+        if self.touched_categories:
+            # Products may also have left categories, so reconcile all of them
+            rebuild_category_counts()
+            bump_versions([CATEGORY_LIST_VERSION_KEY, PRODUCT_LIST_VERSION_KEY])
+            # Updated rows may have left categories not seen in this file
+            bump_tags([
+                PRODUCTS_TAG,
+                *(category_tag(category_id) for category_id in Category.objects.values_list('id', flat=True))
+            ])
+            schedule_featured_feed_rebuild()
+            publish_reload()
+
+        elapsed = time.monotonic() - started
+        return {
+            'processed': self.processed,
+            'imported': self.imported,
+            'failed': self.failed,
+            'errors': self.errors,
+            'elapsed_seconds': round(elapsed, 3),
+            'rows_per_second': round(self.processed / elapsed, 1) if elapsed else self.processed,
+        }
@@ -0,0 +1,295 @@
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Now
+from .caching import (
+    PRODUCT_LIST_VERSION_KEY,
+    PRODUCTS_TAG,
+    bump_product_versions,
+    bump_tags,
+    bump_versions,
+    category_tag,
+    product_tag
+)
+from .models import InventoryMovement, Product, StockShard
+from .sharding import (
+    add_to_shards,
+    default_shard_count,
+    replace_shards,
+    shard_stock_expression,
+    split,
+    take_from_shards
+)
+from .tasks import schedule_featured_feed_rebuild
+
+# Pending movements folded into stock per transaction
+SETTLE_BATCH_SIZE = 5000
+
+
+class InsufficientStock(Exception):
+    """A product cannot cover the requested quantity"""
+
+    def __init__(self, product_id, quantity):
+        self.product_id = product_id
+        self.quantity = quantity
+        super().__init__(f'Insufficient stock for product {product_id} (requested {quantity})')
+
+
+def quantities_by_product(lines):
+    """Sum (product_id, quantity) pairs into {product_id: quantity}"""
+    quantities = defaultdict(int)
+    for product_id, quantity in lines:
+        quantities[product_id] += quantity
+    return dict(quantities)
+
+
+def record_movements(deltas, reason, reference='', settled=False):
+    """Append one ledger row per product of {product_id: signed delta}"""
+    InventoryMovement.objects.bulk_create([
+        InventoryMovement(product_id=product_id, delta=delta, reason=reason, reference=reference, settled=settled)
+        for product_id, delta in sorted(deltas.items())
+        if delta
+    ])
+
+
+def invalidate_stock_caches(product_ids, membership=True):
+    """
+    Stock is rendered in product details, listings and the featured feed.
+    Pass membership=False for changes that cannot move a product in or out
+    of the in_stock filter, such as cart holds changing available_stock.
+    """
+    rows = list(Product.objects.filter(pk__in=product_ids).values_list('pk', 'slug', 'category_id', 'is_featured'))
+    if not rows:
+        return
+    bump_product_versions(slug for _, slug, _, _ in rows)
+    bump_versions([PRODUCT_LIST_VERSION_KEY])
+    tags = [product_tag(pk) for pk, _, _, _ in rows]
+    if membership:
+        tags += [PRODUCTS_TAG] + [category_tag(category_id) for _, _, category_id, _ in rows]
+    bump_tags(tags)
+    if any(is_featured for _, _, _, is_featured in rows):
+        schedule_featured_feed_rebuild()
+
+
+def sharded_products(product_ids):
+    """{product_id: shard count} of the high-contention products among product_ids"""
+    return dict(Product.objects.filter(pk__in=product_ids, stock_shards__gt=0).values_list('pk', 'stock_shards'))
+
+
+def take_from_stock(product_id, quantity, own_hold, shard_count=0):
+    if shard_count:
+        if not take_from_shards(product_id, shard_count, quantity):
+            return False
+        if own_hold:
+            # A hold taken before the product went high-contention
+            Product.objects.filter(pk=product_id).update(reserved_stock=F('reserved_stock') - own_hold)
+            invalidate_stock_caches([product_id], membership=False)
+        return True
+    # updated_at moves too, so incremental exports pick up stock changes
+    return Product.objects.filter(
+        pk=product_id,
+        stock_shards=0,
+        stock__gte=F('reserved_stock') - own_hold + quantity
+    ).update(
+        stock=F('stock') - quantity,
+        reserved_stock=F('reserved_stock') - own_hold,
+        updated_at=Now()
+    ) == 1
+
+
+def decrement_stock(quantities, held=None, reason=InventoryMovement.ORDER, reference=''):
+    """
+    Take {product_id: quantity} out of stock, all or nothing.
+
+    Decrements need the row to enforce "no oversell", so unlike increases
+    they are applied at once: one conditional UPDATE per product (stock =
+    stock - q WHERE stock covers q plus what other carts hold), issued in
+    product id order so concurrent checkouts cannot deadlock, and recorded
+    in the ledger as settled. held maps product ids to units of the
+    caller's own cart hold, released in the same statement. High-contention
+    products are taken from their shards instead of the product row.
+    Raises InsufficientStock, with every decrement rolled back, if a
+    product falls short even after folding in its pending increases.
+    """
+    held = held or {}
+    shard_counts = sharded_products(quantities)
+    with transaction.atomic():
+        for product_id in sorted(quantities):
+            quantity = quantities[product_id]
+            own_hold = held.get(product_id, 0)
+            if take_from_stock(product_id, quantity, own_hold, shard_counts.get(product_id, 0)):
+                continue
+            # Restocks and cancellations may still be waiting in the ledger,
+            # or the product was switched in or out of sharding meanwhile
+            settled = settle_movements(product_ids=[product_id])
+            shard_count = sharded_products([product_id]).get(product_id, 0)
+            switched = shard_count != shard_counts.get(product_id, 0)
+            if not (settled or switched) or not take_from_stock(product_id, quantity, own_hold, shard_count):
+                raise InsufficientStock(product_id, quantity)
+        record_movements({product_id: -quantity for product_id, quantity in quantities.items()},
+                         reason, reference, settled=True)
+    # Sharded totals are refreshed, and their caches invalidated, by refresh_sharded_stock()
+    invalidate_stock_caches([product_id for product_id in quantities if product_id not in shard_counts])
+
+
+def add_stock(quantities, reason, reference=''):
+    """
+    Put {product_id: quantity} back into stock (cancellations, restocks).
+    Only ledger rows are written, so this never waits on the product rows
+    that checkouts are locking; settle_movements() folds them in later.
+    """
+    record_movements(quantities, reason, reference)
+
+
+def restore_stock(quantities, reference=''):
+    """Return a cancelled order's quantities to stock"""
+    add_stock(quantities, InventoryMovement.CANCEL, reference)
+
+
+def settle_movements(product_ids=None, batch_size=SETTLE_BATCH_SIZE):
+    """
+    Fold pending ledger rows into Product.stock in batches, each in its
+    own transaction: one UPDATE per product in id order, then the rows are
+    marked settled. Rows locked by another settler are skipped. Returns
+    the number of rows settled.
+    """
+    settled = 0
+    while True:
+        with transaction.atomic():
+            pending = InventoryMovement.objects.filter(settled=False)
+            if product_ids is not None:
+                pending = pending.filter(product_id__in=product_ids)
+            rows = list(
+                pending.select_for_update(skip_locked=True)
+                .order_by('id')
+                .values_list('id', 'product_id', 'delta')[:batch_size]
+            )
+            if not rows:
+                return settled
+
+            totals = quantities_by_product((product_id, delta) for _, product_id, delta in rows)
+            shard_counts = sharded_products(totals)
+            for product_id in sorted(totals):
+                if product_id in shard_counts:
+                    add_to_shards(product_id, shard_counts[product_id], totals[product_id])
+                else:
+                    Product.objects.filter(pk=product_id).update(
+                        stock=F('stock') + totals[product_id], updated_at=Now()
+                    )
+            InventoryMovement.objects.filter(id__in=[row[0] for row in rows]).update(settled=True)
+            if shard_counts:
+                refresh_sharded_stock(shard_counts)
+            invalidate_stock_caches([product_id for product_id in totals if product_id not in shard_counts])
+        settled += len(rows)
+        if len(rows) < batch_size:
+            return settled
+
+
+def refresh_sharded_stock(product_ids=None):
+    """
+    Set Product.stock of high-contention products to the sum of their
+    shards. Checkouts only write the shards, so `stock` (and the cached
+    pages showing it) lags until this runs. Returns the number of products
+    whose stock changed.
+    """
+    products = Product.objects.filter(stock_shards__gt=0)
+    if product_ids is not None:
+        products = products.filter(pk__in=product_ids)
+    stale = list(
+        products.annotate(shard_stock=Coalesce(shard_stock_expression(), 0))
+        .exclude(stock=F('shard_stock')).values_list('pk', flat=True)
+    )
+    if stale:
+        Product.objects.filter(pk__in=stale).update(stock=Coalesce(shard_stock_expression(), 0), updated_at=Now())
+        invalidate_stock_caches(stale)
+    return len(stale)
+
+
+def enable_stock_sharding(product_id, shard_count=None):
+    """
+    Put a product in high-contention mode: its stock, pending increases
+    included, is split evenly over shard_count StockShard rows that
+    checkouts decrement in parallel. Called again, it re-splits the
+    current total over the new count. Returns the total.
+    """
+    shard_count = shard_count or default_shard_count()
+    settle_movements(product_ids=[product_id])
+    with transaction.atomic():
+        # Shards before the product row, the order checkouts lock them in
+        shards = list(
+            StockShard.objects.select_for_update().filter(product_id=product_id).values_list('quantity', flat=True)
+        )
+        product = Product.objects.select_for_update().get(pk=product_id)
+        total = sum(shards) if product.stock_shards else product.stock
+        replace_shards(product_id, split(total, shard_count))
+        Product.objects.filter(pk=product_id).update(stock=total, stock_shards=shard_count, updated_at=Now())
+    invalidate_stock_caches([product_id])
+    return total
+
+
+def disable_stock_sharding(product_id):
+    """Fold a product's shards back into Product.stock. Returns the total"""
+    with transaction.atomic():
+        shards = list(
+            StockShard.objects.select_for_update().filter(product_id=product_id).values_list('quantity', flat=True)
+        )
+        total = sum(shards)
+        StockShard.objects.filter(product_id=product_id).delete()
+        updated = Product.objects.filter(pk=product_id, stock_shards__gt=0).update(
+            stock=total, stock_shards=0, updated_at=Now()
+        )
+    if updated:
+        invalidate_stock_caches([product_id])
+    return total
+
+
+def rebalance_stock_shards(product_id):
+    """
+    Even out a high-contention product's shards, which drift apart as
+    checkouts drain some faster than others; near-empty shards push
+    checkouts onto the slower fallback paths. Returns the total.
+    """
+    with transaction.atomic():
+        shards = list(
+            StockShard.objects.select_for_update().filter(product_id=product_id)
+            .order_by('index').values_list('pk', 'quantity')
+        )
+        total = sum(quantity for _, quantity in shards)
+        for (pk, quantity), target in zip(shards, split(total, len(shards))):
+            if quantity != target:
+                StockShard.objects.filter(pk=pk).update(quantity=target)
+    refresh_sharded_stock([product_id])
+    return total
+
+
+def pending_stock_expression():
+    """Sum of a product's unsettled deltas, read from the partial pending index"""
+    return Coalesce(
+        Subquery(
+            InventoryMovement.objects.filter(product=OuterRef('pk'), settled=False)
+            .order_by().values('product').annotate(total=Sum('delta')).values('total')
+        ),
+        0,
+        output_field=IntegerField()
+    )
+
+
+def with_available_stock(queryset):
+    """
+    Annotate pending_stock and available (stock + pending - held by carts),
+    reading the stock of high-contention products from their shards
+    """
+    return queryset.annotate(pending_stock=pending_stock_expression()).annotate(
+        available=Coalesce(shard_stock_expression(), F('stock')) + F('pending_stock') - F('reserved_stock')
+    )
+
+
+def current_available(product_id):
+    """Units that can be sold now: the base or sharded stock plus unsettled deltas, less cart holds"""
+    return with_available_stock(Product.objects.filter(pk=product_id)).values_list('available', flat=True).first()
+
+
+def lock_stock(product_id):
+    """Lock a product's stock until the transaction ends, shards before the product row as checkouts do"""
+    list(StockShard.objects.select_for_update().filter(product_id=product_id).values_list('pk', flat=True))
+    Product.objects.select_for_update().filter(pk=product_id).values_list('pk', flat=True).first()
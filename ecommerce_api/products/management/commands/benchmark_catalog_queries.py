@@ -0,0 +1,126 @@
+import re
+import statistics
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from orders.models import Order
+from products.models import Category, Product
+from users.models import Address, User
+
+# Indexes added for the hot catalog, order and address queries
+BENCHMARK_INDEXES = (
+    'products_active_created_idx',
+    'products_active_price_idx',
+    'products_active_name_idx',
+    'products_cat_created_idx',
+    'products_cat_price_idx',
+    'products_in_stock_created_idx',
+    'orders_user_status_created_idx',
+    'addresses_user_active_idx',
+)
+
+EXECUTION_TIME = re.compile(r'Execution Time: ([\d.]+) ms')
+SCAN_NODE = re.compile(r'((?:Parallel )?(?:Seq|Index Only|Index|Bitmap Heap|Bitmap Index) Scan(?: \w+)*? on \S+)')
+
+
+def scan_nodes(plan):
+    """Summarize which scans (and indexes) a plan used"""
+    return ', '.join(SCAN_NODE.findall(plan)) or plan.splitlines()[0].strip()
+
+
+class Command(BaseCommand):
+    """EXPLAIN ANALYZE the hot catalog, order and address queries"""
+    help = (
+        'Run EXPLAIN ANALYZE on the hot list queries and report the plan and '
+        'execution time. --compare also runs them with the benchmark indexes '
+        'dropped inside a rolled back transaction (this locks the tables, so '
+        'do not use it against production).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='Executions per query; the median is reported')
+        parser.add_argument('--page-size', type=int, default=10, help='LIMIT used by the list queries')
+        parser.add_argument('--min-price', type=Decimal, default=Decimal('10'))
+        parser.add_argument('--max-price', type=Decimal, default=Decimal('100'))
+        parser.add_argument(
+            '--compare',
+            action='store_true',
+            help='Also measure each query without the benchmark indexes'
+        )
+
+    def hot_queries(self, options):
+        """(label, queryset) pairs mirroring the API's list endpoints"""
+        limit = options['page_size']
+        category_id = Category.objects.order_by('-active_product_count').values_list('pk', flat=True).first()
+        user_id = (
+            Order.objects.order_by('-created_at').values_list('user', flat=True).first()
+            or User.objects.values_list('pk', flat=True).first()
+        )
+        active = Product.objects.filter(is_active=True)
+
+        queries = [
+            ('products newest', active.order_by('-created_at', '-id')[:limit]),
+            ('products by price', active.order_by('price', 'id')[:limit]),
+            ('products by name', active.order_by('name', 'id')[:limit]),
+            (
+                'products price range',
+                active.filter(price__gte=options['min_price'], price__lte=options['max_price'])
+                .order_by('price', 'id')[:limit]
+            ),
+            ('products in stock', active.filter(stock__gt=0).order_by('-created_at', '-id')[:limit]),
+        ]
+        if category_id is not None:
+            queries += [
+                ('category newest', active.filter(category_id=category_id).order_by('-created_at', '-id')[:limit]),
+                ('category by price', active.filter(category_id=category_id).order_by('price', 'id')[:limit]),
+            ]
+        if user_id is not None:
+            queries += [
+                ('user orders by status', Order.objects.filter(user_id=user_id, status='pending')[:limit]),
+                ('user active addresses', Address.objects.filter(user_id=user_id, is_active=True)),
+            ]
+        return queries
+
+    def measure(self, queryset, runs):
+        """Median execution time in ms, plus the last plan"""
+        timings = []
+        plan = ''
+        for _ in range(runs):
+            plan = queryset.explain(analyze=True, buffers=True)
+            match = EXECUTION_TIME.search(plan)
+            if match:
+                timings.append(float(match.group(1)))
+        return (statistics.median(timings) if timings else None), plan
+
+    def measure_all(self, queries, runs):
+        return {label: self.measure(queryset, runs) for label, queryset in queries}
+
+    def measure_without_indexes(self, queries, runs):
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                for name in BENCHMARK_INDEXES:
+                    cursor.execute(f'DROP INDEX IF EXISTS {connection.ops.quote_name(name)}')
+            results = self.measure_all(queries, runs)
+            transaction.set_rollback(True)
+        return results
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('This benchmark needs PostgreSQL')
+        if options['runs'] < 1:
+            raise CommandError('--runs must be at least 1')
+
+        queries = self.hot_queries(options)
+        after = self.measure_all(queries, options['runs'])
+        before = self.measure_without_indexes(queries, options['runs']) if options['compare'] else {}
+
+        for label, _ in queries:
+            elapsed, plan = after[label]
+            self.stdout.write(f'{label:<24} {elapsed:>9.3f} ms  {scan_nodes(plan)}')
+            if label in before:
+                before_elapsed, before_plan = before[label]
+                self.stdout.write(f'{"  without indexes":<24} {before_elapsed:>9.3f} ms  {scan_nodes(before_plan)}')
+            if options['verbosity'] > 1:
+                self.stdout.write(plan + '\n')
+
+        self.stdout.write(self.style.SUCCESS(f'Benchmarked {len(queries)} queries'))
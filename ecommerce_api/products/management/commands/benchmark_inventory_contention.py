@@ -0,0 +1,105 @@
+import statistics
+import threading
+import time
+import uuid
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import F
+from products.inventory import add_stock, settle_movements
+from products.models import Category, InventoryMovement, Product
+
+
+class Command(BaseCommand):
+    """Compare in-place stock writes with ledger appends on one hot product"""
+    help = (
+        'Run concurrent stock increases against a temporary product, first as '
+        'in-place UPDATEs of Product.stock and then as InventoryMovement rows, '
+        'and report throughput and latency. --hold-ms keeps each transaction '
+        'open after the write, like a cancellation writing its status history.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=20, help='Concurrent connections')
+        parser.add_argument('--operations', type=int, default=20, help='Stock increases per worker')
+        parser.add_argument('--hold-ms', type=float, default=5.0, help='Work done after the write, per transaction')
+
+    def run_workers(self, operation, options):
+        """Run operation() concurrently; return (elapsed seconds, per-operation latencies)"""
+        barrier = threading.Barrier(options['workers'])
+        latencies = []
+        latencies_lock = threading.Lock()
+        hold = options['hold_ms'] / 1000
+        errors = []
+
+        def worker():
+            timings = []
+            try:
+                barrier.wait()
+                for _ in range(options['operations']):
+                    started = time.perf_counter()
+                    with transaction.atomic():
+                        operation()
+                        time.sleep(hold)
+                    timings.append(time.perf_counter() - started)
+            except Exception as exc:  # reported after the run
+                errors.append(exc)
+            finally:
+                connection.close()
+            with latencies_lock:
+                latencies.extend(timings)
+
+        threads = [threading.Thread(target=worker) for _ in range(options['workers'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise CommandError(f'{len(errors)} workers failed: {errors[0]}')
+        return time.perf_counter() - started, latencies
+
+    def report(self, label, elapsed, latencies):
+        self.stdout.write(
+            f'{label:<10} {len(latencies) / elapsed:>9.1f} ops/s   '
+            f'median {statistics.median(latencies) * 1000:>7.2f} ms   '
+            f'max {max(latencies) * 1000:>8.2f} ms'
+        )
+
+    def handle(self, *args, **options):
+        if min(options['workers'], options['operations']) < 1 or options['hold_ms'] < 0:
+            raise CommandError('--workers and --operations must be at least 1 and --hold-ms not negative')
+
+        suffix = uuid.uuid4().hex[:8]
+        category = Category.objects.create(name=f'Benchmark {suffix}', slug=f'benchmark-{suffix}', is_active=False)
+        product = Product.objects.create(
+            name=f'Benchmark {suffix}', slug=f'benchmark-{suffix}', description='Inventory benchmark',
+            category=category, price=1, stock=0, is_active=False
+        )
+        try:
+            in_place = self.run_workers(
+                lambda: Product.objects.filter(pk=product.pk).update(stock=F('stock') + 1),
+                options
+            )
+            ledger = self.run_workers(
+                lambda: add_stock({product.pk: 1}, InventoryMovement.RESTOCK, 'benchmark'),
+                options
+            )
+
+            started = time.perf_counter()
+            settled = settle_movements(product_ids=[product.pk])
+            settle_ms = (time.perf_counter() - started) * 1000
+
+            self.report('in-place', *in_place)
+            self.report('ledger', *ledger)
+            self.stdout.write(f'settled {settled} movements in {settle_ms:.2f} ms')
+
+            product.refresh_from_db(fields=['stock'])
+            expected = 2 * options['workers'] * options['operations']
+            if product.stock != expected:
+                raise CommandError(f'Stock is {product.stock}, expected {expected}')
+        finally:
+            product.delete()
+            category.delete()
+
+        speedup = (len(ledger[1]) / ledger[0]) / (len(in_place[1]) / in_place[0])
+        self.stdout.write(self.style.SUCCESS(f'Ledger appends ran {speedup:.1f}x the in-place throughput'))
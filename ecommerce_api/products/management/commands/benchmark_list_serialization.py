@@ -0,0 +1,76 @@
+import statistics
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from orders.models import Order
+from orders.serializers import OrderListSerializer
+from products.models import Product
+from products.rows import row_serializer
+from products.serializers import ProductListSerializer
+
+
+class Command(BaseCommand):
+    """Time ModelSerializer against values() row serialization for list pages"""
+    help = (
+        'Fetch, serialize and render list pages of products and orders through '
+        'the ModelSerializers and through the compiled values() row path, check '
+        'that both render the same bytes, and report the median times.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100, help='Rows per list page')
+        parser.add_argument('--runs', type=int, default=20, help='Repetitions; the median is reported')
+
+    def cases(self, limit):
+        """(label, queryset, serializer class) pairs mirroring the list endpoints"""
+        return [
+            (
+                'products',
+                Product.objects.filter(is_active=True).select_related('category').order_by('-created_at')[:limit],
+                ProductListSerializer
+            ),
+            ('orders', Order.objects.order_by('-created_at')[:limit], OrderListSerializer),
+        ]
+
+    def time_runs(self, render, runs):
+        timings = []
+        body = None
+        for _ in range(runs):
+            started = time.perf_counter()
+            body = render()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings), body
+
+    def handle(self, *args, **options):
+        if options['rows'] < 1 or options['runs'] < 1:
+            raise CommandError('--rows and --runs must be at least 1')
+
+        renderer = JSONRenderer()
+        # Image URLs are built absolute, as on the endpoints
+        host = next((host for host in settings.ALLOWED_HOSTS if host and '*' not in host), 'localhost').lstrip('.')
+        request = Request(APIRequestFactory().get('/', HTTP_HOST=host))
+        for label, queryset, serializer_class in self.cases(options['rows']):
+            context = {'request': request}
+            rows = row_serializer(serializer_class(context=context))
+
+            def with_serializer():
+                return renderer.render(serializer_class(queryset.all(), many=True, context=context).data)
+
+            def with_rows():
+                return renderer.render(rows.serialize(rows.values(queryset.all()), request))
+
+            serializer_ms, expected = self.time_runs(with_serializer, options['runs'])
+            rows_ms, actual = self.time_runs(with_rows, options['runs'])
+            if actual != expected:
+                raise CommandError(f'{label}: row serialization output differs from {serializer_class.__name__}')
+
+            speedup = serializer_ms / rows_ms if rows_ms else float('inf')
+            self.stdout.write(
+                f'{label:<10} {serializer_class.__name__:<24} {serializer_ms:>9.3f} ms   '
+                f'rows {rows_ms:>9.3f} ms   {speedup:>5.1f}x  ({len(expected)} bytes)'
+            )
+
+        self.stdout.write(self.style.SUCCESS('Benchmarked list serialization'))
@@ -0,0 +1,107 @@
+import statistics
+import threading
+import time
+import uuid
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from products.inventory import (
+    InsufficientStock,
+    decrement_stock,
+    enable_stock_sharding,
+    refresh_sharded_stock
+)
+from products.models import Category, Product
+
+
+class Command(BaseCommand):
+    """Compare checkout throughput on one SKU with and without stock shards"""
+    help = (
+        'Run concurrent single-unit checkouts of a temporary product, first '
+        'against Product.stock and then with its stock split into shards, and '
+        'report orders per second. --hold-ms keeps each checkout transaction '
+        'open after the decrement, as writing the order, its items and payment does.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=20, help='Concurrent connections')
+        parser.add_argument('--orders', type=int, default=20, help='Checkouts per worker')
+        parser.add_argument('--shards', type=int, default=8, help='Stock shards in high-contention mode')
+        parser.add_argument('--hold-ms', type=float, default=5.0, help='Work done after the decrement, per checkout')
+
+    def run_checkouts(self, product_id, options):
+        """Run the checkouts concurrently; return (elapsed seconds, latencies, failed checkouts)"""
+        barrier = threading.Barrier(options['workers'])
+        latencies = []
+        failures = []
+        results_lock = threading.Lock()
+        hold = options['hold_ms'] / 1000
+        errors = []
+
+        def worker():
+            timings = []
+            failed = 0
+            try:
+                barrier.wait()
+                for _ in range(options['orders']):
+                    started = time.perf_counter()
+                    try:
+                        with transaction.atomic():
+                            decrement_stock({product_id: 1}, reference='benchmark')
+                            time.sleep(hold)
+                    except InsufficientStock:
+                        failed += 1
+                    timings.append(time.perf_counter() - started)
+            except Exception as exc:  # reported after the run
+                errors.append(exc)
+            finally:
+                connection.close()
+            with results_lock:
+                latencies.extend(timings)
+                failures.append(failed)
+
+        threads = [threading.Thread(target=worker) for _ in range(options['workers'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise CommandError(f'{len(errors)} workers failed: {errors[0]}')
+        return time.perf_counter() - started, latencies, sum(failures)
+
+    def report(self, label, elapsed, latencies, failed):
+        self.stdout.write(
+            f'{label:<10} {(len(latencies) - failed) / elapsed:>9.1f} orders/s   '
+            f'median {statistics.median(latencies) * 1000:>7.2f} ms   '
+            f'max {max(latencies) * 1000:>8.2f} ms   {failed} out of stock'
+        )
+
+    def handle(self, *args, **options):
+        if min(options['workers'], options['orders'], options['shards']) < 1 or options['hold_ms'] < 0:
+            raise CommandError('--workers, --orders and --shards must be at least 1 and --hold-ms not negative')
+
+        checkouts = options['workers'] * options['orders']
+        suffix = uuid.uuid4().hex[:8]
+        category = Category.objects.create(name=f'Benchmark {suffix}', slug=f'benchmark-{suffix}', is_active=False)
+        product = Product.objects.create(
+            name=f'Benchmark {suffix}', slug=f'benchmark-{suffix}', description='Stock sharding benchmark',
+            category=category, price=1, stock=2 * checkouts, is_active=False
+        )
+        try:
+            single_row = self.run_checkouts(product.pk, options)
+            enable_stock_sharding(product.pk, options['shards'])
+            sharded = self.run_checkouts(product.pk, options)
+            refresh_sharded_stock([product.pk])
+
+            self.report('single row', *single_row)
+            self.report(f'{options["shards"]} shards', *sharded)
+
+            product.refresh_from_db(fields=['stock'])
+            if single_row[2] or sharded[2] or product.stock != 0:
+                raise CommandError(f'Stock ended at {product.stock} with checkouts failing; expected 0')
+        finally:
+            product.delete()
+            category.delete()
+
+        speedup = (checkouts / sharded[0]) / (checkouts / single_row[0])
+        self.stdout.write(self.style.SUCCESS(f'Sharded checkouts ran {speedup:.1f}x the single-row throughput'))
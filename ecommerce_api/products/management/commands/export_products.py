@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from products.exporter import EXPORT_FORMATS, iter_export, parse_updated_since
+
+
+class Command(BaseCommand):
+    """Stream the product catalog to a file or stdout"""
+    help = 'Export products with category names and rating aggregates as NDJSON or CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='ndjson', help='Output format')
+        parser.add_argument('--output', default='-', help="Output file, or '-' for stdout")
+        parser.add_argument('--updated-since', help='Only export products updated at or after this ISO date/time')
+
+    def handle(self, *args, **options):
+        try:
+            updated_since = parse_updated_since(options['updated_since'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        chunks = iter_export(options['format'], updated_since=updated_since)
+        if options['output'] == '-':
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+
+        count = 0
+        with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+            for chunk in chunks:
+                output.write(chunk)
+                count += 1
+
+        if options['format'] == 'csv':
+            count -= 1  # header line
+        self.stderr.write(self.style.SUCCESS(f"Exported {count} products to {options['output']}"))
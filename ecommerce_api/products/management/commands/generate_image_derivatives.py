@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from products.models import Product, ProductImage
+from products.tasks import generate_image_derivatives
+
+
+class Command(BaseCommand):
+    """Queue thumbnail/WebP generation for images that have no derivatives yet"""
+    help = 'Queue background image derivative generation for products and gallery images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Regenerate derivatives for every image')
+
+    def handle(self, *args, **options):
+        queued = 0
+        for model in (Product, ProductImage):
+            queryset = model.objects.exclude(image='').exclude(image__isnull=True)
+            if not options['all']:
+                queryset = queryset.filter(thumbnail__isnull=True)
+
+            for pk in queryset.values_list('pk', flat=True).iterator():
+                generate_image_derivatives.delay(model._meta.label, pk)
+                queued += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Queued image derivatives for {queued} images'))
@@ -0,0 +1,44 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from products.importer import IMPORT_FORMATS, ProductImporter, detect_format
+
+
+class Command(BaseCommand):
+    """Bulk import products from a CSV or JSONL file"""
+    help = 'Stream products from CSV/JSONL and upsert them by slug in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Input file, or '-' to read from stdin")
+        parser.add_argument('--format', choices=IMPORT_FORMATS, help='Input format (default: from file extension)')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows upserted per transaction')
+        parser.add_argument(
+            '--create-categories',
+            action='store_true',
+            help='Create categories that do not exist yet instead of rejecting the row'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or detect_format(path)
+        importer = ProductImporter(
+            chunk_size=options['chunk_size'],
+            create_categories=options['create_categories']
+        )
+
+        try:
+            if path == '-':
+                report = importer.run(sys.stdin, file_format)
+            else:
+                with open(path, newline='', encoding='utf-8') as stream:
+                    report = importer.run(stream, file_format)
+        except OSError as exc:
+            raise CommandError(str(exc))
+
+        for error in report['errors']:
+            self.stderr.write(f"Row {error['row']}: {error['error']}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {report['imported']} of {report['processed']} rows "
+            f"({report['failed']} failed) in {report['elapsed_seconds']}s "
+            f"- {report['rows_per_second']} rows/sec"
+        ))
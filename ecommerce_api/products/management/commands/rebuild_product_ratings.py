@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from products.models import RATING_HISTOGRAM_FIELDS, Product
+from products.aggregates import rebuild_rating_aggregates
+from products.caching import PRODUCT_LIST_VERSION_KEY, bump_product_versions, bump_tags, bump_versions, product_tag
+from products.tasks import schedule_featured_feed_rebuild
+
+AGGREGATE_FIELDS = ('rating_sum', 'review_count', 'average_rating', *RATING_HISTOGRAM_FIELDS.values())
+
+
+class Command(BaseCommand):
+    """Rebuild denormalized rating aggregates and histograms on all products"""
+    help = 'Recompute average_rating, review_count, rating_sum and the star histogram from reviews'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Number of products updated per transaction'
+        )
+
+    def aggregates(self, products):
+        return {row[0]: row[1:] for row in products.values_list('pk', *AGGREGATE_FIELDS)}
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        ids = Product.objects.order_by('pk').values_list('pk', flat=True)
+        last_id = 0
+        updated = 0
+        changed = 0
+
+        while True:
+            batch = list(ids.filter(pk__gt=last_id)[:batch_size])
+            if not batch:
+                break
+
+            products = Product.objects.filter(pk__gte=batch[0], pk__lte=batch[-1])
+            with transaction.atomic():
+                before = self.aggregates(products)
+                updated += rebuild_rating_aggregates(products)
+                # Cached details, pages and their ETags show the aggregates
+                fixed = [pk for pk, row in self.aggregates(products).items() if row != before.get(pk)]
+                bump_product_versions(Product.objects.filter(pk__in=fixed).values_list('slug', flat=True))
+                bump_tags(product_tag(pk) for pk in fixed)
+            changed += len(fixed)
+            last_id = batch[-1]
+
+        if changed:
+            bump_versions([PRODUCT_LIST_VERSION_KEY])
+            schedule_featured_feed_rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt rating aggregates for {updated} products, {changed} of them had drifted'
+        ))
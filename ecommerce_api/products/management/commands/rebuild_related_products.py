@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from products.related import (
+    MAX_PRODUCT_PAIRS,
+    ORDER_LINES_PER_BATCH,
+    RELATED_PRODUCTS_TOP_K,
+    rebuild_related_products
+)
+
+
+class Command(BaseCommand):
+    """Rebuild the frequently bought together table from order history"""
+    help = 'Recompute the top related products per product from co-purchases in past orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=RELATED_PRODUCTS_TOP_K, help='Neighbours stored per product')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=ORDER_LINES_PER_BATCH,
+            help='Order lines turned into one incidence matrix at a time'
+        )
+        parser.add_argument(
+            '--max-pairs',
+            type=int,
+            default=MAX_PRODUCT_PAIRS,
+            help='Distinct product pairs kept in memory before the rarest are dropped'
+        )
+
+    def handle(self, *args, **options):
+        if min(options['top_k'], options['batch_size'], options['max_pairs']) < 1:
+            raise CommandError('--top-k, --batch-size and --max-pairs must be at least 1')
+
+        written = rebuild_related_products(options['top_k'], options['batch_size'], options['max_pairs'])
+        self.stdout.write(self.style.SUCCESS(f'Stored {written} related product rows'))
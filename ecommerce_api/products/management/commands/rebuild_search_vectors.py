@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from products.models import Product
+from products.search import refresh_search_vectors
+
+
+class Command(BaseCommand):
+    """Rebuild the stored full-text search vectors on all products"""
+    help = 'Recompute Product.search_vector from name, category and description'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Number of products updated per transaction'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        ids = Product.objects.order_by('pk').values_list('pk', flat=True)
+        last_id = 0
+        updated = 0
+
+        while True:
+            batch = list(ids.filter(pk__gt=last_id)[:batch_size])
+            if not batch:
+                break
+
+            with transaction.atomic():
+                updated += refresh_search_vectors(
+                    Product.objects.filter(pk__gte=batch[0], pk__lte=batch[-1])
+                )
+            last_id = batch[-1]
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt search vectors for {updated} products'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from products.aggregates import rebuild_category_counts
+from products.caching import CATEGORY_LIST_VERSION_KEY, bump_versions
+
+
+class Command(BaseCommand):
+    """Fix drift in the active product counters on categories"""
+    help = 'Recompute active_product_count for every category'
+
+    def handle(self, *args, **options):
+        updated = rebuild_category_counts()
+        if updated:
+            # The cached category list and its ETag show the counters
+            bump_versions([CATEGORY_LIST_VERSION_KEY])
+        self.stdout.write(self.style.SUCCESS(f'Reconciled product counts for {updated} categories'))
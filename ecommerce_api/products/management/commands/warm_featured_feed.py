@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from products.feeds import build_featured_feed
+
+
+class Command(BaseCommand):
+    """Render the featured products feed into the cache"""
+    help = 'Pre-serialize every page of the featured products listing (run on deploy)'
+
+    def handle(self, *args, **options):
+        pages = build_featured_feed()
+        self.stdout.write(self.style.SUCCESS(f'Warmed {pages} featured feed page(s)'))
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:32
+
+from django.db import migrations, models
+from django.db.models import Count, FloatField, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf, Round
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    Review = apps.get_model('products', 'Review')
+
+    reviews = Review.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    rating_sum = Coalesce(
+        Subquery(reviews.annotate(total=Sum('rating')).values('total')), 0, output_field=IntegerField()
+    )
+    review_count = Coalesce(
+        Subquery(reviews.annotate(total=Count('id')).values('total')), 0, output_field=IntegerField()
+    )
+    Product.objects.update(
+        rating_sum=rating_sum,
+        review_count=review_count,
+        average_rating=Coalesce(
+            Round(Cast(rating_sum, FloatField()) / NullIf(review_count, 0), 1),
+            Value(0.0),
+            output_field=FloatField()
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='average_rating',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_product_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='image_webp',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='products/webp/'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='image_webp_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='image_webp_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='thumbnail',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='products/thumbnails/'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='thumbnail_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='thumbnail_webp',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='products/thumbnails/'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='thumbnail_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='image_webp',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='products/webp/'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='image_webp_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='image_webp_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='thumbnail',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='products/thumbnails/'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='thumbnail_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='thumbnail_webp',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='products/thumbnails/'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='thumbnail_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:46
+
+from django.contrib.postgres.operations import AddIndexConcurrently, RemoveIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Build the indexes without blocking writes to large tables
+    atomic = False
+
+    dependencies = [
+        ('products', '0008_product_rating_histogram'),
+    ]
+
+    operations = [
+        RemoveIndexConcurrently(
+            model_name='product',
+            name='products_created_id_idx',
+        ),
+        RemoveIndexConcurrently(
+            model_name='product',
+            name='products_price_id_idx',
+        ),
+        RemoveIndexConcurrently(
+            model_name='product',
+            name='products_name_id_idx',
+        ),
+        AddIndexConcurrently(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['created_at', 'id'], name='products_active_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['price', 'id'], name='products_active_price_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['name', 'id'], name='products_active_name_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['category', 'created_at', 'id'], name='products_cat_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['category', 'price', 'id'], name='products_cat_price_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True), ('stock__gt', 0)), fields=['created_at', 'id'], name='products_in_stock_created_idx'),
+        ),
+    ]
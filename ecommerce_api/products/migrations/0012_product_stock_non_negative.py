@@ -0,0 +1,24 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:06
+
+from django.db import migrations, models
+
+
+def clamp_negative_stock(apps, schema_editor):
+    # Racy read-modify-write checkouts could leave stock below zero
+    Product = apps.get_model('products', 'Product')
+    Product.objects.filter(stock__lt=0).update(stock=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0011_product_reserved_stock'),
+    ]
+
+    operations = [
+        migrations.RunPython(clamp_negative_stock, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='product',
+            constraint=models.CheckConstraint(check=models.Q(('stock__gte', 0)), name='products_stock_non_negative'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0012_product_stock_non_negative'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('delta', models.IntegerField()),
+                ('reason', models.CharField(choices=[('order', 'Order'), ('cancel', 'Cancel'), ('restock', 'Restock'), ('adjustment', 'Adjustment')], max_length=20)),
+                ('reference', models.CharField(blank=True, max_length=50)),
+                ('settled', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inventory_movements', to='products.product')),
+            ],
+            options={
+                'db_table': 'inventory_movements',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(condition=models.Q(('settled', False)), fields=['product', 'id'], name='inventory_pending_idx'), models.Index(fields=['product', '-created_at'], name='inventory_product_created_idx')],
+            },
+        ),
+    ]
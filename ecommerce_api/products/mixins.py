@@ -0,0 +1,31 @@
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+class ConditionalGetMixin:
+    """
+    Answer If-None-Match / If-Modified-Since on GET with 304 Not Modified.
+
+    Views return a cache version stamp from get_cache_version(); since the
+    stamps are nanosecond timestamps, both the ETag and Last-Modified come
+    from it without touching the database or serializing the body.
+    """
+    etag_prefix = None
+
+    def get_cache_version(self, request, *args, **kwargs):
+        raise NotImplementedError
+
+    def get(self, request, *args, **kwargs):
+        version = self.get_cache_version(request, *args, **kwargs)
+        etag = quote_etag(f'{self.etag_prefix}-{version}')
+        last_modified = version // 10 ** 9
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
@@ -1,4 +1,7 @@
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
+from django.db.models import Q
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils.text import slugify
 
@@ -10,6 +13,10 @@ class Category(models.Model):
     description = models.TextField(blank=True)
     image = models.ImageField(upload_to='categories/', blank=True, null=True)
     is_active = models.BooleanField(default=True)
+    
+    # Counter cache of active products (maintained by products.signals)
+    active_product_count = models.PositiveIntegerField(default=0, editable=False)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -27,7 +34,25 @@ class Category(models.Model):
         super().save(*args, **kwargs)
         
         
-class Product(models.Model):
+class ImageVariants(models.Model):
+    """Derived copies of `image`, generated in the background by products.tasks"""
+    thumbnail = models.ImageField(upload_to='products/thumbnails/', blank=True, null=True, editable=False)
+    thumbnail_webp = models.ImageField(upload_to='products/thumbnails/', blank=True, null=True, editable=False)
+    thumbnail_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    thumbnail_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_webp = models.ImageField(upload_to='products/webp/', blank=True, null=True, editable=False)
+    image_webp_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_webp_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    
+    class Meta:
+        abstract = True
+        
+        
+# Product counter column for each star rating
+RATING_HISTOGRAM_FIELDS = {rating: f'rating_{rating}_count' for rating in range(1, 6)}
+
+
+class Product(ImageVariants):
     """Prodeuct model"""
     name = models.CharField(max_length=200)
     slug = models.SlugField(max_length=200, unique=True, blank=True)
@@ -47,9 +72,28 @@ class Product(models.Model):
         default=0,
         validators=[MinValueValidator(0)]
     )
+    # Units held by carts (maintained by cart.reservations)
+    reserved_stock = models.PositiveIntegerField(default=0, editable=False)
+    # High-contention mode: stock lives in this many StockShard rows and
+    # `stock` is a periodically refreshed total (see products.sharding)
+    stock_shards = models.PositiveSmallIntegerField(default=0, editable=False)
     image = models.ImageField(upload_to='products/', blank=True, null=True)
     is_active = models.BooleanField(default=True)
     is_featured = models.BooleanField(default=False)
+    
+    # Review aggregates (maintained by products.signals)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    average_rating = models.FloatField(default=0, editable=False)
+    rating_1_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_2_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_3_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_4_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_5_count = models.PositiveIntegerField(default=0, editable=False)
+    
+    # Full-text search document (maintained by products.signals)
+    search_vector = SearchVectorField(null=True, editable=False)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -60,6 +104,33 @@ class Product(models.Model):
             models.Index(fields=['slug']),
             models.Index(fields=['category']),
             models.Index(fields=['is_active', 'is_featured']),
+            # Catalog listings only ever read active products, so these are
+            # partial: (ordering field, id) for keyset pages, led by category
+            # or restricted to in-stock rows for the common filters
+            models.Index(fields=['created_at', 'id'], name='products_active_created_idx', condition=Q(is_active=True)),
+            models.Index(fields=['price', 'id'], name='products_active_price_idx', condition=Q(is_active=True)),
+            models.Index(fields=['name', 'id'], name='products_active_name_idx', condition=Q(is_active=True)),
+            models.Index(
+                fields=['category', 'created_at', 'id'],
+                name='products_cat_created_idx',
+                condition=Q(is_active=True)
+            ),
+            models.Index(
+                fields=['category', 'price', 'id'],
+                name='products_cat_price_idx',
+                condition=Q(is_active=True)
+            ),
+            models.Index(
+                fields=['created_at', 'id'],
+                name='products_in_stock_created_idx',
+                condition=Q(is_active=True, stock__gt=0)
+            ),
+            GinIndex(fields=['search_vector'], name='products_search_vector_gin'),
+            GinIndex(fields=['name'], name='products_name_trgm', opclasses=['gin_trgm_ops']),
+        ]
+        constraints = [
+            # Backstop for products.inventory's conditional decrements
+            models.CheckConstraint(check=Q(stock__gte=0), name='products_stock_non_negative'),
         ]
     
     def __str__(self):
@@ -68,8 +139,15 @@ class Product(models.Model):
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
-        super().save(*args, **kwargs)
+        # Keep the product write and the category counter update in one transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
         
+    @property
+    def available_stock(self):
+        """Stock not held by carts"""
+        return max(self.stock - self.reserved_stock, 0)
+    
     @property
     def in_stock(self):
         """ckeck if product is in stock"""
@@ -84,8 +162,13 @@ class Product(models.Model):
             return 'Lon on Stock'
         return 'In Stock'
     
+    @property
+    def rating_histogram(self):
+        """Number of reviews per star rating"""
+        return {str(rating): getattr(self, field) for rating, field in RATING_HISTOGRAM_FIELDS.items()}
+    
     
-class ProductImage(models.Model):
+class ProductImage(ImageVariants):
     """Additional product images"""
     product = models.ForeignKey(
         Product,
@@ -129,8 +212,107 @@ class Review(models.Model):
         db_table = 'review'
         ordering = ['-created_at']
         unique_together = ('product', 'user')
+        indexes = [
+            # Newest-first keyset pages of one product's reviews
+            models.Index(fields=['product', '-created_at', '-id'], name='review_product_created_idx'),
+        ]
         
     def __str__(self):
         return f"{self.product.name} - {self.user.email} ({self.rating} stars)"
+    
+    def save(self, *args, **kwargs):
+        # Keep the review write and the product aggregate update in one transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+    
+    
+class RelatedProduct(models.Model):
+    """Top products bought together with a product, rebuilt from order history"""
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='related_products'
+    )
+    related = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='related_to'
+    )
+    rank = models.PositiveSmallIntegerField()
+    # Number of orders containing both products
+    score = models.PositiveIntegerField()
+    
+    class Meta:
+        db_table = 'related_products'
+        ordering = ['product', 'rank']
+        constraints = [
+            # Also the index serving a product's neighbours in rank order
+            models.UniqueConstraint(fields=['product', 'rank'], name='related_products_product_rank_uniq'),
+        ]
+        
+    def __str__(self):
+        return f"{self.product_id} -> {self.related_id} (#{self.rank})"
+    
+    
+class InventoryMovement(models.Model):
+    """Append-only ledger of signed stock changes (see products.inventory)"""
+    ORDER = 'order'
+    CANCEL = 'cancel'
+    RESTOCK = 'restock'
+    ADJUSTMENT = 'adjustment'
+    
+    REASON_CHOICES = (
+        (ORDER, 'Order'),
+        (CANCEL, 'Cancel'),
+        (RESTOCK, 'Restock'),
+        (ADJUSTMENT, 'Adjustment'),
+    )
+    
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='inventory_movements'
+    )
+    delta = models.IntegerField()
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES)
+    # e.g. the order number
+    reference = models.CharField(max_length=50, blank=True)
+    # Folded into Product.stock; unsettled deltas are pending on top of it
+    settled = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'inventory_movements'
+        ordering = ['-created_at']
+        indexes = [
+            # Pending deltas per product, for "current available" and compaction
+            models.Index(fields=['product', 'id'], name='inventory_pending_idx', condition=Q(settled=False)),
+            # A product's history, newest first
+            models.Index(fields=['product', '-created_at'], name='inventory_product_created_idx'),
+        ]
+        
+    def __str__(self):
+        return f"{self.product_id} {self.delta:+d} ({self.reason})"
+    
+    
+class StockShard(models.Model):
+    """One counter holding part of a high-contention product's stock"""
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='shards'
+    )
+    index = models.PositiveSmallIntegerField()
+    quantity = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        db_table = 'stock_shards'
+        ordering = ['product', 'index']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'index'], name='stock_shards_product_index_uniq'),
+        ]
+        
+    def __str__(self):
+        return f"{self.product_id} shard {self.index}: {self.quantity}"
 
 # Create your models here.
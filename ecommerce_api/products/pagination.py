@@ -0,0 +1,200 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(PageNumberPagination):
+    """
+    Page number pagination with an opt-in keyset (cursor) mode.
+
+    Passing ?pagination=cursor (or a ?cursor= token) pages by the requested
+    ordering plus `id` as a tiebreaker. Every page is a single index range
+    scan, so fetching the next page costs the same at any depth.
+    Passing ?count=false skips the COUNT(*) query in either mode.
+    """
+    keyset_only = False
+    count_by_default = True
+    cursor_query_param = 'cursor'
+    mode_query_param = 'pagination'
+    count_query_param = 'count'
+    ordering_param = 'ordering'
+    default_ordering = '-created_at'
+    tiebreaker = 'id'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        count_param = request.query_params.get(self.count_query_param)
+        if count_param is None:
+            self.include_count = self.count_by_default
+        else:
+            self.include_count = count_param.lower() not in ('false', '0', 'no')
+        self.keyset = (
+            self.keyset_only
+            or self.cursor_query_param in request.query_params
+            or request.query_params.get(self.mode_query_param) == 'cursor'
+        )
+
+        if self.keyset:
+            return self.paginate_keyset(queryset, request, view)
+        if not self.include_count:
+            return self.paginate_without_count(queryset, request)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if not self.keyset and self.include_count:
+            return super().get_paginated_response(data)
+
+        response = OrderedDict()
+        if self.include_count:
+            response['count'] = self.count
+        response['next'] = self.next_link
+        response['previous'] = self.previous_link
+        response['results'] = data
+        return Response(response)
+
+    # Page number mode without COUNT(*)
+
+    def paginate_without_count(self, queryset, request):
+        page_size = self.get_page_size(request)
+        try:
+            page_number = int(request.query_params.get(self.page_query_param, 1))
+        except ValueError:
+            page_number = 0
+        if page_number < 1:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=page_number, message='Invalid page.'
+            ))
+
+        offset = (page_number - 1) * page_size
+        rows = list(queryset[offset:offset + page_size + 1])
+        if not rows and page_number > 1:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=page_number, message='That page contains no results'
+            ))
+
+        url = request.build_absolute_uri()
+        self.next_link = None
+        self.previous_link = None
+        if len(rows) > page_size:
+            self.next_link = replace_query_param(url, self.page_query_param, page_number + 1)
+        if page_number > 1:
+            self.previous_link = (
+                replace_query_param(url, self.page_query_param, page_number - 1)
+                if page_number > 2 else remove_query_param(url, self.page_query_param)
+            )
+        return rows[:page_size]
+
+    # Keyset mode
+
+    def get_keyset_ordering(self, request, view):
+        """Return the requested ordering if the view allows it"""
+        allowed = getattr(view, 'ordering_fields', None) or []
+        requested = request.query_params.get(self.ordering_param, '').split(',')[0].strip()
+        if requested and requested.lstrip('-') in allowed:
+            return requested
+        view_ordering = getattr(view, 'ordering', None)
+        if view_ordering:
+            return view_ordering[0] if isinstance(view_ordering, (list, tuple)) else view_ordering
+        return self.default_ordering
+
+    def paginate_keyset(self, queryset, request, view):
+        page_size = self.get_page_size(request)
+        ordering = self.get_keyset_ordering(request, view)
+        field = ordering.lstrip('-')
+        descending = ordering.startswith('-')
+        position, reverse = self.decode_cursor(request, queryset.model._meta.get_field(field))
+
+        if self.include_count:
+            self.count = queryset.count()
+
+        # Walk backwards for "previous" links by flipping the direction
+        scan_descending = descending != reverse
+        prefix = '-' if scan_descending else ''
+        queryset = queryset.order_by(prefix + field, prefix + self.tiebreaker)
+        if position is not None:
+            queryset = queryset.filter(self.keyset_filter(field, scan_descending, position))
+
+        rows = list(queryset[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+
+        has_next = has_more if not reverse else position is not None
+        has_previous = has_more if reverse else position is not None
+
+        self.next_link = None
+        self.previous_link = None
+        if rows and has_next:
+            self.next_link = self.encode_cursor(self.get_position(rows[-1], field), reverse=False)
+        if rows and has_previous:
+            self.previous_link = self.encode_cursor(self.get_position(rows[0], field), reverse=True)
+        return rows
+
+    def keyset_filter(self, field, descending, position):
+        """
+        Rows strictly after (value, id) in the scan direction. Written as
+        `field >= value AND (field > value OR id > pk)` so the leading
+        condition can seed an index range scan on (field, id).
+        """
+        value, pk = position
+        op = 'lt' if descending else 'gt'
+        return Q(**{f'{field}__{op}e': value}) & (
+            Q(**{f'{field}__{op}': value}) | Q(**{f'{self.tiebreaker}__{op}': pk})
+        )
+
+    def get_position(self, row, field):
+        # Rows are model instances or values() dicts
+        if isinstance(row, dict):
+            value, pk = row[field], row[self.tiebreaker]
+        else:
+            value, pk = getattr(row, field), getattr(row, self.tiebreaker)
+        if isinstance(value, (datetime, date)):
+            value = value.isoformat()
+        elif isinstance(value, Decimal):
+            value = str(value)
+        return [value, pk]
+
+    def encode_cursor(self, position, reverse):
+        token = json.dumps({'p': position, 'r': int(reverse)}, separators=(',', ':'))
+        encoded = base64.urlsafe_b64encode(token.encode('utf-8')).decode('ascii')
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request, model_field):
+        """Return ((value, pk), reverse), the value parsed as model_field; NotFound if tampered with"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            token = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            value, pk = token['p']
+            value = model_field.to_python(value)
+            if value is None:
+                raise ValueError('Cursor value is null')
+            return (value, int(pk)), bool(token.get('r'))
+        except (TypeError, ValueError, KeyError, UnicodeError, binascii.Error, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class ReviewPagination(KeysetPagination):
+    """
+    Keyset-only pagination for product reviews, newest first.
+
+    Served from the (product, -created_at, -id) index. The total is already
+    on Product.review_count, so COUNT(*) only runs with ?count=true.
+    """
+    keyset_only = True
+    count_by_default = False
+    default_ordering = '-created_at'
@@ -0,0 +1,139 @@
+import numpy as np
+from django.db import transaction
+from django.db.models import Max
+from scipy import sparse
+from orders.models import OrderItem
+from .models import Product, RelatedProduct
+
+# Neighbours stored per product
+RELATED_PRODUCTS_TOP_K = 10
+
+# Order lines turned into one incidence matrix at a time
+ORDER_LINES_PER_BATCH = 100000
+
+# Distinct product pairs kept while accumulating; past this the rarest pairs
+# are dropped, which bounds memory at roughly 12 bytes per pair
+MAX_PRODUCT_PAIRS = 5000000
+
+# Orders that do not say anything about what is bought together
+EXCLUDED_ORDER_STATUSES = ('cancelled', 'refund')
+
+INSERT_BATCH_SIZE = 5000
+
+
+def order_lines(max_product_id):
+    """(order id, product id) for every counted order line, grouped by order"""
+    return (
+        OrderItem.objects.filter(Product__isnull=False, Product_id__lte=max_product_id)
+        .exclude(order__status__in=EXCLUDED_ORDER_STATUSES)
+        .order_by('order_id')
+        .values_list('order_id', 'Product_id')
+        .iterator(chunk_size=ORDER_LINES_PER_BATCH)
+    )
+
+
+def order_line_batches(lines, batch_size):
+    """Yield (order ids, product ids) arrays of about batch_size lines, never splitting an order"""
+    orders = []
+    products = []
+    for order_id, product_id in lines:
+        if len(orders) >= batch_size and order_id != orders[-1]:
+            yield np.array(orders, dtype=np.int64), np.array(products, dtype=np.int64)
+            orders = []
+            products = []
+        orders.append(order_id)
+        products.append(product_id)
+    if orders:
+        yield np.array(orders, dtype=np.int64), np.array(products, dtype=np.int64)
+
+
+def co_occurrence(orders, products, size):
+    """Product x product matrix counting the orders in a batch that contain both"""
+    _, rows = np.unique(orders, return_inverse=True)
+    incidence = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.int32), (rows, products)),
+        shape=(rows.max() + 1, size)
+    )
+    # A product on two lines of one order still counts once
+    incidence.data[:] = 1
+    counts = (incidence.T @ incidence).tocsr()
+    counts.setdiag(0)
+    counts.eliminate_zeros()
+    return counts
+
+
+def prune(counts, max_pairs):
+    """Drop the rarest pairs until at most max_pairs remain (ties may keep a few less)"""
+    if counts.nnz <= max_pairs:
+        return counts
+    cutoff = np.partition(counts.data, counts.nnz - max_pairs)[counts.nnz - max_pairs]
+    counts.data[counts.data < cutoff] = 0
+    counts.eliminate_zeros()
+    if counts.nnz > max_pairs:
+        counts.data[counts.data <= cutoff] = 0
+        counts.eliminate_zeros()
+    return counts
+
+
+def top_neighbours(counts, k):
+    """(product, related, rank, score) arrays of each product's k most co-bought products"""
+    counts = counts.tocsr()
+    counts.sort_indices()
+    rows = np.repeat(np.arange(counts.shape[0]), np.diff(counts.indptr))
+    # Per product: highest count first, then lowest id
+    order = np.lexsort((counts.indices, -counts.data, rows))
+    rows = rows[order]
+    ranks = np.arange(len(order)) - counts.indptr[rows]
+    keep = ranks < k
+    return rows[keep], counts.indices[order][keep], ranks[keep] + 1, counts.data[order][keep]
+
+
+def compute_co_occurrence(max_product_id, batch_size=ORDER_LINES_PER_BATCH, max_pairs=MAX_PRODUCT_PAIRS):
+    """Stream the order history into one sparse co-occurrence matrix"""
+    size = max_product_id + 1
+    counts = sparse.csr_matrix((size, size), dtype=np.int32)
+    for orders, products in order_line_batches(order_lines(max_product_id), batch_size):
+        counts = counts + co_occurrence(orders, products, size)
+        # Prune to half the budget so the next batches have room to grow
+        if counts.nnz > max_pairs:
+            counts = prune(counts, max_pairs // 2)
+    return counts
+
+
+def rebuild_related_products(k=RELATED_PRODUCTS_TOP_K, batch_size=ORDER_LINES_PER_BATCH,
+                             max_pairs=MAX_PRODUCT_PAIRS):
+    """
+    Recompute the frequently bought together table from order history.
+
+    Order lines are streamed in batches of whole orders; each batch becomes
+    an order x product incidence matrix B and B.T @ B adds its pair counts
+    to the running total. The top k neighbours per product replace the
+    table in one transaction. Returns the number of rows written.
+    """
+    max_product_id = Product.objects.aggregate(last=Max('id'))['last']
+    if max_product_id is None:
+        RelatedProduct.objects.all().delete()
+        return 0
+
+    counts = compute_co_occurrence(max_product_id, batch_size, max_pairs)
+    products, related, ranks, scores = top_neighbours(counts, k)
+
+    # Products deleted while the history was being read
+    existing = np.fromiter(Product.objects.values_list('id', flat=True).iterator(), dtype=np.int64)
+    keep = np.isin(products, existing) & np.isin(related, existing)
+    rows = zip(products[keep].tolist(), related[keep].tolist(), ranks[keep].tolist(), scores[keep].tolist())
+
+    with transaction.atomic():
+        RelatedProduct.objects.all().delete()
+        written = 0
+        batch = []
+        for product_id, related_id, rank, score in rows:
+            batch.append(RelatedProduct(product_id=product_id, related_id=related_id, rank=rank, score=score))
+            if len(batch) >= INSERT_BATCH_SIZE:
+                RelatedProduct.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        if batch:
+            RelatedProduct.objects.bulk_create(batch)
+            written += len(batch)
+    return written
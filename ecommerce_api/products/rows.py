@@ -0,0 +1,180 @@
+from functools import lru_cache
+from types import SimpleNamespace
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.db.models.fields.files import FileField as ModelFileField
+from rest_framework import relations, serializers
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+# Compiled (serializer class, field set) pairs kept; ?fields= can ask for
+# any subset of the declared fields, so the cache has to be bounded
+ROW_SERIALIZER_CACHE_SIZE = 128
+
+# Fields whose to_representation() returns a column value from values() as is
+PASSTHROUGH_FIELDS = (
+    serializers.BooleanField,
+    serializers.CharField,
+    serializers.ChoiceField,
+    serializers.FloatField,
+    serializers.IntegerField,
+    serializers.ReadOnlyField,
+    relations.PrimaryKeyRelatedField,
+)
+
+
+class RowSerializer:
+    """
+    Read-only serializer compiled for values() rows of a ModelSerializer.
+
+    Each field becomes a (name, key, convert) step: columns read straight
+    from the row, relations through `__` lookups, model properties through
+    their getter on the columns listed in Meta.fieldset_requires, and
+    Meta.row_annotations supply values that are not columns (e.g. counts).
+    Only the columns the fields read are selected, so large text columns
+    such as descriptions are never loaded. The output matches the
+    serializer's field for field.
+    """
+
+    def __init__(self, serializer_class, field_names=None):
+        # A fresh instance has no request, so no sparse fieldset applies
+        serializer = serializer_class()
+        meta = serializer.Meta
+        self.model = meta.model
+        requires = getattr(meta, 'fieldset_requires', {})
+        self.annotations = dict(getattr(meta, 'row_annotations', {}))
+        self.columns = ['id']
+        self.steps = []
+
+        for name, field in serializer.fields.items():
+            if field.write_only or (field_names is not None and name not in field_names):
+                continue
+            if name in self.annotations:
+                self.steps.append((name, name, self.compile_value(field, name)))
+            else:
+                self.steps.append(self.compile_field(name, field, requires.get(name)))
+
+    def add_column(self, column):
+        if column not in self.columns:
+            self.columns.append(column)
+        return column
+
+    def compile_field(self, name, field, requires):
+        source = field.source
+        try:
+            model_field = self.model._meta.get_field(source)
+        except FieldDoesNotExist:
+            model_field = None
+
+        if model_field is not None and model_field.concrete:
+            key = self.add_column(source)
+            if isinstance(model_field, ModelFileField):
+                return name, key, self.compile_file(field, model_field, key)
+            if isinstance(field, PASSTHROUGH_FIELDS):
+                return name, key, None
+            return name, key, self.compile_value(field, key)
+
+        if '.' in source:
+            key = self.add_column(source.replace('.', '__'))
+            return name, key, self.compile_value(field, key)
+
+        attribute = getattr(self.model, source, None)
+        if isinstance(attribute, property) and requires:
+            columns = [self.add_column(column) for column in requires]
+            return name, None, self.compile_property(field, attribute.fget, columns)
+
+        raise ImproperlyConfigured(
+            f'{type(field).__name__} {name!r} cannot be built from a values() row; '
+            f'add it to Meta.row_annotations or Meta.fieldset_requires'
+        )
+
+    @staticmethod
+    def compile_value(field, key):
+        to_representation = field.to_representation
+
+        def convert(row, request):
+            value = row[key]
+            return None if value is None else to_representation(value)
+        return convert
+
+    @staticmethod
+    def compile_file(field, model_field, key):
+        storage = model_field.storage
+        use_url = getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL)
+
+        def convert(row, request):
+            name = row[key]
+            if not name:
+                return None
+            if not use_url:
+                return name
+            url = storage.url(name)
+            return request.build_absolute_uri(url) if request is not None else url
+        return convert
+
+    @staticmethod
+    def compile_property(field, getter, columns):
+        to_representation = field.to_representation
+
+        def convert(row, request):
+            value = getter(SimpleNamespace(**{column: row[column] for column in columns}))
+            return None if value is None else to_representation(value)
+        return convert
+
+    def values(self, queryset, extra=()):
+        """values() queryset selecting what the fields read, plus extra columns"""
+        columns = list(dict.fromkeys([*self.columns, *extra]))
+        return queryset.values(*columns, **self.annotations)
+
+    def serialize(self, rows, request=None):
+        steps = self.steps
+        data = []
+        for row in rows:
+            item = {}
+            for name, key, convert in steps:
+                item[name] = row[key] if convert is None else convert(row, request)
+            data.append(item)
+        return data
+
+
+@lru_cache(maxsize=None)
+def declared_fields(serializer_class):
+    """A serializer class's field names in declaration order (one entry per class)"""
+    return tuple(serializer_class().fields)
+
+
+@lru_cache(maxsize=ROW_SERIALIZER_CACHE_SIZE)
+def compile_row_serializer(serializer_class, field_names):
+    return RowSerializer(serializer_class, set(field_names))
+
+
+def row_serializer(serializer):
+    """
+    The compiled RowSerializer for a serializer instance, keeping the fields
+    left after a sparse fieldset. Compiled once per class and field set,
+    the set taken in declaration order so every spelling shares one entry.
+    """
+    serializer = getattr(serializer, 'child', serializer)
+    serializer_class = type(serializer)
+    kept = serializer.fields
+    return compile_row_serializer(
+        serializer_class,
+        tuple(name for name in declared_fields(serializer_class) if name in kept)
+    )
+
+
+class RowListMixin:
+    """
+    List view mixin serving GET lists from values() rows through the
+    compiled RowSerializer of the view's serializer. Paginated pages hold
+    row dicts; fieldset_columns are selected for the view's own use.
+    """
+    fieldset_columns = ()
+
+    def list(self, request, *args, **kwargs):
+        rows = row_serializer(self.get_serializer())
+        queryset = rows.values(self.filter_queryset(self.get_queryset()), self.fieldset_columns)
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(rows.serialize(page, request))
+        return Response(rows.serialize(queryset, request))
@@ -0,0 +1,51 @@
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+    TrigramSimilarity
+)
+from django.db.models import F, FloatField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from .models import Category, Product
+
+SEARCH_CONFIG = 'english'
+
+
+def product_search_vector():
+    """
+    Weighted document for a product: name (A), category name (B) and
+    description (C). The category name is read through a subquery so the
+    expression can be used in UPDATE statements.
+    """
+    category_name = Subquery(
+        Category.objects.filter(pk=OuterRef('category_id')).values('name')[:1]
+    )
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(category_name, weight='B', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def refresh_search_vectors(queryset):
+    """Recompute the stored search vector for every product in queryset"""
+    return queryset.order_by().update(search_vector=product_search_vector())
+
+
+def search_products(queryset, query):
+    """
+    Filter queryset to products matching query and order them by relevance.
+
+    Full-text matches use the GIN index on search_vector; the trigram
+    match on name (GIN gin_trgm_ops index) adds typo tolerance.
+    """
+    search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+
+    return queryset.filter(
+        Q(search_vector=search_query) | Q(name__trigram_similar=query)
+    ).annotate(
+        relevance=(
+            Coalesce(SearchRank(F('search_vector'), search_query), Value(0.0), output_field=FloatField())
+            + TrigramSimilarity('name', query)
+        )
+    ).order_by('-relevance', '-created_at', 'id')
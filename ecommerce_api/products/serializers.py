@@ -1,29 +1,44 @@
+from django.db.models import Prefetch
+from django.urls import reverse
 from rest_framework import serializers
-from .models import Category, Product, ProductImage, Review
+from .fieldsets import SparseFieldsetMixin
+from .models import RATING_HISTOGRAM_FIELDS, Category, Product, ProductImage, Review
 
 
 class CategorySerializer(serializers.ModelSerializer):
     """Serializer for Category model"""
-    product_count = serializers.SerializerMethodField()
+    product_count = serializers.IntegerField(source='active_product_count', read_only=True)
     
     class Meta:
         model = Category
         fields = ('id', 'name', 'slug', 'description', 'image', 'is_active', 'product_count', 'created_at')
         read_only_fields = ('id', 'slug', 'created_at', 'product_count')
     
-    def get_product_count(self, obj):
-        return obj.products.filter(is_active=True).count()
     
-    
-class ProductImageSerializer(serializers.ModelSerializer):
+class ProductImageSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for ProductImage model"""
     
     class Meta:
         model = ProductImage
-        fields = ('id', 'image', 'alt_text', 'is_primary', 'created_at')
-        read_only_fields = ('id', 'created_at')
+        fields = (
+            'id', 'image', 'alt_text', 'is_primary',
+            'thumbnail', 'thumbnail_webp', 'thumbnail_width', 'thumbnail_height',
+            'image_webp', 'image_webp_width', 'image_webp_height', 'created_at'
+        )
+        read_only_fields = (
+            'id', 'thumbnail', 'thumbnail_webp', 'thumbnail_width', 'thumbnail_height',
+            'image_webp', 'image_webp_width', 'image_webp_height', 'created_at'
+        )
         
         
+# Reviews embedded in the product detail payload
+LATEST_REVIEWS_COUNT = 5
+
+
+def latest_reviews_queryset():
+    return Review.objects.select_related('user').order_by('-created_at', '-id')
+
+
 class ReviewSerializer(serializers.ModelSerializer):
     """Serializer for review model"""
     user_name = serializers.CharField(source='user.get_full_name', read_only=True)
@@ -43,57 +58,75 @@ class ReviewSerializer(serializers.ModelSerializer):
         return value
     
 
-class ProductListSerializer(serializers.ModelSerializer):
+class ProductListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for product list view"""
     category_name = serializers.CharField(source='category.name', read_only=True)
-    average_rating = serializers.SerializerMethodField()
-    review_count = serializers.SerializerMethodField()
     
     class Meta:
         model = Product
         fields = (
             'id', 'name', 'slug', 'category', 'category_name',
-            'price', 'stock', 'stock_status', 'in_stock', 'image',
+            'price', 'stock', 'available_stock', 'stock_status', 'in_stock', 'image',
+            'thumbnail', 'thumbnail_webp', 'thumbnail_width', 'thumbnail_height',
             'is_active', 'is_featured', 'average_rating', 'review_count', 'created_at',
         )
-        read_only_fields = ('id', 'slug', 'stock_status', 'in_stock', 'created_at')
-        
-    def get_average_rating(self, obj):
-        reviews = obj.reviews.all()
-        if reviews:
-            return round(sum(r.rating for r in reviews) / len(reviews), 1)
-        return 0
-    
-    def get_review_count(self, obj):
-        return obj.reviews.count()
+        read_only_fields = (
+            'id', 'slug', 'available_stock', 'stock_status', 'in_stock', 'thumbnail', 'thumbnail_webp',
+            'thumbnail_width', 'thumbnail_height', 'average_rating', 'review_count', 'created_at'
+        )
+        fieldset_requires = {
+            'available_stock': ('stock', 'reserved_stock'),
+            'stock_status': ('stock',),
+            'in_stock': ('stock',),
+        }
     
     
-class ProductDetailSerializer(serializers.ModelSerializer):
+class ProductDetailSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for Product detail view"""
     category_name = serializers.CharField(source='category.name', read_only=True)
     images = ProductImageSerializer(many=True, read_only=True)
-    reviews = ReviewSerializer(many=True, read_only=True)
-    average_rating = serializers.SerializerMethodField()
-    review_count = serializers.SerializerMethodField()
+    rating_histogram = serializers.DictField(child=serializers.IntegerField(), read_only=True)
+    reviews = serializers.SerializerMethodField()
+    reviews_url = serializers.SerializerMethodField()
     
     class Meta:
         model = Product
         fields = (
             'id', 'name', 'description', 'category', 'category_name',
             'price', 'stock', 'stock_status', 'in_stock', 'image', 'images',
-            'is_active', 'is_featured', 'average_rating', 'review_count', 'reviews',
+            'is_active', 'is_featured', 'average_rating', 'review_count', 'rating_histogram',
+            'reviews', 'reviews_url', 'created_at', 'updated_at'
+        )
+        read_only_fields = (
+            'id', 'slug', 'stock_status', 'in_stock', 'average_rating', 'review_count',
             'created_at', 'updated_at'
         )
-        read_only_fields = ('id', 'slug', 'stock_status', 'in_stock', 'created_at', 'updated_at')
-        
-    def get_average_rating(self, obj):
-        reviews = obj.reviews.all()
-        if reviews:
-            return round(sum(r.rating for r in reviews) / len(reviews), 1)
-        return 0
-    
-    def get_review_count(self, obj):
-        return obj.reviews.count()
+        fieldset_requires = {
+            'stock_status': ('stock',),
+            'in_stock': ('stock',),
+            'images': (Prefetch('images'),),
+            'rating_histogram': tuple(RATING_HISTOGRAM_FIELDS.values()),
+            'reviews': (
+                Prefetch(
+                    'reviews',
+                    queryset=latest_reviews_queryset()[:LATEST_REVIEWS_COUNT],
+                    to_attr='latest_reviews'
+                ),
+            ),
+            'reviews_url': ('id',),
+        }
+    
+    def get_reviews(self, obj):
+        """Only the latest reviews; the rest are paged from reviews_url"""
+        reviews = getattr(obj, 'latest_reviews', None)
+        if reviews is None:
+            reviews = latest_reviews_queryset().filter(product=obj)[:LATEST_REVIEWS_COUNT]
+        return ReviewSerializer(reviews, many=True, context=self.context).data
+    
+    def get_reviews_url(self, obj):
+        url = reverse('products:review_list', kwargs={'product_id': obj.id})
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
     
     
 class ProductCreateUpdateSerializer(serializers.ModelSerializer):
@@ -0,0 +1,85 @@
+import random
+from django.conf import settings
+from django.db.models import Case, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from .models import StockShard
+
+
+def default_shard_count():
+    return getattr(settings, 'STOCK_SHARD_COUNT', 8)
+
+
+def split(total, count):
+    """total spread over count shards, the remainder going to the first ones"""
+    per_shard, remainder = divmod(total, count)
+    return [per_shard + (index < remainder) for index in range(count)]
+
+
+def take_from_shard(shards, index, quantity):
+    return shards.filter(index=index, quantity__gte=quantity).update(quantity=F('quantity') - quantity) == 1
+
+
+def take_from_shards(product_id, shard_count, quantity):
+    """
+    Take quantity from a high-contention product's shards.
+
+    Concurrent checkouts start on a random shard, so they rarely wait on
+    the same row: one conditional UPDATE there, then on the other shards
+    that can cover quantity, fullest first. Only when no single shard can
+    are all of them locked, in index order, and quantity is taken across
+    them. Returns False, with nothing taken, if the shards hold less than
+    quantity in total. Other carts' holds are not honoured: high-contention
+    products are not held in carts (see cart.reservations.hold).
+    """
+    shards = StockShard.objects.filter(product_id=product_id)
+    start = random.randrange(shard_count)
+    if take_from_shard(shards, start, quantity):
+        return True
+
+    candidates = list(
+        shards.filter(quantity__gte=quantity).exclude(index=start)
+        .order_by('-quantity').values_list('index', flat=True)
+    )
+    for index in candidates:
+        if take_from_shard(shards, index, quantity):
+            return True
+
+    locked = list(shards.select_for_update().order_by('index').values_list('index', 'quantity'))
+    if sum(available for _, available in locked) < quantity:
+        return False
+    remaining = quantity
+    for index, available in locked:
+        taken = min(available, remaining)
+        if taken:
+            shards.filter(index=index).update(quantity=F('quantity') - taken)
+            remaining -= taken
+    return True
+
+
+def add_to_shards(product_id, shard_count, quantity):
+    """Spread an increase evenly over a product's shards, in one UPDATE"""
+    per_shard, remainder = divmod(quantity, shard_count)
+    StockShard.objects.filter(product_id=product_id).update(
+        quantity=F('quantity') + per_shard + Case(
+            When(index__lt=remainder, then=Value(1)),
+            default=Value(0),
+            output_field=IntegerField()
+        )
+    )
+
+
+def replace_shards(product_id, quantities):
+    """Make quantities, in index order, the product's shards"""
+    StockShard.objects.filter(product_id=product_id).delete()
+    StockShard.objects.bulk_create([
+        StockShard(product_id=product_id, index=index, quantity=quantity)
+        for index, quantity in enumerate(quantities)
+    ])
+
+
+def shard_stock_expression():
+    """Sum of a product's shards; NULL for a product that is not sharded"""
+    return Subquery(
+        StockShard.objects.filter(product=OuterRef('pk'))
+        .order_by().values('product').annotate(total=Sum('quantity')).values('total'),
+        output_field=IntegerField()
+    )
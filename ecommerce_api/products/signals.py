@@ -0,0 +1,340 @@
+import logging
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from kombu.exceptions import OperationalError
+from .models import Category, Product, ProductImage, Review
+from .aggregates import apply_category_delta, apply_review_delta
+from .autocomplete import CATEGORY, PRODUCT, publish_change
+from .caching import (
+    CATEGORY_LIST_VERSION_KEY,
+    PRODUCT_LIST_VERSION_KEY,
+    PRODUCTS_TAG,
+    bump_product_versions,
+    bump_tags,
+    bump_versions,
+    category_tag,
+    product_tag
+)
+from .search import refresh_search_vectors
+from .tasks import generate_image_derivatives, schedule_featured_feed_rebuild
+
+logger = logging.getLogger(__name__)
+
+# Product columns whose previous values the post_save handlers need
+TRACKED_PRODUCT_FIELDS = (
+    'category_id', 'is_active', 'is_featured', 'name', 'description', 'slug', 'image', 'price', 'stock'
+)
+
+# Product columns that feed the full-text search document
+SEARCH_FIELDS = ('category_id', 'name', 'description')
+
+# Product columns rendered into the pre-serialized featured feed
+FEED_FIELDS = ('category_id', 'is_active', 'is_featured', 'name', 'slug', 'image', 'price', 'stock')
+
+
+@receiver(pre_save, sender=Product)
+def remember_previous_product(sender, instance, **kwargs):
+    """Store the tracked product columns as they were before this save"""
+    instance._previous_state = None
+    if instance.pk:
+        instance._previous_state = (
+            Product.objects.filter(pk=instance.pk)
+            .values(*TRACKED_PRODUCT_FIELDS)
+            .first()
+        )
+
+
+@receiver(post_save, sender=Product)
+def update_category_counts_on_product_save(sender, instance, created, **kwargs):
+    """Keep category active product counters in step with product writes"""
+    previous = getattr(instance, '_previous_state', None)
+
+    if previous is None:
+        apply_category_delta(instance.category_id, int(instance.is_active))
+    elif previous['category_id'] == instance.category_id:
+        apply_category_delta(instance.category_id, int(instance.is_active) - int(previous['is_active']))
+    else:
+        # Product moved to another category
+        apply_category_delta(previous['category_id'], -int(previous['is_active']))
+        apply_category_delta(instance.category_id, int(instance.is_active))
+
+
+@receiver(post_save, sender=Product)
+def update_search_vector_on_product_save(sender, instance, created, **kwargs):
+    """Refresh the stored search document when its source columns change"""
+    previous = getattr(instance, '_previous_state', None)
+
+    if previous is not None and all(
+        previous[field] == getattr(instance, field) for field in SEARCH_FIELDS
+    ):
+        return
+    refresh_search_vectors(Product.objects.filter(pk=instance.pk))
+
+
+@receiver(post_delete, sender=Product)
+def update_category_counts_on_product_delete(sender, instance, **kwargs):
+    """Remove a deleted product from its category's counter"""
+    if instance.is_active:
+        apply_category_delta(instance.category_id, -1)
+
+
+@receiver(pre_save, sender=Category)
+def remember_previous_category_name(sender, instance, **kwargs):
+    """Store the category name as it was before this save"""
+    instance._previous_name = None
+    if instance.pk:
+        instance._previous_name = (
+            Category.objects.filter(pk=instance.pk)
+            .values_list('name', flat=True)
+            .first()
+        )
+
+
+@receiver(post_save, sender=Category)
+def update_search_vectors_on_category_rename(sender, instance, created, **kwargs):
+    """Category names are part of the product search document"""
+    previous_name = getattr(instance, '_previous_name', None)
+    if not created and previous_name is not None and previous_name != instance.name:
+        refresh_search_vectors(Product.objects.filter(category_id=instance.pk))
+
+
+@receiver(pre_save, sender=Review)
+def remember_previous_review(sender, instance, **kwargs):
+    """Store the rating and product a review had before this save"""
+    instance._previous_review = None
+    if instance.pk:
+        instance._previous_review = (
+            Review.objects.filter(pk=instance.pk)
+            .values_list('product_id', 'rating')
+            .first()
+        )
+
+
+@receiver(post_save, sender=Review)
+def update_ratings_on_review_save(sender, instance, created, **kwargs):
+    """Keep product rating aggregates in step with review writes"""
+    previous = getattr(instance, '_previous_review', None)
+
+    if created or previous is None:
+        apply_review_delta(instance.product_id, added_rating=instance.rating)
+        return
+
+    old_product_id, old_rating = previous
+    if old_product_id == instance.product_id:
+        apply_review_delta(instance.product_id, added_rating=instance.rating, removed_rating=old_rating)
+    else:
+        # Review moved to another product
+        apply_review_delta(old_product_id, removed_rating=old_rating)
+        apply_review_delta(instance.product_id, added_rating=instance.rating)
+
+
+@receiver(post_delete, sender=Review)
+def update_ratings_on_review_delete(sender, instance, **kwargs):
+    """Remove a deleted review from its product's aggregates"""
+    apply_review_delta(instance.product_id, removed_rating=instance.rating)
+
+
+# Cache invalidation
+
+
+def product_slugs(product_ids):
+    """Slugs of the given products, plus whether any of them is featured"""
+    rows = list(Product.objects.filter(pk__in=product_ids).values_list('slug', 'is_featured'))
+    return [slug for slug, _ in rows], any(is_featured for _, is_featured in rows)
+
+
+@receiver(post_save, sender=Product)
+def invalidate_product_cache_on_save(sender, instance, **kwargs):
+    """Move the cached detail, list and tag versions a product write affects"""
+    previous = getattr(instance, '_previous_state', None)
+    slugs = [instance.slug]
+    version_keys = [PRODUCT_LIST_VERSION_KEY]
+
+    if previous is None:
+        if instance.is_active:
+            version_keys.append(CATEGORY_LIST_VERSION_KEY)
+    else:
+        slugs.append(previous['slug'])
+        if (previous['is_active'], previous['category_id']) != (instance.is_active, instance.category_id):
+            version_keys.append(CATEGORY_LIST_VERSION_KEY)
+
+    bump_product_versions(slugs)
+    bump_versions(version_keys)
+    bump_tags([
+        PRODUCTS_TAG,
+        product_tag(instance.pk),
+        category_tag(instance.category_id),
+        category_tag(previous['category_id']) if previous is not None else None,
+    ])
+
+    if instance.is_featured or (previous is not None and previous['is_featured']):
+        if previous is None or any(previous[field] != getattr(instance, field) for field in FEED_FIELDS):
+            schedule_featured_feed_rebuild()
+
+
+@receiver(post_delete, sender=Product)
+def invalidate_product_cache_on_delete(sender, instance, **kwargs):
+    """Drop cached reads that showed a deleted product"""
+    bump_product_versions([instance.slug])
+    bump_versions([
+        PRODUCT_LIST_VERSION_KEY,
+        CATEGORY_LIST_VERSION_KEY if instance.is_active else None,
+    ])
+    bump_tags([PRODUCTS_TAG, product_tag(instance.pk), category_tag(instance.category_id)])
+    if instance.is_featured:
+        schedule_featured_feed_rebuild()
+
+
+@receiver(post_save, sender=Category)
+def invalidate_cache_on_category_save(sender, instance, created, **kwargs):
+    """Drop cached category lists, and product reads that embed a renamed category"""
+    version_keys = [CATEGORY_LIST_VERSION_KEY]
+    tags = [category_tag(instance.pk)]
+
+    # Product details and listings embed the category name, and search
+    # documents include it, so any cached search may gain or lose products
+    previous_name = getattr(instance, '_previous_name', None)
+    if not created and previous_name is not None and previous_name != instance.name:
+        version_keys.append(PRODUCT_LIST_VERSION_KEY)
+        tags.append(PRODUCTS_TAG)
+        bump_product_versions(
+            Product.objects.filter(category_id=instance.pk).values_list('slug', flat=True).iterator()
+        )
+        if Product.objects.filter(category_id=instance.pk, is_featured=True).exists():
+            schedule_featured_feed_rebuild()
+    bump_versions(version_keys)
+    bump_tags(tags)
+
+
+@receiver(post_delete, sender=Category)
+def invalidate_cache_on_category_delete(sender, instance, **kwargs):
+    """Drop cached reads of a deleted category"""
+    bump_versions([CATEGORY_LIST_VERSION_KEY])
+    bump_tags([category_tag(instance.pk)])
+
+
+def invalidate_review_products(product_ids):
+    """Drop cached reads that show the rating aggregates of product_ids"""
+    slugs, any_featured = product_slugs(product_ids)
+    bump_product_versions(slugs)
+    bump_versions([PRODUCT_LIST_VERSION_KEY])
+    # Listings show the rating aggregates, but review writes never change membership
+    bump_tags(product_tag(product_id) for product_id in product_ids)
+    if any_featured:
+        schedule_featured_feed_rebuild()
+
+
+@receiver(post_save, sender=Review)
+def invalidate_product_cache_on_review_save(sender, instance, **kwargs):
+    """Review writes change the rating aggregates of their product, or both when moved"""
+    previous = getattr(instance, '_previous_review', None)
+    product_ids = {instance.product_id}
+    if previous is not None:
+        product_ids.add(previous[0])
+    invalidate_review_products(product_ids)
+
+
+@receiver(post_delete, sender=Review)
+def invalidate_product_cache_on_review_delete(sender, instance, **kwargs):
+    """Drop cached reads showing a deleted review's product aggregates"""
+    invalidate_review_products([instance.product_id])
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def invalidate_product_cache_on_image_change(sender, instance, **kwargs):
+    """Product details embed the gallery images"""
+    slugs, _ = product_slugs([instance.product_id])
+    bump_product_versions(slugs)
+
+
+# Image derivatives
+
+
+DERIVED_IMAGE_FIELDS = {
+    'thumbnail': None,
+    'thumbnail_webp': None,
+    'thumbnail_width': None,
+    'thumbnail_height': None,
+    'image_webp': None,
+    'image_webp_width': None,
+    'image_webp_height': None,
+}
+
+
+def queue_image_derivatives(instance, previous_image):
+    """Generate thumbnails/WebP copies after commit when the source image changed"""
+    image_name = instance.image.name if instance.image else ''
+    if image_name == (previous_image or ''):
+        return
+
+    model = type(instance)
+    if not image_name:
+        model.objects.filter(pk=instance.pk).update(**DERIVED_IMAGE_FIELDS)
+        return
+
+    def enqueue():
+        try:
+            generate_image_derivatives.delay(model._meta.label, instance.pk)
+        except OperationalError:
+            logger.exception('Could not queue image derivatives for %s %s', model._meta.label, instance.pk)
+
+    transaction.on_commit(enqueue)
+
+
+@receiver(post_save, sender=Product)
+def generate_product_image_derivatives(sender, instance, **kwargs):
+    """Queue derivatives when a product's main image changes"""
+    previous = getattr(instance, '_previous_state', None)
+    queue_image_derivatives(instance, previous['image'] if previous else None)
+
+
+@receiver(pre_save, sender=ProductImage)
+def remember_previous_gallery_image(sender, instance, **kwargs):
+    """Store the gallery image file as it was before this save"""
+    instance._previous_image = None
+    if instance.pk:
+        instance._previous_image = (
+            ProductImage.objects.filter(pk=instance.pk)
+            .values_list('image', flat=True)
+            .first()
+        )
+
+
+@receiver(post_save, sender=ProductImage)
+def generate_gallery_image_derivatives(sender, instance, **kwargs):
+    """Queue derivatives when a gallery image changes"""
+    queue_image_derivatives(instance, getattr(instance, '_previous_image', None))
+
+
+# Autocomplete index
+
+
+@receiver(post_save, sender=Product)
+def update_autocomplete_on_product_save(sender, instance, **kwargs):
+    """Broadcast a product's new name, slug or active state to the autocomplete indexes"""
+    previous = getattr(instance, '_previous_state', None)
+    if previous is not None and all(
+        previous[field] == getattr(instance, field) for field in ('name', 'slug', 'is_active')
+    ):
+        return
+    publish_change(PRODUCT, instance.pk, instance.name, instance.slug, instance.is_active)
+
+
+@receiver(post_delete, sender=Product)
+def update_autocomplete_on_product_delete(sender, instance, **kwargs):
+    """Remove a deleted product from the autocomplete indexes"""
+    publish_change(PRODUCT, instance.pk, instance.name, instance.slug, False)
+
+
+@receiver(post_save, sender=Category)
+def update_autocomplete_on_category_save(sender, instance, **kwargs):
+    """Broadcast a saved category to the autocomplete indexes"""
+    publish_change(CATEGORY, instance.pk, instance.name, instance.slug, instance.is_active)
+
+
+@receiver(post_delete, sender=Category)
+def update_autocomplete_on_category_delete(sender, instance, **kwargs):
+    """Remove a deleted category from the autocomplete indexes"""
+    publish_change(CATEGORY, instance.pk, instance.name, instance.slug, False)
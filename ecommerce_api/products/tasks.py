@@ -0,0 +1,170 @@
+import io
+import logging
+import os
+from celery import shared_task
+from django.apps import apps
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import transaction
+from kombu.exceptions import OperationalError
+from PIL import Image, ImageOps
+from .caching import (
+    PRODUCT_LIST_VERSION_KEY,
+    bump_product_versions,
+    bump_tags,
+    bump_versions,
+    product_tag
+)
+from .feeds import build_featured_feed
+from .related import rebuild_related_products
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZE = (320, 320)
+DISPLAY_SIZE = (1200, 1200)
+JPEG_QUALITY = 80
+WEBP_QUALITY = 80
+
+# Set while a featured feed rebuild is queued, so bursts of writes share one
+FEATURED_FEED_PENDING_KEY = 'featured_feed_rebuild_pending'
+FEATURED_FEED_PENDING_TIMEOUT = 60
+
+
+def encode_image(image, image_format, **options):
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, **options)
+    return ContentFile(buffer.getvalue())
+
+
+def save_variant(instance, field_name, filename, content):
+    """Store a derived file under the field's upload_to and return its name"""
+    field = instance._meta.get_field(field_name)
+    name = field.generate_filename(instance, filename)
+    return field.storage.save(name, content)
+
+
+def product_slug_for(instance):
+    if hasattr(instance, 'slug'):
+        return instance.slug
+    return instance.product.slug
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=30)
+def generate_image_derivatives(self, model_label, pk):
+    """
+    Build a JPEG thumbnail, a WebP thumbnail and a WebP display copy of
+    `image` for a Product or ProductImage, then record them on the row.
+    """
+    model = apps.get_model(model_label)
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None or not instance.image:
+        return
+
+    source_name = instance.image.name
+    try:
+        with instance.image.open('rb') as source:
+            image = Image.open(source)
+            image.load()
+    except FileNotFoundError:
+        logger.warning('Image %s for %s %s is missing', source_name, model_label, pk)
+        return
+    except OSError as exc:
+        # Transient storage errors are retried; unreadable images are not
+        if isinstance(exc, Image.UnidentifiedImageError):
+            logger.warning('Cannot decode image %s for %s %s', source_name, model_label, pk)
+            return
+        raise self.retry(exc=exc)
+
+    image = ImageOps.exif_transpose(image)
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    thumbnail = image.copy()
+    thumbnail.thumbnail(THUMBNAIL_SIZE, Image.LANCZOS)
+    display = image.copy()
+    display.thumbnail(DISPLAY_SIZE, Image.LANCZOS)
+
+    base = os.path.splitext(os.path.basename(source_name))[0]
+    previous = [instance.thumbnail.name, instance.thumbnail_webp.name, instance.image_webp.name]
+    names = {
+        'thumbnail': save_variant(
+            instance, 'thumbnail', f'{base}_thumb.jpg',
+            encode_image(thumbnail.convert('RGB'), 'JPEG', quality=JPEG_QUALITY, optimize=True)
+        ),
+        'thumbnail_webp': save_variant(
+            instance, 'thumbnail_webp', f'{base}_thumb.webp',
+            encode_image(thumbnail, 'WEBP', quality=WEBP_QUALITY)
+        ),
+        'image_webp': save_variant(
+            instance, 'image_webp', f'{base}.webp',
+            encode_image(display, 'WEBP', quality=WEBP_QUALITY)
+        ),
+    }
+
+    # Only record the variants if the source image was not replaced meanwhile
+    updated = model.objects.filter(pk=pk, image=source_name).update(
+        thumbnail_width=thumbnail.width,
+        thumbnail_height=thumbnail.height,
+        image_webp_width=display.width,
+        image_webp_height=display.height,
+        **names
+    )
+
+    storage = instance.image.storage
+    stale = names.values() if not updated else [name for name in previous if name and name not in names.values()]
+    for name in stale:
+        storage.delete(name)
+
+    if updated:
+        bump_product_versions([product_slug_for(instance)])
+        bump_versions([PRODUCT_LIST_VERSION_KEY])
+        bump_tags([product_tag(getattr(instance, 'product_id', instance.pk))])
+        if model._meta.label == 'products.Product' and instance.is_featured:
+            schedule_featured_feed_rebuild()
+
+
+@shared_task
+def rebuild_featured_feed():
+    """Re-render the pre-serialized featured products pages"""
+    # Clear the flag first so writes made during the rebuild queue another one
+    cache.delete(FEATURED_FEED_PENDING_KEY)
+    return build_featured_feed()
+
+
+@shared_task
+def compute_related_products():
+    """Rebuild the frequently bought together table (run nightly by celery beat)"""
+    written = rebuild_related_products()
+    logger.info('Stored %s related product rows', written)
+    return written
+
+
+@shared_task
+def settle_inventory_movements():
+    """
+    Fold pending inventory movements into product stock and refresh the
+    stock totals of high-contention products (run every minute by celery beat)
+    """
+    # products.inventory schedules feed rebuilds from this module
+    from .inventory import refresh_sharded_stock, settle_movements
+    settled = settle_movements()
+    if settled:
+        logger.info('Settled %s inventory movements', settled)
+    refreshed = refresh_sharded_stock()
+    if refreshed:
+        logger.info('Refreshed the stock of %s sharded products', refreshed)
+    return settled
+
+
+def schedule_featured_feed_rebuild():
+    """Queue one featured feed rebuild once the current transaction commits"""
+    def enqueue():
+        if not cache.add(FEATURED_FEED_PENDING_KEY, 1, FEATURED_FEED_PENDING_TIMEOUT):
+            return
+        try:
+            rebuild_featured_feed.delay()
+        except OperationalError:
+            cache.delete(FEATURED_FEED_PENDING_KEY)
+            logger.exception('Could not queue a featured feed rebuild')
+
+    transaction.on_commit(enqueue)
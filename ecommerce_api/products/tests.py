@@ -1,3 +1,1309 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import random
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+from itertools import combinations
+from unittest import mock
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from . import autocomplete
+from .aggregates import rebuild_category_counts, rebuild_rating_aggregates
+from .caching import get_or_recompute
+from .exporter import export_rows
+from .feeds import FEATURED_FEED_LOCK_KEY
+from .importer import ProductImporter
+from .inventory import (
+    InsufficientStock,
+    add_stock,
+    current_available,
+    decrement_stock,
+    disable_stock_sharding,
+    enable_stock_sharding,
+    rebalance_stock_shards,
+    refresh_sharded_stock,
+    settle_movements
+)
+from orders.models import Order, OrderItem
+from users.models import User
+from .models import Category, InventoryMovement, Product, RelatedProduct, Review
+from .related import rebuild_related_products
+from .rows import ROW_SERIALIZER_CACHE_SIZE, compile_row_serializer, row_serializer
+from .serializers import ProductListSerializer
+from .tasks import generate_image_derivatives
+from .views import FeaturedProductsView
 
-# Create your tests here.
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class GetOrRecomputeTests(SimpleTestCase):
+    """Single-flight recomputation of hot cache keys"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_concurrent_misses_recompute_once(self):
+        calls = []
+        calls_lock = threading.Lock()
+        barrier = threading.Barrier(200)
+        results = []
+
+        def compute():
+            with calls_lock:
+                calls.append(1)
+            # Stand-in for the product query and serialization
+            time.sleep(0.2)
+            return {'slug': 'hot-product'}
+
+        def worker():
+            barrier.wait()
+            results.append(get_or_recompute('product_hot', compute, timeout=60, wait_timeout=10))
+
+        threads = [threading.Thread(target=worker) for _ in range(200)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(results), 200)
+        self.assertTrue(all(result == {'slug': 'hot-product'} for result in results))
+
+    def test_stale_value_served_while_refreshing(self):
+        get_or_recompute('product_stale', lambda: 'old', timeout=0, stale_timeout=60)
+        cache.add('product_stale_lock', 1, 10)
+
+        value = get_or_recompute('product_stale', lambda: 'new', timeout=60)
+
+        self.assertEqual(value, 'old')
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ProductRowSerializerParityTests(TestCase):
+    """values() row serialization renders the same bytes as ProductListSerializer"""
+
+    @classmethod
+    def setUpTestData(cls):
+        phones = Category.objects.create(name='Phones', slug='phones')
+        cases = Category.objects.create(name='Cases', slug='cases')
+        Product.objects.create(
+            name='Phone', slug='phone', description='x' * 5000, category=phones,
+            price=Decimal('499.90'), stock=50, image='products/phone.jpg',
+            thumbnail='products/thumbnails/phone.jpg', thumbnail_width=320, thumbnail_height=240,
+            is_featured=True, average_rating=4.5, review_count=2
+        )
+        Product.objects.create(
+            name='Case', slug='case', description='Case', category=cases,
+            price=Decimal('9'), stock=3
+        )
+        Product.objects.create(
+            name='Charger', slug='charger', description='Charger', category=phones,
+            price=Decimal('19.99'), stock=0, image=''
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def render_both(self, request=None):
+        queryset = Product.objects.select_related('category').order_by('-created_at', '-id')
+        context = {'request': request} if request is not None else {}
+        serializer = ProductListSerializer(queryset, many=True, context=context)
+        rows = row_serializer(serializer)
+        renderer = JSONRenderer()
+        return (
+            renderer.render(serializer.data),
+            renderer.render(rows.serialize(rows.values(queryset), request))
+        )
+
+    def test_matches_serializer_with_request(self):
+        request = Request(APIRequestFactory().get('/api/products/'))
+        expected, actual = self.render_both(request)
+        self.assertEqual(actual, expected)
+
+    def test_matches_serializer_without_request(self):
+        expected, actual = self.render_both()
+        self.assertEqual(actual, expected)
+
+    def test_matches_sparse_serializer(self):
+        request = Request(APIRequestFactory().get('/api/products/', {'fields': 'id,name,price,in_stock,image'}))
+        expected, actual = self.render_both(request)
+        self.assertEqual(actual, expected)
+
+    def test_large_text_columns_not_selected(self):
+        rows = row_serializer(ProductListSerializer())
+        sql = str(rows.values(Product.objects.all()).query)
+        self.assertNotIn('description', sql)
+
+    def test_compiled_serializers_are_shared_and_bounded(self):
+        def compiled(fields):
+            request = Request(APIRequestFactory().get('/api/products/', {'fields': fields}))
+            return row_serializer(ProductListSerializer(context={'request': request}))
+
+        self.assertIs(compiled('price,id,name'), compiled('name,id,price,bogus'))
+        for fields in ('id', 'name', 'price', 'id,name', 'id,price', 'name,price') * 50:
+            compiled(fields)
+        self.assertLessEqual(compile_row_serializer.cache_info().currsize, ROW_SERIALIZER_CACHE_SIZE)
+
+    def test_list_endpoint_matches_serializer(self):
+        response = self.client.get('/api/products/')
+        queryset = Product.objects.filter(is_active=True).select_related('category').order_by('-created_at')
+        request = Request(APIRequestFactory().get('/api/products/'))
+        data = ProductListSerializer(queryset, many=True, context={'request': request}).data
+        expected = JSONRenderer().render({'count': 3, 'next': None, 'previous': None, 'results': data})
+        self.assertEqual(response.content, expected)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class StockShardTests(TestCase):
+    """High-contention products keep their stock in counter shards"""
+
+    def setUp(self):
+        category = Category.objects.create(name='Consoles', slug='consoles')
+        self.product = Product.objects.create(
+            name='Console', slug='console', description='Console', category=category,
+            price=Decimal('499'), stock=10
+        )
+        enable_stock_sharding(self.product.pk, 4)
+
+    def shards(self):
+        return list(self.product.shards.values_list('quantity', flat=True))
+
+    def test_enable_splits_stock(self):
+        self.assertEqual(self.shards(), [3, 3, 2, 2])
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock_shards, self.product.stock), (4, 10))
+
+    def test_decrements_split_across_shards_when_no_shard_covers_them(self):
+        decrement_stock({self.product.pk: 5})
+        self.assertEqual(sum(self.shards()), 5)
+        self.assertEqual(current_available(self.product.pk), 5)
+        with self.assertRaises(InsufficientStock):
+            decrement_stock({self.product.pk: 6})
+        self.assertEqual(sum(self.shards()), 5)
+
+        # Checkouts leave Product.stock alone until the periodic refresh
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 10)
+        add_stock({self.product.pk: 3}, InventoryMovement.RESTOCK)
+        self.assertEqual(settle_movements(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 8)
+
+        self.assertEqual(rebalance_stock_shards(self.product.pk), 8)
+        self.assertEqual(self.shards(), [2, 2, 2, 2])
+        self.assertEqual(disable_stock_sharding(self.product.pk), 8)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock_shards, self.product.stock, self.shards()), (0, 8, []))
+        decrement_stock({self.product.pk: 8})
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 0)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ProductBatchTests(TestCase):
+    """Several product details in one request, from the detail cache"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Audio', slug='audio')
+        cls.products = [
+            Product.objects.create(
+                name=name, slug=name.lower(), description=name, category=category,
+                price=Decimal('25'), stock=5
+            )
+            for name in ('Speaker', 'Headset', 'Radio')
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_matches_detail_in_request_order(self):
+        response = self.client.get('/api/products/batch/', {'slugs': 'radio,speaker,gone,radio,headset'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['not_found'], ['gone'])
+        self.assertEqual(
+            response.json()['results'],
+            [self.client.get(f'/api/products/{slug}/').json() for slug in ('radio', 'speaker', 'headset')]
+        )
+
+    def test_misses_loaded_together_and_cached(self):
+        ids = ','.join(str(product.pk) for product in reversed(self.products))
+        # The id -> slug lookup, then the products with their images and latest reviews
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/products/batch/', {'ids': f'{ids},0'})
+        self.assertEqual([item['name'] for item in response.json()['results']], ['Radio', 'Headset', 'Speaker'])
+        self.assertEqual(response.json()['not_found'], [0])
+
+        with self.assertNumQueries(0):
+            cached = self.client.get('/api/products/batch/', {'slugs': 'speaker,radio', 'fields': 'name,price'})
+        self.assertEqual(cached.json()['results'], [
+            {'name': 'Speaker', 'price': '25.00'},
+            {'name': 'Radio', 'price': '25.00'},
+        ])
+
+    def test_rejects_bad_requests(self):
+        for params in ({}, {'ids': '1', 'slugs': 'radio'}, {'ids': '1,x'}, {'ids': ','.join(map(str, range(51)))}):
+            self.assertEqual(self.client.get('/api/products/batch/', params).status_code, 400)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class StockChangeVisibilityTests(TestCase):
+    """Stock writes reach incremental exports and cached product details"""
+
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Garden', slug='garden')
+        self.product = Product.objects.create(
+            name='Hose', slug='hose', description='Hose', category=category, price=Decimal('15'), stock=10
+        )
+        self.since = timezone.now()
+        self.backdate()
+
+    def backdate(self):
+        Product.objects.filter(pk=self.product.pk).update(updated_at=self.since - timedelta(days=1))
+
+    def exported_ids(self):
+        return [row['id'] for row in export_rows(updated_since=self.since)]
+
+    def detail_stock(self):
+        return self.client.get('/api/products/hose/').json()['stock']
+
+    def test_checkout_decrement(self):
+        self.assertEqual(self.detail_stock(), 10)
+        self.assertEqual(self.exported_ids(), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            decrement_stock({self.product.pk: 4})
+        self.assertEqual(self.exported_ids(), [self.product.pk])
+        self.assertEqual(self.detail_stock(), 6)
+
+    def test_settled_restock(self):
+        self.assertEqual(self.detail_stock(), 10)
+        add_stock({self.product.pk: 5}, InventoryMovement.RESTOCK)
+        # Appending to the ledger leaves the row alone until settlement
+        self.assertEqual(self.exported_ids(), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(settle_movements(), 1)
+        self.assertEqual(self.exported_ids(), [self.product.pk])
+        self.assertEqual(self.detail_stock(), 15)
+
+    def test_sharded_stock_refresh(self):
+        enable_stock_sharding(self.product.pk, 2)
+        self.backdate()
+        self.assertEqual(self.detail_stock(), 10)
+        decrement_stock({self.product.pk: 3})
+        # Only the shards moved so far
+        self.assertEqual(self.exported_ids(), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(refresh_sharded_stock(), 1)
+        self.assertEqual(self.exported_ids(), [self.product.pk])
+        self.assertEqual(self.detail_stock(), 7)
+
+
+class ProductImporterSlugTests(TestCase):
+    """Only explicit slugs update existing products"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Lighting', slug='lighting')
+        cls.lamp = Product.objects.create(
+            name='Lamp', slug='lamp', description='Original', category=cls.category, price=Decimal('30'), stock=4
+        )
+
+    def run_import(self, lines):
+        csv_file = io.StringIO('name,slug,category,price,stock\n' + '\n'.join(lines) + '\n')
+        return ProductImporter(chunk_size=100).run(csv_file, 'csv')
+
+    def test_derived_slug_never_overwrites_an_existing_product(self):
+        result = self.run_import(['Lamp,,lighting,12,1'])
+        self.assertEqual((result['imported'], result['failed']), (1, 0))
+        self.lamp.refresh_from_db()
+        self.assertEqual((self.lamp.price, self.lamp.description), (Decimal('30'), 'Original'))
+        self.assertEqual(Product.objects.get(slug='lamp-2').price, Decimal('12'))
+
+    def test_explicit_slug_updates_the_product_but_not_its_stock(self):
+        self.assertEqual(self.run_import(['Desk lamp,lamp,lighting,25,8'])['imported'], 1)
+        self.lamp.refresh_from_db()
+        self.assertEqual((self.lamp.name, self.lamp.price, self.lamp.stock), ('Desk lamp', Decimal('25'), 4))
+
+    def test_upsert_leaves_held_and_sharded_stock_alone(self):
+        Product.objects.filter(pk=self.lamp.pk).update(reserved_stock=3)
+        result = self.run_import(['Desk lamp,lamp,lighting,25,0'])
+        self.assertEqual((result['imported'], result['failed']), (1, 0))
+        self.assertEqual(current_available(self.lamp.pk), 1)
+
+        enable_stock_sharding(self.lamp.pk, 2)
+        self.run_import(['Desk lamp,lamp,lighting,20,9'])
+        refresh_sharded_stock([self.lamp.pk])
+        self.lamp.refresh_from_db()
+        self.assertEqual((self.lamp.price, self.lamp.stock), (Decimal('20'), 4))
+
+    def test_slugs_in_one_chunk_never_collide(self):
+        result = self.run_import([
+            'Bulb,,lighting,2,1',
+            'Bulb,,lighting,3,1',
+            'Bulb LED,bulb-2,lighting,4,1',
+            'Bulb LED,bulb-2,lighting,5,1',
+        ])
+        self.assertEqual((result['imported'], result['failed']), (4, 0))
+        self.assertEqual(
+            dict(Product.objects.filter(slug__startswith='bulb').values_list('slug', 'price')),
+            {'bulb': Decimal('2'), 'bulb-3': Decimal('3'), 'bulb-2': Decimal('5')}
+        )
+
+
+class ProductExportTests(TestCase):
+    """Incremental exports by updated_since"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.since = timezone.now()
+        cls.category = Category.objects.create(name='Kitchen', slug='kitchen')
+        Category.objects.filter(pk=cls.category.pk).update(updated_at=cls.since - timedelta(days=1))
+        cls.products = [
+            Product.objects.create(
+                name=name, slug=name.lower(), description=name, category=cls.category, price=Decimal('5'), stock=1
+            )
+            for name in ('Pan', 'Pot')
+        ]
+        Product.objects.update(updated_at=cls.since - timedelta(days=1))
+
+    def exported(self):
+        return [(row['slug'], row['category_name']) for row in export_rows(updated_since=self.since)]
+
+    def test_only_changed_products(self):
+        self.assertEqual(self.exported(), [])
+        Product.objects.filter(slug='pot').update(price=Decimal('6'), updated_at=timezone.now())
+        self.assertEqual(self.exported(), [('pot', 'Kitchen')])
+        self.assertEqual(len(list(export_rows())), 2)
+
+    def test_category_rename_exports_its_products(self):
+        self.category.name = 'Cookware'
+        self.category.save()
+        self.assertEqual(self.exported(), [('pan', 'Cookware'), ('pot', 'Cookware')])
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class FeaturedFeedTests(TestCase):
+    """The featured endpoint serves the same bytes whoever renders them"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Deals', slug='deals')
+        for index in range(3):
+            Product.objects.create(
+                name=f'Deal {index}', slug=f'deal-{index}', description='Deal', category=category,
+                price=Decimal('10'), stock=2, is_featured=True, image=f'products/deal-{index}.jpg'
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_fallback_while_another_request_warms_the_feed(self):
+        # A warm-up that never finishes
+        cache.add(FEATURED_FEED_LOCK_KEY, 1, 30)
+        with mock.patch.object(FeaturedProductsView, 'feed_wait_timeout', 0.1):
+            fallback = self.client.get('/api/products/featured/')
+        self.assertEqual(fallback.status_code, 200)
+        self.assertEqual(fallback.json()['results'][0]['image'], '/media/products/deal-2.jpg')
+
+        cache.clear()
+        warmed = self.client.get('/api/products/featured/')
+        self.assertEqual(fallback.content, warmed.content)
+        self.assertEqual(fallback['ETag'], warmed['ETag'])
+        self.assertEqual(self.client.get('/api/products/featured/', HTTP_IF_NONE_MATCH=warmed['ETag']).status_code, 304)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ProductAdminStockTests(TestCase):
+    """Admin stock edits become ledger movements, all or nothing"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Office', slug='office')
+        cls.product = Product.objects.create(
+            name='Stapler', slug='stapler', description='Stapler', category=cls.category,
+            price=Decimal('8'), stock=5, reserved_stock=3
+        )
+        cls.admin = User.objects.create_superuser(
+            email='staff@example.com', password=None, first_name='A', last_name='B'
+        )
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def change(self, **fields):
+        data = {
+            'name': 'Stapler', 'slug': 'stapler', 'category': self.category.pk, 'description': 'Stapler',
+            'price': '8.00', 'stock': 5, 'is_active': 'on',
+            'images-TOTAL_FORMS': 0, 'images-INITIAL_FORMS': 0,
+        }
+        data.update(fields)
+        return self.client.post(reverse('admin:products_product_change', args=[self.product.pk]), data)
+
+    def test_restock_is_appended_to_the_ledger(self):
+        self.assertEqual(self.change(stock=8).status_code, 302)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+        self.assertEqual(
+            list(self.product.inventory_movements.values_list('reason', 'delta', 'settled')),
+            [(InventoryMovement.RESTOCK, 3, False)]
+        )
+        self.assertEqual(current_available(self.product.pk), 5)
+
+    def test_change_form_rejects_reducing_held_stock(self):
+        response = self.change(name='Big stapler', stock=1)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Stock can be reduced by at most 2')
+        self.assertNotContains(response, 'changed successfully')
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.name, self.product.stock), ('Stapler', 5))
+
+    def test_changelist_edit_is_all_or_nothing(self):
+        response = self.client.post(reverse('admin:products_product_changelist'), {
+            'form-TOTAL_FORMS': 1, 'form-INITIAL_FORMS': 1, 'form-0-id': self.product.pk,
+            'form-0-price': '99.00', 'form-0-stock': 0, 'form-0-is_active': 'on', '_save': 'Save',
+        }, follow=True)
+        self.assertContains(response, 'Stock can be reduced by at most 2')
+        self.assertNotContains(response, 'changed successfully')
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.price, self.product.stock), (Decimal('8'), 5))
+        self.assertFalse(self.product.inventory_movements.exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHE, AUTOCOMPLETE_REDIS_URL=None)
+class ProductAutocompleteTests(TestCase):
+    """Prefix lookups follow catalog changes; each process builds its own index"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Phone cases', slug='phone-cases')
+        cls.product = Product.objects.create(
+            name='Apple iPhone 15 Case', slug='iphone-15-case', description='Case', category=cls.category,
+            price=Decimal('20'), stock=5
+        )
+
+    def setUp(self):
+        patcher = mock.patch.multiple(autocomplete, _index=None, _index_pid=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def lookup(self, query):
+        response = self.client.get(reverse('products:product_autocomplete'), {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_matches_word_prefixes_of_names(self):
+        product = {'id': self.product.pk, 'name': 'Apple iPhone 15 Case', 'slug': 'iphone-15-case'}
+        self.assertEqual(self.lookup('IPH')['products'], [product])
+        self.assertEqual(self.lookup('15 c')['products'], [product])
+        # Keys start at words, not inside them
+        self.assertEqual(self.lookup('phone c'), {
+            'products': [],
+            'categories': [{'id': self.category.pk, 'name': 'Phone cases', 'slug': 'phone-cases'}],
+        })
+        self.assertEqual(self.lookup('android'), {'products': [], 'categories': []})
+
+    def test_saved_products_are_applied_to_the_built_index(self):
+        self.assertEqual(self.lookup('pixel')['products'], [])
+        with self.captureOnCommitCallbacks(execute=True):
+            pixel = Product.objects.create(
+                name='Pixel case', slug='pixel-case', description='Case', category=self.category,
+                price=Decimal('15'), stock=5
+            )
+        self.assertEqual([item['id'] for item in self.lookup('pixel')['products']], [pixel.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.is_active = False
+            self.product.save()
+        self.assertEqual(self.lookup('iphone')['products'], [])
+
+    def test_forked_process_builds_its_own_index(self):
+        parent_index = autocomplete.get_index()
+        self.assertIs(autocomplete.get_index(), parent_index)
+        with mock.patch.object(autocomplete.os, 'getpid', return_value=-1):
+            self.assertIsNone(autocomplete.current_index())
+            child_index = autocomplete.get_index()
+            self.assertIsNot(child_index, parent_index)
+            self.assertIs(autocomplete.get_index(), child_index)
+
+
+class ReviewAggregateTests(TestCase):
+    """Review writes keep the stored rating aggregates equal to a full recount"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Audio', slug='audio')
+        cls.speaker, cls.headphones = [
+            Product.objects.create(
+                name=name, slug=name.lower(), description=name, category=category, price=Decimal('50'), stock=5
+            )
+            for name in ('Speaker', 'Headphones')
+        ]
+        cls.users = [
+            User.objects.create_user(email=f'listener{index}@example.com', first_name='A', last_name='B')
+            for index in range(3)
+        ]
+
+    def aggregates(self):
+        return list(
+            Product.objects.order_by('pk').values_list('rating_sum', 'review_count', 'average_rating')
+        )
+
+    def assertMatchesRecount(self):
+        stored = self.aggregates()
+        rebuild_rating_aggregates()
+        self.assertEqual(stored, self.aggregates())
+
+    def test_creates_updates_moves_and_deletes(self):
+        reviews = [
+            Review.objects.create(product=self.speaker, user=user, rating=rating, comment='Ok')
+            for user, rating in zip(self.users, (5, 4, 2))
+        ]
+        self.speaker.refresh_from_db()
+        self.assertEqual(
+            (self.speaker.rating_sum, self.speaker.review_count, self.speaker.average_rating), (11, 3, 3.7)
+        )
+        self.assertMatchesRecount()
+
+        reviews[2].rating = 5
+        reviews[2].save()
+        self.assertMatchesRecount()
+
+        reviews[1].product = self.headphones
+        reviews[1].save()
+        self.assertMatchesRecount()
+
+        reviews[0].delete()
+        self.assertMatchesRecount()
+        self.assertEqual(self.aggregates(), [(5, 1, 5.0), (4, 1, 4.0)])
+
+    @override_settings(CACHES=LOCMEM_CACHE)
+    def test_rebuild_command_invalidates_cached_reads(self):
+        Review.objects.create(product=self.speaker, user=self.users[0], rating=4, comment='Loud')
+        Product.objects.filter(pk=self.speaker.pk).update(review_count=7, rating_sum=30)
+        detail_url = reverse('products:product_detail', args=['speaker'])
+        for _ in range(2):
+            self.assertEqual(self.client.get(detail_url).json()['review_count'], 7)
+            listed = self.client.get(reverse('products:product_list')).json()['results']
+        self.assertEqual({row['slug']: row['review_count'] for row in listed}['speaker'], 7)
+
+        output = io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('rebuild_product_ratings', stdout=output)
+        self.assertIn('1 of them had drifted', output.getvalue())
+        self.assertEqual(self.client.get(detail_url).json()['review_count'], 1)
+        listed = self.client.get(reverse('products:product_list')).json()['results']
+        self.assertEqual({row['slug']: row['review_count'] for row in listed}['speaker'], 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class CategoryCountTests(TestCase):
+    """Category product counters follow product writes, through the cached category list"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.kitchen = Category.objects.create(name='Kitchen', slug='kitchen')
+        cls.bath = Category.objects.create(name='Bath', slug='bath')
+
+    def setUp(self):
+        cache.clear()
+
+    def listed_counts(self):
+        response = self.client.get(reverse('products:category_list'))
+        return {row['slug']: row['product_count'] for row in response.json()['results']}
+
+    def test_counters_follow_product_writes(self):
+        self.assertEqual(self.listed_counts(), {'kitchen': 0, 'bath': 0})
+        with self.captureOnCommitCallbacks(execute=True):
+            kettle, pan, _ = [
+                Product.objects.create(
+                    name=name, slug=name.lower(), description=name, category=self.kitchen,
+                    price=Decimal('30'), stock=5, is_active=is_active
+                )
+                for name, is_active in (('Kettle', True), ('Pan', True), ('Wok', False))
+            ]
+        self.assertEqual(self.listed_counts(), {'kitchen': 2, 'bath': 0})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            kettle.category = self.bath
+            kettle.save()
+            pan.is_active = False
+            pan.save()
+        self.assertEqual(self.listed_counts(), {'kitchen': 0, 'bath': 1})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            kettle.delete()
+        self.assertEqual(self.listed_counts(), {'kitchen': 0, 'bath': 0})
+
+        stored = list(Category.objects.order_by('pk').values_list('active_product_count', flat=True))
+        rebuild_category_counts()
+        self.assertEqual(stored, list(Category.objects.order_by('pk').values_list('active_product_count', flat=True)))
+
+    def test_reconcile_command_invalidates_the_cached_list(self):
+        Product.objects.create(
+            name='Kettle', slug='kettle', description='Kettle', category=self.kitchen, price=Decimal('30'), stock=5
+        )
+        Category.objects.filter(pk=self.kitchen.pk).update(active_product_count=9)
+        self.assertEqual(self.listed_counts(), {'kitchen': 9, 'bath': 0})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('reconcile_category_counts', stdout=io.StringIO())
+        self.assertEqual(self.listed_counts(), {'kitchen': 1, 'bath': 0})
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ProductSearchTests(TestCase):
+    """Ranked search over the stored search document"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.gaming = Category.objects.create(name='Gaming', slug='gaming')
+        cls.mouse, cls.hub, cls.pad = [
+            Product.objects.create(
+                name=name, slug=name.lower().replace(' ', '-'), description=description, category=cls.gaming,
+                price=Decimal('20'), stock=5
+            )
+            for name, description in (
+                ('Wireless Mouse', 'Quiet clicks'),
+                ('USB Hub', 'Four ports, room for a wireless mouse receiver'),
+                ('Desk Pad', 'Felt'),
+            )
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, query):
+        response = self.client.get(reverse('products:product_search'), {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [row['slug'] for row in response.json()['results']]
+
+    def cached_search(self, query):
+        # Tags first seen during a compute keep its result out of the cache
+        self.search(query)
+        return self.search(query)
+
+    def test_name_matches_rank_above_description_matches(self):
+        self.assertEqual(self.search('wireless mouse'), ['wireless-mouse', 'usb-hub'])
+
+    def test_category_rename_refreshes_documents_and_cached_results(self):
+        self.assertEqual(self.cached_search('esports'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.gaming.name = 'Esports'
+            self.gaming.save()
+        self.assertEqual(sorted(self.search('esports')), ['desk-pad', 'usb-hub', 'wireless-mouse'])
+
+    def test_edited_product_leaves_cached_results(self):
+        self.assertEqual(self.cached_search('felt'), ['desk-pad'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pad.description = 'Cork'
+            self.pad.save()
+        self.assertEqual(self.search('felt'), [])
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ProductKeysetPaginationTests(TestCase):
+    """Cursor pages walk the whole ordering exactly once, whatever is inserted meanwhile"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Paper', slug='paper')
+        # Repeated prices make the id tiebreaker matter
+        for index in range(25):
+            Product.objects.create(
+                name=f'Notebook {index}', slug=f'notebook-{index}', description='Notebook', category=cls.category,
+                price=Decimal(10 + index % 4), stock=5
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_pages_follow_the_ordering_with_inserts_in_between(self):
+        expected = list(Product.objects.order_by('price', 'id').values_list('slug', flat=True))
+        page = self.get(reverse('products:product_list'), {'pagination': 'cursor', 'ordering': 'price'})
+        self.assertEqual(page['count'], 25)
+        self.assertIsNone(page['previous'])
+        slugs = [row['slug'] for row in page['results']]
+
+        # Sorts before the cursor: an offset page would repeat a row
+        Product.objects.create(
+            name='Cheap notebook', slug='cheap-notebook', description='Notebook', category=self.category,
+            price=Decimal('1'), stock=5
+        )
+        pages = [page]
+        while page['next']:
+            page = self.get(page['next'])
+            pages.append(page)
+            slugs.extend(row['slug'] for row in page['results'])
+        self.assertEqual(slugs, expected)
+        self.assertEqual(len(pages), 3)
+
+        previous = self.get(pages[-1]['previous'])
+        self.assertEqual(previous['results'], pages[-2]['results'])
+
+    def test_count_can_be_skipped(self):
+        page = self.get(reverse('products:product_list'), {'pagination': 'cursor', 'count': 'false'})
+        self.assertNotIn('count', page)
+        self.assertEqual(len(page['results']), 10)
+
+    def test_tampered_cursor_is_not_found(self):
+        response = self.client.get(reverse('products:product_list'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_cursor_values_are_parsed_as_the_ordering_field(self):
+        for ordering, value in (
+            ('price', 'cheap'), ('-created_at', '2024-13-45T00:00:00'), ('name', None), ('price', {'a': 1}),
+        ):
+            token = json.dumps({'p': [value, 1], 'r': 0}).encode('utf-8')
+            cursor = base64.urlsafe_b64encode(token).decode('ascii')
+            with self.subTest(ordering=ordering, value=value):
+                response = self.client.get(reverse('products:product_list'), {'cursor': cursor, 'ordering': ordering})
+                self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ProductFacetTests(TestCase):
+    """Facet counts agree with the filtered catalog"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.shoes = Category.objects.create(name='Shoes', slug='shoes')
+        cls.bags = Category.objects.create(name='Bags', slug='bags')
+        rows = (
+            (cls.shoes, '24.99', 3, False, True),
+            (cls.shoes, '25.00', 0, True, True),
+            (cls.shoes, '99.99', 2, False, True),
+            (cls.bags, '250.00', 1, True, True),
+            (cls.bags, '5.00', 4, False, True),
+            (cls.bags, '60.00', 4, True, False),
+        )
+        for index, (category, price, stock, is_featured, is_active) in enumerate(rows):
+            Product.objects.create(
+                name=f'Item {index}', slug=f'item-{index}', description='Item', category=category,
+                price=Decimal(price), stock=stock, is_featured=is_featured, is_active=is_active
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def facets(self, **params):
+        response = self.client.get(reverse('products:product_facets'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_counts_every_dimension_in_one_pass(self):
+        facets = self.facets()
+        self.assertEqual(facets['total'], 5)
+        self.assertEqual(
+            [(row['slug'], row['count']) for row in facets['categories']], [('shoes', 3), ('bags', 2)]
+        )
+        self.assertEqual([row['count'] for row in facets['price_ranges']], [2, 1, 1, 0, 1])
+        self.assertEqual(facets['in_stock'], {'true': 4, 'false': 1})
+        self.assertEqual(facets['is_featured'], {'true': 2, 'false': 3})
+
+    def test_counts_follow_list_filters(self):
+        facets = self.facets(min_price='25', in_stock='true')
+        self.assertEqual(facets['total'], 2)
+        self.assertEqual(
+            [(row['slug'], row['count']) for row in facets['categories']], [('bags', 1), ('shoes', 1)]
+        )
+        self.assertEqual([row['count'] for row in facets['price_ranges']], [0, 0, 1, 0, 1])
+        self.assertEqual(facets['in_stock'], {'true': 2, 'false': 0})
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ProductDetailCacheTests(TestCase):
+    """Writes to a product, its reviews and its category move its cached detail to a new version"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Lamps', slug='lamps')
+        cls.product = Product.objects.create(
+            name='Desk lamp', slug='desk-lamp', description='Lamp', category=cls.category,
+            price=Decimal('35'), stock=5
+        )
+        cls.user = User.objects.create_user(email='reader2@example.com', first_name='A', last_name='B')
+
+    def setUp(self):
+        cache.clear()
+
+    def detail(self, slug='desk-lamp'):
+        return self.client.get(reverse('products:product_detail', args=[slug]))
+
+    def test_writes_invalidate_the_cached_detail(self):
+        self.assertEqual(self.detail().json()['review_count'], 0)
+        # Writes that bypass the signals stay invisible: the payload is cached
+        Product.objects.filter(pk=self.product.pk).update(description='Changed')
+        self.assertEqual(self.detail().json()['description'], 'Lamp')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(product=self.product, user=self.user, rating=4, comment='Bright')
+        payload = self.detail().json()
+        self.assertEqual((payload['review_count'], payload['description']), (1, 'Changed'))
+        self.assertEqual([review['comment'] for review in payload['reviews']], ['Bright'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.name = 'Lighting'
+            self.category.save()
+        self.assertEqual(self.detail().json()['category_name'], 'Lighting')
+
+    def test_renamed_slug_stops_serving_the_old_payload(self):
+        self.assertEqual(self.detail().status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.slug = 'reading-lamp'
+            self.product.save()
+        self.assertEqual(self.detail().status_code, 404)
+        self.assertEqual(self.detail('reading-lamp').json()['name'], 'Desk lamp')
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ConditionalGetTests(TestCase):
+    """Catalog reads answer 304 until a write moves their version"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Clocks', slug='clocks')
+        cls.product = Product.objects.create(
+            name='Wall clock', slug='wall-clock', description='Clock', category=cls.category,
+            price=Decimal('45'), stock=5
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def assertRevalidates(self, url, write):
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('Last-Modified', first)
+        not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], first['ETag'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            write()
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], first['ETag'])
+        return changed
+
+    def rename_product(self):
+        self.product.name = 'Kitchen clock'
+        self.product.save()
+
+    def test_product_detail(self):
+        changed = self.assertRevalidates(reverse('products:product_detail', args=['wall-clock']), self.rename_product)
+        self.assertEqual(changed.json()['name'], 'Kitchen clock')
+
+    def test_product_list(self):
+        changed = self.assertRevalidates(reverse('products:product_list'), self.rename_product)
+        self.assertEqual(changed.json()['results'][0]['name'], 'Kitchen clock')
+
+    def test_category_list(self):
+        def deactivate():
+            self.category.is_active = False
+            self.category.save()
+
+        changed = self.assertRevalidates(reverse('products:category_list'), deactivate)
+        self.assertEqual(changed.json()['results'], [])
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ImageDerivativeTests(TestCase):
+    """Thumbnails and WebP copies are generated and recorded for the current image"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        buffer = io.BytesIO()
+        Image.new('RGBA', (2000, 1000), (200, 30, 30, 128)).save(buffer, format='PNG')
+        category = Category.objects.create(name='Posters', slug='posters')
+        self.product = Product.objects.create(
+            name='Poster', slug='poster', description='Poster', category=category, price=Decimal('15'), stock=5,
+            image=SimpleUploadedFile('poster.png', buffer.getvalue(), content_type='image/png')
+        )
+
+    def test_variants_are_recorded_with_their_sizes(self):
+        generate_image_derivatives('products.Product', self.product.pk)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.thumbnail_width, self.product.thumbnail_height), (320, 160))
+        self.assertEqual((self.product.image_webp_width, self.product.image_webp_height), (1200, 600))
+        with self.product.thumbnail.open('rb') as thumbnail:
+            self.assertEqual(Image.open(thumbnail).format, 'JPEG')
+        with self.product.thumbnail_webp.open('rb') as thumbnail:
+            self.assertEqual(Image.open(thumbnail).format, 'WEBP')
+
+        payload = self.client.get(reverse('products:product_list')).json()['results'][0]
+        self.assertTrue(payload['thumbnail'].endswith(self.product.thumbnail.name))
+
+    def test_clearing_the_image_clears_its_variants(self):
+        generate_image_derivatives('products.Product', self.product.pk)
+        self.product.refresh_from_db()
+        self.product.image = None
+        self.product.save()
+        self.product.refresh_from_db()
+        self.assertFalse(self.product.thumbnail)
+        self.assertIsNone(self.product.image_webp_width)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ReviewListingTests(TestCase):
+    """Reviews are paged newest first by cursor; details embed only the latest"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Tea', slug='tea')
+        cls.product = Product.objects.create(
+            name='Green tea', slug='green-tea', description='Tea', category=category, price=Decimal('6'), stock=5
+        )
+        for index in range(12):
+            user = User.objects.create_user(email=f'drinker{index}@example.com', first_name='A', last_name='B')
+            Review.objects.create(product=cls.product, user=user, rating=1 + index % 5, comment=f'Cup {index}')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_pages_run_newest_first_without_counting(self):
+        expected = list(Review.objects.order_by('-created_at', '-id').values_list('comment', flat=True))
+        page = self.client.get(reverse('products:review_list', args=[self.product.pk])).json()
+        self.assertNotIn('count', page)
+        comments = [review['comment'] for review in page['results']]
+        self.assertEqual(page['results'][0]['user_email'], 'drinker11@example.com')
+
+        page = self.client.get(page['next']).json()
+        comments.extend(review['comment'] for review in page['results'])
+        self.assertIsNone(page['next'])
+        self.assertEqual(comments, expected)
+
+        counted = self.client.get(reverse('products:review_list', args=[self.product.pk]), {'count': 'true'})
+        self.assertEqual(counted.json()['count'], 12)
+
+    def test_detail_embeds_the_latest_reviews(self):
+        payload = self.client.get(reverse('products:product_detail', args=['green-tea'])).json()
+        self.assertEqual(
+            [review['comment'] for review in payload['reviews']], [f'Cup {index}' for index in range(11, 6, -1)]
+        )
+        self.assertEqual(payload['review_count'], 12)
+        self.assertTrue(payload['reviews_url'].endswith(reverse('products:review_list', args=[self.product.pk])))
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class RatingHistogramTests(TestCase):
+    """The per-star counters follow reviews written through the API"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Coffee', slug='coffee')
+        cls.product = Product.objects.create(
+            name='Espresso beans', slug='espresso-beans', description='Beans', category=category,
+            price=Decimal('14'), stock=5
+        )
+        cls.users = [
+            User.objects.create_user(email=f'barista{index}@example.com', first_name='A', last_name='B')
+            for index in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def histogram(self):
+        response = self.client.get(reverse('products:review_histogram', args=[self.product.pk]))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def review(self, user, rating):
+        client = APIClient()
+        client.force_authenticate(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(
+                reverse('products:review_list', args=[self.product.pk]),
+                {'product': self.product.pk, 'rating': rating, 'comment': 'Rich'}
+            )
+        self.assertEqual(response.status_code, 201)
+        return client, response.json()['id']
+
+    def test_counters_follow_review_writes(self):
+        self.review(self.users[0], 5)
+        self.review(self.users[1], 5)
+        client, review_id = self.review(self.users[2], 2)
+        self.assertEqual(self.histogram(), {
+            'product': self.product.pk,
+            'review_count': 3,
+            'average_rating': 4.0,
+            'histogram': {'1': 0, '2': 1, '3': 0, '4': 0, '5': 2},
+        })
+
+        with self.captureOnCommitCallbacks(execute=True):
+            client.patch(reverse('products:review_detail', args=[review_id]), {'rating': 3})
+        self.assertEqual(self.histogram()['histogram'], {'1': 0, '2': 0, '3': 1, '4': 0, '5': 2})
+        detail = self.client.get(reverse('products:product_detail', args=['espresso-beans'])).json()
+        self.assertEqual(detail['rating_histogram'], self.histogram()['histogram'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            client.delete(reverse('products:review_detail', args=[review_id]))
+        self.assertEqual(self.histogram()['histogram'], {'1': 0, '2': 0, '3': 0, '4': 0, '5': 2})
+
+    def test_unknown_product(self):
+        response = self.client.get(reverse('products:review_histogram', args=[self.product.pk + 1]))
+        self.assertEqual(response.status_code, 404)
+
+
+class CatalogIndexTests(TestCase):
+    """The partial catalog indexes exist with the columns and predicates of the list queries"""
+
+    def index_definitions(self, table):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s', [table])
+            return dict(cursor.fetchall())
+
+    def test_product_list_indexes_are_partial(self):
+        definitions = self.index_definitions(Product._meta.db_table)
+        expected = {
+            'products_active_created_idx': ('(created_at, id)', 'WHERE is_active'),
+            'products_active_price_idx': ('(price, id)', 'WHERE is_active'),
+            'products_active_name_idx': ('(name, id)', 'WHERE is_active'),
+            'products_cat_created_idx': ('(category_id, created_at, id)', 'WHERE is_active'),
+            'products_cat_price_idx': ('(category_id, price, id)', 'WHERE is_active'),
+            'products_in_stock_created_idx': ('(created_at, id)', 'WHERE (is_active AND (stock > 0))'),
+        }
+        for index_name, (columns, predicate) in expected.items():
+            with self.subTest(index_name):
+                self.assertIn(columns, definitions[index_name])
+                self.assertIn(predicate, definitions[index_name])
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class TaggedListCacheTests(TestCase):
+    """Cached list pages are dropped by writes to what they show, and only by those"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.fruit = Category.objects.create(name='Fruit', slug='fruit')
+        cls.bread = Category.objects.create(name='Bread', slug='bread')
+        cls.apple = Product.objects.create(
+            name='Apple', slug='apple', description='Apple', category=cls.fruit, price=Decimal('1'), stock=5
+        )
+        cls.loaf = Product.objects.create(
+            name='Loaf', slug='loaf', description='Loaf', category=cls.bread, price=Decimal('3'), stock=5
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def listed(self, category):
+        response = self.client.get(reverse('products:product_list'), {'category': category.pk})
+        return [row['slug'] for row in response.json()['results']]
+
+    def cached_listed(self, category):
+        # Tags first seen during a compute keep its result out of the cache
+        self.listed(category)
+        return self.listed(category)
+
+    def test_other_categories_keep_their_pages(self):
+        self.assertEqual(self.cached_listed(self.fruit), ['apple'])
+        # Invisible to the signals, so only a dropped entry would show it
+        Product.objects.filter(pk=self.apple.pk).update(name='Green apple', slug='green-apple')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.loaf.price = Decimal('4')
+            self.loaf.save()
+        self.assertEqual(self.listed(self.fruit), ['apple'])
+
+    def test_moves_update_both_categories(self):
+        self.assertEqual(self.cached_listed(self.fruit), ['apple'])
+        self.assertEqual(self.cached_listed(self.bread), ['loaf'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.apple.category = self.bread
+            self.apple.save()
+        self.assertEqual(self.listed(self.fruit), [])
+        self.assertEqual(sorted(self.listed(self.bread)), ['apple', 'loaf'])
+
+    def test_new_products_join_cached_pages(self):
+        self.assertEqual(self.cached_listed(self.fruit), ['apple'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(
+                name='Pear', slug='pear', description='Pear', category=self.fruit, price=Decimal('2'), stock=5
+            )
+        self.assertEqual(self.listed(self.fruit), ['pear', 'apple'])
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class SparseFieldsetTests(TestCase):
+    """?fields= and ?omit= trim product payloads, nested ones included"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Socks', slug='socks')
+        cls.product = Product.objects.create(
+            name='Wool socks', slug='wool-socks', description='Socks', category=category, price=Decimal('9'), stock=5
+        )
+        user = User.objects.create_user(email='walker@example.com', first_name='A', last_name='B')
+        Review.objects.create(product=cls.product, user=user, rating=5, comment='Warm')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_list_fields(self):
+        response = self.client.get(reverse('products:product_list'), {'fields': 'id,name'})
+        self.assertEqual(response.json()['results'], [{'id': self.product.pk, 'name': 'Wool socks'}])
+
+    def test_detail_fields_are_cut_from_the_cached_payload(self):
+        url = reverse('products:product_detail', args=['wool-socks'])
+        self.assertIn('description', self.client.get(url).json())
+        self.assertEqual(
+            self.client.get(url, {'fields': 'name,reviews.rating'}).json(),
+            {'name': 'Wool socks', 'reviews': [{'rating': 5}]}
+        )
+        omitted = self.client.get(url, {'omit': 'reviews,images,reviews_url'}).json()
+        self.assertNotIn('reviews', omitted)
+        self.assertEqual(omitted['review_count'], 1)
+
+
+class RelatedProductsTests(TestCase):
+    """The batched sparse computation agrees with counting pairs order by order"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Camping', slug='camping')
+        cls.products = [
+            Product.objects.create(
+                name=f'Gear {index}', slug=f'gear-{index}', description='Gear', category=category,
+                price=Decimal('10'), stock=5
+            )
+            for index in range(8)
+        ]
+        user = User.objects.create_user(email='camper@example.com', first_name='A', last_name='B')
+        address = dict(
+            shipping_full_name='A B', shipping_phone='123', shipping_address_line1='1 Street',
+            shipping_city='City', shipping_state='State', shipping_postal_code='000', shipping_country='NG'
+        )
+        generator = random.Random(20)
+        cls.baskets = []
+        for index in range(60):
+            status = 'cancelled' if index % 10 == 0 else 'delivered'
+            order = Order.objects.create(user=user, total=Decimal('0'), status=status, **address)
+            # Repeats put one product on two lines of an order
+            basket = [generator.choice(cls.products[:6]) for _ in range(generator.randint(1, 4))]
+            for product in basket:
+                OrderItem.objects.create(
+                    order=order, Product=product, product_name=product.name, price=product.price, quantity=1
+                )
+            if status != 'cancelled':
+                cls.baskets.append({product.pk for product in basket})
+
+    def expected_neighbours(self, k):
+        pairs = Counter()
+        for basket in self.baskets:
+            for first, second in combinations(sorted(basket), 2):
+                pairs[first, second] += 1
+                pairs[second, first] += 1
+        expected = {}
+        for (product_id, related_id), score in pairs.items():
+            expected.setdefault(product_id, []).append((-score, related_id))
+        return {
+            product_id: [(related_id, -score) for score, related_id in sorted(neighbours)[:k]]
+            for product_id, neighbours in expected.items()
+        }
+
+    def test_matches_brute_force_counts_across_batches(self):
+        # Small batches make the totals add up over several incidence matrices
+        written = rebuild_related_products(k=3, batch_size=7)
+        stored = {}
+        for product_id, related_id, score in RelatedProduct.objects.values_list('product', 'related', 'score'):
+            stored.setdefault(product_id, []).append((related_id, score))
+        self.assertEqual(stored, self.expected_neighbours(3))
+        self.assertEqual(written, sum(len(neighbours) for neighbours in stored.values()))
+
+    def test_endpoint_lists_neighbours_in_rank_order(self):
+        rebuild_related_products(k=3)
+        product = self.products[0]
+        response = self.client.get(reverse('products:related_products', args=[product.slug]))
+        self.assertEqual(len(response.json()), 3)
+        self.assertEqual(
+            [row['id'] for row in response.json()],
+            [related_id for related_id, _ in self.expected_neighbours(3)[product.pk]]
+        )
+        unbought = self.client.get(reverse('products:related_products', args=[self.products[7].slug]))
+        self.assertEqual(unbought.json(), [])
+        missing = self.client.get(reverse('products:related_products', args=['no-such-gear']))
+        self.assertEqual(missing.status_code, 404)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ConcurrentSettlementTests(TransactionTestCase):
+    """Settlers racing each other and new ledger rows fold every movement in exactly once"""
+    writers = 4
+    settlers = 2
+    restocks = 25
+
+    def setUp(self):
+        category = Category.objects.create(name='Warehouse', slug='warehouse')
+        self.product = Product.objects.create(
+            name='Crate', slug='crate', description='Crate', category=category, price=Decimal('5'), stock=10
+        )
+
+    def test_every_movement_is_settled_once(self):
+        barrier = threading.Barrier(self.writers + self.settlers)
+        writing = threading.Event()
+        writing.set()
+        errors = []
+
+        def write():
+            try:
+                barrier.wait()
+                for _ in range(self.restocks):
+                    add_stock({self.product.pk: 1}, InventoryMovement.RESTOCK, 'delivery')
+            except Exception as exc:  # reported after the run
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        def settle():
+            try:
+                barrier.wait()
+                while writing.is_set():
+                    settle_movements(batch_size=5)
+            except Exception as exc:  # reported after the run
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        writers = [threading.Thread(target=write) for _ in range(self.writers)]
+        settlers = [threading.Thread(target=settle) for _ in range(self.settlers)]
+        for thread in writers + settlers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        writing.clear()
+        for thread in settlers:
+            thread.join()
+        self.assertEqual(errors, [])
+
+        settle_movements()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 10 + self.writers * self.restocks)
+        self.assertFalse(InventoryMovement.objects.filter(settled=False).exists())
+        self.assertEqual(current_available(self.product.pk), self.product.stock)
@@ -4,12 +4,19 @@ from .views import (
     CategoryDetailView,
     ProductListCreateView,
     ProductDetailView,
+    ProductBatchView,
     ProductSearchView,
+    ProductAutocompleteView,
+    ProductFacetsView,
     FeaturedProductsView,
+    RelatedProductsView,
     ProductImageUploadView,
     ReviewListCreateView,
+    ReviewHistogramView,
     ReviewDetailView
 )
+from .import_views import ProductImportView
+from .export_views import ProductExportView
 
 
 app_name = 'products'
@@ -24,12 +31,19 @@ urlpatterns = [
     path('', ProductListCreateView.as_view(), name='product_list'),
     path('featured/', FeaturedProductsView.as_view(), name='featured_products'),
     path('search/', ProductSearchView.as_view(), name='product_search'),
+    path('autocomplete/', ProductAutocompleteView.as_view(), name='product_autocomplete'),
+    path('facets/', ProductFacetsView.as_view(), name='product_facets'),
+    path('import/', ProductImportView.as_view(), name='product_import'),
+    path('export/', ProductExportView.as_view(), name='product_export'),
+    path('batch/', ProductBatchView.as_view(), name='product_batch'),
     path('<slug:slug>/', ProductDetailView.as_view(), name='product_detail'),
+    path('<slug:slug>/related/', RelatedProductsView.as_view(), name='related_products'),
     
     # Product image upload
     path('<int:product_id>/images/', ProductImageUploadView.as_view(), name='product_image_upload'),
     
     # Review endpoints
     path('<int:product_id>/reviews/', ReviewListCreateView.as_view(), name='review_list'),
+    path('<int:product_id>/reviews/histogram/', ReviewHistogramView.as_view(), name='review_histogram'),
     path('reviews/<int:pk>/', ReviewDetailView.as_view(), name='review_detail')
 ]
\ No newline at end of file
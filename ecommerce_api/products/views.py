@@ -1,32 +1,79 @@
+import hashlib
+import time
+from django.http import HttpResponse
 from django.shortcuts import render
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from rest_framework import generics, filters, permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
 from django.core.cache import cache
-from django.db.models import Q, Avg
+from django.db.models import Q, Avg, Prefetch
 from users.permissions import IsAdmin
-from .models import Category, Product, ProductImage, Review
+from .autocomplete import CATEGORY, PRODUCT, get_index
+from .caching import (
+    CATEGORY_LIST_TIMEOUT,
+    CATEGORY_LIST_VERSION_KEY,
+    PRODUCT_DETAIL_TIMEOUT,
+    PRODUCT_LIST_VERSION_KEY,
+    PRODUCTS_TAG,
+    category_tag,
+    get_many_or_recompute,
+    get_or_compute_tagged,
+    get_or_recompute,
+    get_version,
+    list_cache_key,
+    product_detail_key,
+    product_list_tags,
+    product_version,
+    product_versions,
+    tagged_cache_key
+)
+from .facets import compute_facets
+from .feeds import FEATURED_FEED_LOCK_KEY, build_featured_feed, featured_feed_key, render_featured_feed
+from .fieldsets import SparseQuerysetMixin, request_fieldset, trim_representation
+from .filters import ProductFilter
+from .mixins import ConditionalGetMixin
+from .models import RATING_HISTOGRAM_FIELDS, Category, Product, ProductImage, Review
+from .pagination import KeysetPagination, ReviewPagination
+from .rows import RowListMixin
+from .search import search_products
 from .serializers import (
     CategorySerializer,
     ProductListSerializer,
     ProductDetailSerializer,
     ProductCreateUpdateSerializer,
     ProductImageSerializer,
-    ReviewSerializer
+    ReviewSerializer,
+    LATEST_REVIEWS_COUNT,
+    latest_reviews_queryset
 )
 
 
-class CategoryListCreateView(generics.ListCreateAPIView):
+class CategoryListCreateView(ConditionalGetMixin, generics.ListCreateAPIView):
     """List all categories or create a new category"""
     queryset = Category.objects.filter(is_active=True)
     serializer_class = CategorySerializer
+    etag_prefix = 'categories'
+    
+    def get_cache_version(self, request, *args, **kwargs):
+        return get_version(CATEGORY_LIST_VERSION_KEY)
     
     def get_permissions(self):
         if self.request.method == 'POST':
             return [IsAdmin()]
         return [permissions.AllowAny()]
     
+    def list(self, request, *args, **kwargs):
+        cache_key = list_cache_key('category_list', get_version(CATEGORY_LIST_VERSION_KEY), request)
+        data = get_or_recompute(
+            cache_key,
+            lambda: super(CategoryListCreateView, self).list(request, *args, **kwargs).data,
+            CATEGORY_LIST_TIMEOUT
+        )
+        return Response(data)
+    
     
 class CategoryDetailView(generics.RetrieveUpdateDestroyAPIView):
     """Retrieve update or delete a category"""
@@ -40,14 +87,21 @@ class CategoryDetailView(generics.RetrieveUpdateDestroyAPIView):
         return [permissions.AllowAny()]
     
     
-class ProductListCreateView(generics.ListCreateAPIView):
+class ProductListCreateView(ConditionalGetMixin, SparseQuerysetMixin, RowListMixin, generics.ListCreateAPIView):
     """List all products or create a new product"""
     queryset = Product.objects.filter(is_active=True).select_related('category')
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['category', 'is_featured']
+    filterset_class = ProductFilter
     search_fields = ['name', 'description']
     ordering_fields = ['price', 'created_at', 'name']
     ordering = ['-created_at']
+    pagination_class = KeysetPagination
+    etag_prefix = 'products'
+    # Read for cache tags and keyset cursors whatever fields are requested
+    fieldset_columns = ('category', 'created_at', 'price', 'name')
+    
+    def get_cache_version(self, request, *args, **kwargs):
+        return get_version(PRODUCT_LIST_VERSION_KEY)
     
     def get_serializer_class(self):
         if self.request.method == 'POST':
@@ -59,30 +113,46 @@ class ProductListCreateView(generics.ListCreateAPIView):
             return [IsAdmin()]
         return [permissions.AllowAny()]
     
-    def get_queryset(self):
-        queryset = super().get_queryset()
-        
-        # Filter by price range
-        
-        min_price = self.request.query_params.get('min_price')
-        max_price = self.request.query_params.get('max_price')
+    def get_scope_tag(self, request):
+        """Lists filtered to one category only change with that category's products"""
+        categories = request.query_params.getlist('category')
+        if len(categories) == 1 and categories[0].isdigit():
+            return category_tag(categories[0])
+        return PRODUCTS_TAG
+    
+    def paginate_queryset(self, queryset):
+        self.page_rows = super().paginate_queryset(queryset)
+        return self.page_rows
+    
+    def list(self, request, *args, **kwargs):
+        def build():
+            data = super(ProductListCreateView, self).list(request, *args, **kwargs).data
+            return data, product_list_tags(self.page_rows, self.get_scope_tag(request))
         
-        if min_price:
-            queryset = queryset.filter(price__gte=min_price)
-        if max_price:
-            queryset = queryset.filter(price__lte=max_price)
-            
-        # Filter by stock availability
-        in_stock = self.request.query_params.get('in_stock')
-        if in_stock and in_stock.lower() == 'True':
-            queryset = queryset.filter(stock__gt=0)
-        return queryset
+        data = get_or_compute_tagged(tagged_cache_key('product_list', request), build)
+        return Response(data)
     
 
-class ProductDetailView(generics.RetrieveUpdateDestroyAPIView):
+def product_detail_queryset():
+    """What ProductDetailSerializer reads, in three queries for any number of products"""
+    return Product.objects.all().select_related('category').prefetch_related(
+        'images',
+        Prefetch(
+            'reviews',
+            queryset=latest_reviews_queryset()[:LATEST_REVIEWS_COUNT],
+            to_attr='latest_reviews'
+        )
+    )
+
+
+class ProductDetailView(ConditionalGetMixin, generics.RetrieveUpdateDestroyAPIView):
     """Retrieve update or delete a product"""
-    queryset = Product.objects.all().select_related('category').prefetch_related('images', 'reviews')
+    queryset = product_detail_queryset()
     lookup_field = 'slug'
+    etag_prefix = 'product'
+    
+    def get_cache_version(self, request, *args, **kwargs):
+        return product_version(kwargs.get('slug'))
     
     def get_serializer_class(self):
         if self.request.method in ['PUT', 'PATCH']:
@@ -97,52 +167,245 @@ class ProductDetailView(generics.RetrieveUpdateDestroyAPIView):
     def retrieve(self, request, *args, **kwargs):
         """Overide to implement caching"""
         slug = kwargs.get('slug')
-        cache_key = f'product_{slug}'
+        # Writes to the product, its reviews, images or category bump the version
+        cache_key = product_detail_key(slug, product_version(slug))
+        
+        def build():
+            instance = self.get_object()
+            return dict(self.get_serializer(instance, sparse=False).data)
+        
+        data = get_or_recompute(cache_key, build, PRODUCT_DETAIL_TIMEOUT)
+        # The full payload is cached; sparse fieldsets are cut from it
+        return Response(trim_representation(data, *request_fieldset(request)))
+    
+    
+class ProductBatchView(APIView):
+    """
+    Product details for several products at once (?ids=1,2 or ?slugs=a,b),
+    in request order, served from the same cache entries as the detail view
+    """
+    permission_classes = [permissions.AllowAny]
+    max_products = 50
+    
+    def requested_products(self, request):
+        """[(requested value, slug or None)] without duplicates, or an error Response"""
+        ids, slugs = request.query_params.get('ids'), request.query_params.get('slugs')
+        if (ids is None) == (slugs is None):
+            return Response({'error': 'Pass either ids or slugs'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Try to get from cache
-        cached_data = cache.get(cache_key)
-        if cached_data:
-            return Response(cached_data)
+        values = [value.strip() for value in (ids or slugs).split(',') if value.strip()]
+        if ids is not None:
+            try:
+                values = [int(value) for value in values]
+            except ValueError:
+                return Response({'error': 'ids must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        values = list(dict.fromkeys(values))
+        if len(values) > self.max_products:
+            return Response(
+                {'error': f'At most {self.max_products} products can be requested at once'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        # If not cache, get from database
-        instance = self.get_object()
-        serializer = self.get_serializer(instance)
+        if ids is None:
+            return [(slug, slug) for slug in values]
+        # Detail entries are keyed by slug
+        slug_by_id = dict(Product.objects.filter(pk__in=values).values_list('pk', 'slug'))
+        return [(pk, slug_by_id.get(pk)) for pk in values]
+    
+    def get(self, request):
+        requested = self.requested_products(request)
+        if isinstance(requested, Response):
+            return requested
+        
+        versions = product_versions([slug for _, slug in requested if slug])
+        keys = {slug: product_detail_key(slug, version) for slug, version in versions.items()}
         
-        # Cache for 15 minutes
-        cache.set(cache_key, serializer.data, 60 * 15)
+        def build(missing_keys):
+            slugs = {key: slug for slug, key in keys.items()}
+            products = product_detail_queryset().in_bulk([slugs[key] for key in missing_keys], field_name='slug')
+            context = {'request': request, 'view': self}
+            return {
+                key: dict(ProductDetailSerializer(products[slugs[key]], context=context, sparse=False).data)
+                for key in missing_keys
+                if slugs[key] in products
+            }
         
-        return Response(serializer.data)
+        details = get_many_or_recompute(list(keys.values()), build, PRODUCT_DETAIL_TIMEOUT)
+        fieldset = request_fieldset(request)
+        results = []
+        not_found = []
+        for value, slug in requested:
+            data = details.get(keys.get(slug))
+            if data is None:
+                not_found.append(value)
+            else:
+                results.append(trim_representation(data, *fieldset))
+        return Response({'results': results, 'not_found': not_found})
     
 
-class ProductSearchView(APIView):
-    """Advanced product search"""
+class ProductSearchView(SparseQuerysetMixin, generics.ListAPIView):
+    """Ranked full-text product search"""
+    queryset = Product.objects.filter(is_active=True).select_related('category')
+    serializer_class = ProductListSerializer
     permission_classes = [permissions.AllowAny]
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = ProductFilter
+    fieldset_columns = ('category',)
     
-    def get(self, request):
-        query = request.query_params.get('q', '')
+    def paginate_queryset(self, queryset):
+        self.page_rows = super().paginate_queryset(queryset)
+        return self.page_rows
+    
+    def list(self, request, *args, **kwargs):
+        if not request.query_params.get('q', '').strip():
+            return Response(
+                {'error': 'Search query is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        def build():
+            data = super(ProductSearchView, self).list(request, *args, **kwargs).data
+            return data, product_list_tags(self.page_rows)
         
+        data = get_or_compute_tagged(tagged_cache_key('product_search', request), build)
+        return Response(data)
+    
+    def get_queryset(self):
+        query = self.request.query_params.get('q', '').strip()
+        return search_products(super().get_queryset(), query)
+    
+    
+class ProductAutocompleteView(APIView):
+    """Product and category name suggestions from the in-memory prefix index"""
+    permission_classes = [permissions.AllowAny]
+    default_limit = 8
+    max_limit = 20
+    
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
         if not query:
             return Response(
                 {'error': 'Search query is required'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-            
-        products = Product.objects.filter(
-            Q(name__icontains=query) |
-            Q(description__icontains=query) |
-            Q(category__name__icontains=query),
-            is_active=True
-        ).select_related('category')[:20]
+        try:
+            limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+        except ValueError:
+            limit = self.default_limit
+        
+        limit = max(limit, 1)
+        index = get_index()
+        return Response({
+            kind_name: [
+                {'id': pk, 'name': name, 'slug': slug}
+                for pk, name, slug in index.search(query, kind, limit)
+            ]
+            for kind_name, kind in (('products', PRODUCT), ('categories', CATEGORY))
+        })
+    
+    
+class ProductFacetsView(generics.GenericAPIView):
+    """Facet counts for the product catalog under the list filters"""
+    queryset = Product.objects.filter(is_active=True)
+    permission_classes = [permissions.AllowAny]
+    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    filterset_class = ProductFilter
+    search_fields = ['name', 'description']
+    cache_timeout = 60
+    
+    def get(self, request):
+        params = sorted(
+            (key, value)
+            for key in request.query_params
+            for value in request.query_params.getlist(key)
+        )
+        digest = hashlib.md5(repr(params).encode('utf-8')).hexdigest()
+        cache_key = f'product_facets_{digest}'
+        
+        data = cache.get(cache_key)
+        if data is None:
+            data = compute_facets(self.filter_queryset(self.get_queryset()))
+            cache.set(cache_key, data, self.cache_timeout)
+        
+        return Response(data)
+    
+    
+class FeaturedProductsView(APIView):
+    """List featured products from the pre-serialized feed"""
+    permission_classes = [permissions.AllowAny]
+    feed_lock_timeout = 30
+    feed_wait_timeout = 5
+    feed_poll_interval = 0.05
+    
+    def feed_page(self, page):
+        """
+        Warm the feed and return the page's entry, or None past the last
+        page. While another request holds the warm-up lock, wait for its
+        pages; if it fails or takes too long, render the same bytes without
+        caching them, so every response is one the feed could have served.
+        """
+        key = featured_feed_key(page)
+        if cache.add(FEATURED_FEED_LOCK_KEY, 1, self.feed_lock_timeout):
+            try:
+                build_featured_feed()
+            finally:
+                cache.delete(FEATURED_FEED_LOCK_KEY)
+            return cache.get(key)
         
-        serializer = ProductListSerializer(products, many=True)
-        return Response(serializer.data)
+        deadline = time.time() + self.feed_wait_timeout
+        while time.time() < deadline:
+            time.sleep(self.feed_poll_interval)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry
+            if cache.get(FEATURED_FEED_LOCK_KEY) is None:
+                break
+        entries, _ = render_featured_feed()
+        return entries.get(key)
     
+    def get(self, request, *args, **kwargs):
+        try:
+            page = int(request.query_params.get('page', 1))
+        except ValueError:
+            page = 0
+        if page < 1:
+            return Response({'detail': 'Invalid page.'}, status=status.HTTP_404_NOT_FOUND)
+        
+        # The feed is rebuilt in the background on writes, so this is one cache read
+        entry = cache.get(featured_feed_key(page))
+        if entry is None:
+            entry = self.feed_page(page)
+        if entry is None:
+            return Response({'detail': 'Invalid page.'}, status=status.HTTP_404_NOT_FOUND)
+        
+        response = get_conditional_response(
+            request, etag=entry['etag'], last_modified=entry['last_modified']
+        )
+        if response is None:
+            response = HttpResponse(entry['body'], content_type='application/json')
+        response['ETag'] = entry['etag']
+        response['Last-Modified'] = http_date(entry['last_modified'])
+        return response
     
-class FeaturedProductsView(generics.ListAPIView):
-    """List featured products"""
-    queryset = Product.objects.filter(is_active=True, is_featured=True).select_related('category')
+    
+class RelatedProductsView(RowListMixin, generics.ListAPIView):
+    """Products frequently bought together with a product"""
     serializer_class = ProductListSerializer
     permission_classes = [permissions.AllowAny]
+    pagination_class = None
+    
+    def get_queryset(self):
+        # One join through the (product, rank) index of the precomputed table
+        return Product.objects.filter(
+            is_active=True,
+            related_to__product__slug=self.kwargs['slug']
+        ).order_by('related_to__rank')
+    
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if not response.data and not Product.objects.filter(slug=kwargs['slug']).exists():
+            return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+        return response
     
     
 class ProductImageUploadView(APIView):
@@ -169,10 +432,11 @@ class ProductImageUploadView(APIView):
 class ReviewListCreateView(generics.ListCreateAPIView):
     """List reviews for a product or create a new review"""
     serializer_class = ReviewSerializer
+    pagination_class = ReviewPagination
         
     def get_queryset(self):
         product_id = self.kwargs.get('product_id')
-        return Review.objects.filter(product_id=product_id)
+        return Review.objects.filter(product_id=product_id).select_related('user')
         
     def get_permissions(self):
         if self.request.method == 'POST':
@@ -184,6 +448,31 @@ class ReviewListCreateView(generics.ListCreateAPIView):
         serializer.save(user=self.request.user, product_id=product_id)
             
             
+class ReviewHistogramView(APIView):
+    """Star rating distribution for a product, read from its counters"""
+    permission_classes = [permissions.AllowAny]
+    
+    def get(self, request, product_id):
+        fields = list(RATING_HISTOGRAM_FIELDS.values())
+        row = (
+            Product.objects.filter(pk=product_id)
+            .values('review_count', 'average_rating', *fields)
+            .first()
+        )
+        if row is None:
+            return Response(
+                {'error': 'Product not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        return Response({
+            'product': product_id,
+            'review_count': row['review_count'],
+            'average_rating': row['average_rating'],
+            'histogram': {str(rating): row[field] for rating, field in RATING_HISTOGRAM_FIELDS.items()},
+        })
+            
+            
 class ReviewDetailView(generics.RetrieveUpdateDestroyAPIView):
     """Retrieve, update or delete a review"""
     queryset = Review.objects.all()
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:46
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Build the indexes without blocking writes to large tables
+    atomic = False
+
+    dependencies = [
+        ('users', '0002_address'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='address',
+            index=models.Index(fields=['user', 'is_active'], name='addresses_user_active_idx'),
+        ),
+    ]
@@ -116,6 +116,9 @@ class Address(models.Model):
         db_table = 'addresses'
         ordering = ['-is_default', '-created_at']
         verbose_name_plural = 'Addresses'
+        indexes = [
+            models.Index(fields=['user', 'is_active'], name='addresses_user_active_idx'),
+        ]
         
     def __str__(self):
         return f"{self.full_name}-{self.address_line1}, {self.city}"